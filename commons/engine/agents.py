@@ -1,16 +1,39 @@
 # === Imports ===
 import logging
 import json
-from helpers import query_pinecone, call_llm_robust, create_mcp_message
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from helpers import query_pinecone, call_llm_robust, create_mcp_message, count_tokens, split_by_tokens
+from helpers import async_query_pinecone, async_call_llm_robust, priority_lane, span
+
+# Map-reduce thresholds for the Summarizer (override per call with 'max_input_tokens' / 'chunk_tokens').
+SUMMARIZER_MAX_INPUT_TOKENS = 12000
+SUMMARIZER_CHUNK_TOKENS = 4000
+SUMMARIZER_MAX_PARALLEL = 8
 
 # === 4.1. Context Librarian Agent (Upgraded) ===
+def _librarian_intent(mcp_message):
+    requested_intent = mcp_message['content'].get('intent_query')
+    if not requested_intent:
+        raise ValueError("Librarian requires 'intent_query' in the input content.")
+    return requested_intent
+
+def _librarian_content(results):
+    """Turns the blueprint search results into the Librarian's MCP content."""
+    if results:
+        match = results[0]
+        logging.info(f"[Librarian] Found blueprint '{match['id']}' (Score: {match['score']:.2f})")
+        blueprint_json = match['metadata']['blueprint_json']
+        return {"blueprint_json": blueprint_json}
+    logging.warning("[Librarian] No specific blueprint found. Returning default.")
+    return {"blueprint_json": json.dumps({"instruction": "Generate the content neutrally."})}
+
 def agent_context_librarian(mcp_message, client, index, embedding_model, namespace_context):
     """Retrieves the appropriate Semantic Blueprint from the Context Library."""
     logging.info("[Librarian] Activated. Analyzing intent...")
     try:
-        requested_intent = mcp_message['content'].get('intent_query')
-        if not requested_intent:
-            raise ValueError("Librarian requires 'intent_query' in the input content.")
+        requested_intent = _librarian_intent(mcp_message)
 
         results = query_pinecone(
             query_text=requested_intent,
@@ -21,22 +44,59 @@ def agent_context_librarian(mcp_message, client, index, embedding_model, namespa
             embedding_model=embedding_model
         )
 
-        if results:
-            match = results[0]
-            logging.info(f"[Librarian] Found blueprint '{match['id']}' (Score: {match['score']:.2f})")
-            blueprint_json = match['metadata']['blueprint_json']
-            content = {"blueprint_json": blueprint_json}
-        else:
-            logging.warning("[Librarian] No specific blueprint found. Returning default.")
-            content = {"blueprint_json": json.dumps({"instruction": "Generate the content neutrally."})}
-
-        return create_mcp_message("Librarian", content)
+        return create_mcp_message("Librarian", _librarian_content(results))
     except Exception as e:
         logging.error(f"[Librarian] An error occurred: {e}")
         raise e
 
 # === 4.2. Researcher Agent (UPGRADED for High-Fidelity RAG) ===
-from helpers import helper_sanitize_input # Add this new import at the top of the file
+from helpers import sanitize_many # UPGRADE: batch sanitizer (one compiled scan per chunk)
+
+def _researcher_topic(mcp_message):
+    topic = mcp_message['content'].get('topic_query')
+    if not topic:
+        raise ValueError("Researcher requires 'topic_query' in the input content.")
+    return topic
+
+def _researcher_sources(results):
+    """Sanitizes the retrieved chunks and collects their unique source documents."""
+    sanitized_texts = []
+    sources = set() # Use a set to store unique source documents
+    checked = sanitize_many([match['metadata']['text'] for match in results])
+    for match, clean_text in zip(results, checked):
+        if clean_text is None:
+            logging.warning("[Researcher] A retrieved chunk failed sanitization and was skipped.")
+            continue # Skip this tainted chunk
+        sanitized_texts.append(clean_text)
+        # Collect the source document name
+        if 'source' in match['metadata']:
+            sources.add(match['metadata']['source'])
+    return sanitized_texts, sources
+
+def _researcher_prompts(topic, sanitized_texts):
+    """Builds the citation-aware synthesis prompts."""
+    logging.info(f"[Researcher] Found {len(sanitized_texts)} relevant chunks. Synthesizing answer with citations...")
+
+    system_prompt = """You are an expert research synthesis AI. Your task is to provide a clear, factual answer to the user's topic based *only* on the provided source texts. After the answer, you MUST provide a "Sources" section listing the unique source document names you used."""
+
+    source_material = "\n\n---\n\n".join(sanitized_texts)
+    user_prompt = f"Topic: {topic}\n\nSources:\n{source_material}\n\n--- \nSynthesize your answer and list the source documents now."
+    return system_prompt, user_prompt
+
+def _researcher_output(findings, sources):
+    # We can also append the sources we found programmatically for robustness
+    final_output = f"{findings}\n\n**Sources:**\n" + "\n".join([f"- {s}" for s in sorted(list(sources))])
+    return create_mcp_message("Researcher", {"answer_with_sources": final_output})
+
+def _researcher_fallback(results, sanitized_texts):
+    """Returns the early-exit MCP message when there is nothing reliable to synthesize, else None."""
+    if not results:
+        logging.warning("[Researcher] No relevant information found.")
+        return create_mcp_message("Researcher", {"answer": "No data found on the topic.", "sources": []})
+    if not sanitized_texts:
+        logging.error("[Researcher] All retrieved chunks failed sanitization. Aborting.")
+        return create_mcp_message("Researcher", {"answer": "Could not generate a reliable answer as retrieved data was suspect.", "sources": []})
+    return None
 
 def agent_researcher(mcp_message, client, index, generation_model, embedding_model, namespace_knowledge):
     """
@@ -45,9 +105,7 @@ def agent_researcher(mcp_message, client, index, generation_model, embedding_mod
     """
     logging.info("[Researcher] Activated. Investigating topic with high fidelity...")
     try:
-        topic = mcp_message['content'].get('topic_query')
-        if not topic:
-            raise ValueError("Researcher requires 'topic_query' in the input content.")
+        topic = _researcher_topic(mcp_message)
 
         # 1. Retrieve Chunks from Vector DB
         results = query_pinecone(
@@ -59,48 +117,21 @@ def agent_researcher(mcp_message, client, index, generation_model, embedding_mod
             embedding_model=embedding_model
         )
 
-        if not results:
-            logging.warning("[Researcher] No relevant information found.")
-            return create_mcp_message("Researcher", {"answer": "No data found on the topic.", "sources": []})
-
         # 2. Sanitize and Prepare Source Texts
-        sanitized_texts = []
-        sources = set() # Use a set to store unique source documents
-        for match in results:
-            try:
-                # Sanitize text before use
-                clean_text = helper_sanitize_input(match['metadata']['text'])
-                sanitized_texts.append(clean_text)
-                # Collect the source document name
-                if 'source' in match['metadata']:
-                    sources.add(match['metadata']['source'])
-            except ValueError as e:
-                logging.warning(f"[Researcher] A retrieved chunk failed sanitization and was skipped. Reason: {e}")
-                continue # Skip this tainted chunk
-        
-        if not sanitized_texts:
-            logging.error("[Researcher] All retrieved chunks failed sanitization. Aborting.")
-            return create_mcp_message("Researcher", {"answer": "Could not generate a reliable answer as retrieved data was suspect.", "sources": []})
+        sanitized_texts, sources = _researcher_sources(results)
+        fallback = _researcher_fallback(results, sanitized_texts)
+        if fallback:
+            return fallback
 
         # 3. Synthesize with a Citation-Aware Prompt
-        logging.info(f"[Researcher] Found {len(sanitized_texts)} relevant chunks. Synthesizing answer with citations...")
-        
-        system_prompt = """You are an expert research synthesis AI. Your task is to provide a clear, factual answer to the user's topic based *only* on the provided source texts. After the answer, you MUST provide a "Sources" section listing the unique source document names you used."""
-        
-        source_material = "\n\n---\n\n".join(sanitized_texts)
-        user_prompt = f"Topic: {topic}\n\nSources:\n{source_material}\n\n--- \nSynthesize your answer and list the source documents now."
-
+        system_prompt, user_prompt = _researcher_prompts(topic, sanitized_texts)
         findings = call_llm_robust(
             system_prompt,
             user_prompt,
             client=client,
             generation_model=generation_model
         )
-        
-        # We can also append the sources we found programmatically for robustness
-        final_output = f"{findings}\n\n**Sources:**\n" + "\n".join([f"- {s}" for s in sorted(list(sources))])
-
-        return create_mcp_message("Researcher", {"answer_with_sources": final_output})
+        return _researcher_output(findings, sources)
 
     except Exception as e:
         logging.error(f"[Researcher] An error occurred: {e}")
@@ -110,46 +141,49 @@ def agent_researcher(mcp_message, client, index, generation_model, embedding_mod
 # FILE: commons/ch6/agents.py (UPGRADED agent_writer)
 # FILE: commons/ch7/agents.py (FINAL UPGRADED agent_writer)
 
+def _writer_prompts(mcp_message):
+    """Unpacks the Writer's structured inputs and builds its prompts."""
+    # --- FINAL UPGRADE: Unpack structured inputs from any source agent ---
+    blueprint_data = mcp_message['content'].get('blueprint')
+    facts_data = mcp_message['content'].get('facts')
+    previous_content = mcp_message['content'].get('previous_content')
+
+    blueprint_json_string = blueprint_data.get('blueprint_json') if isinstance(blueprint_data, dict) else blueprint_data
+
+    # FINAL ROBUST LOGIC for handling multiple data contracts
+    facts = None
+    if isinstance(facts_data, dict):
+        # Check for 'facts' (from original Researcher)
+        facts = facts_data.get('facts')
+        # Check for 'summary' (from Summarizer)
+        if facts is None:
+            facts = facts_data.get('summary')
+        # NEW: Check for 'answer_with_sources' (from Hi-Fi Researcher)
+        if facts is None:
+            facts = facts_data.get('answer_with_sources')
+    elif isinstance(facts_data, str):
+        facts = facts_data
+
+    if not blueprint_json_string or (not facts and not previous_content):
+        raise ValueError("Writer requires a blueprint and either 'facts' or 'previous_content'.")
+
+    if facts:
+        source_material = facts
+        source_label = "SOURCE MATERIAL"
+    else:
+        source_material = previous_content
+        source_label = "PREVIOUS CONTENT (For Rewriting)"
+
+    system_prompt = f"""You are an expert content generation AI. Your task is to generate or rewrite content based on the provided SOURCE MATERIAL, strictly following the rules in the SEMANTIC BLUEPRINT. The SOURCE MATERIAL may contain both a synthesized answer and a list of sources; ensure the final output is a single, cohesive piece of content."""
+
+    user_prompt = f"""--- SEMANTIC BLUEPRINT (JSON) ---\n{blueprint_json_string}\n\n--- SOURCE MATERIAL ({source_label}) ---\n{source_material}\n\nGenerate the final content now."""
+    return system_prompt, user_prompt
+
 def agent_writer(mcp_message, client, generation_model):
     """Combines research with a blueprint to generate the final output."""
     logging.info("[Writer] Activated. Applying blueprint to source material...")
     try:
-        # --- FINAL UPGRADE: Unpack structured inputs from any source agent ---
-        blueprint_data = mcp_message['content'].get('blueprint')
-        facts_data = mcp_message['content'].get('facts')
-        previous_content = mcp_message['content'].get('previous_content')
-
-        blueprint_json_string = blueprint_data.get('blueprint_json') if isinstance(blueprint_data, dict) else blueprint_data
-
-        # FINAL ROBUST LOGIC for handling multiple data contracts
-        facts = None
-        if isinstance(facts_data, dict):
-            # Check for 'facts' (from original Researcher)
-            facts = facts_data.get('facts')
-            # Check for 'summary' (from Summarizer)
-            if facts is None:
-                facts = facts_data.get('summary')
-            # NEW: Check for 'answer_with_sources' (from Hi-Fi Researcher)
-            if facts is None:
-                facts = facts_data.get('answer_with_sources')
-        elif isinstance(facts_data, str):
-            facts = facts_data
-
-        if not blueprint_json_string or (not facts and not previous_content):
-            raise ValueError("Writer requires a blueprint and either 'facts' or 'previous_content'.")
-
-        # ... (The rest of the agent function proceeds as before) ...
-        
-        if facts:
-            source_material = facts
-            source_label = "SOURCE MATERIAL"
-        else:
-            source_material = previous_content
-            source_label = "PREVIOUS CONTENT (For Rewriting)"
-
-        system_prompt = f"""You are an expert content generation AI. Your task is to generate or rewrite content based on the provided SOURCE MATERIAL, strictly following the rules in the SEMANTIC BLUEPRINT. The SOURCE MATERIAL may contain both a synthesized answer and a list of sources; ensure the final output is a single, cohesive piece of content."""
-        
-        user_prompt = f"""--- SEMANTIC BLUEPRINT (JSON) ---\n{blueprint_json_string}\n\n--- SOURCE MATERIAL ({source_label}) ---\n{source_material}\n\nGenerate the final content now."""
+        system_prompt, user_prompt = _writer_prompts(mcp_message)
 
         final_output = call_llm_robust(
             system_prompt,
@@ -158,50 +192,265 @@ def agent_writer(mcp_message, client, generation_model):
             generation_model=generation_model
         )
         return create_mcp_message("Writer", final_output)
-        
+
+    except Exception as e:
+        logging.error(f"[Writer] An error occurred: {e}")
+        raise e
+
+def agent_writer_stream(mcp_message, client, generation_model):
+    """
+    Streaming twin of agent_writer: yields text deltas as they are generated and
+    returns the final MCP message (use 'yield from' or catch StopIteration.value).
+    """
+    logging.info("[Writer] Activated (streaming). Applying blueprint to source material...")
+    try:
+        system_prompt, user_prompt = _writer_prompts(mcp_message)
+
+        parts = []
+        for delta in call_llm_robust(system_prompt, user_prompt, client=client, generation_model=generation_model, stream=True):
+            parts.append(delta)
+            yield delta
+        return create_mcp_message("Writer", "".join(parts).strip())
+
     except Exception as e:
         logging.error(f"[Writer] An error occurred: {e}")
         raise e
 
 # FILE: Chapter 6
 # === 4.4. Summarizer Agent (New for Context Reduction) ===
+def _summarizer_inputs(mcp_message):
+    """Unpacks the Summarizer's inputs (the text as a string) and its map-reduce limits."""
+    content = mcp_message['content']
+    text_to_summarize = content.get('text_to_summarize')
+    summary_objective = content.get('summary_objective')
+
+    if not text_to_summarize or not summary_objective:
+        raise ValueError("Summarizer requires 'text_to_summarize' and 'summary_objective' in the input content.")
+
+    limits = (
+        content.get('max_input_tokens') or SUMMARIZER_MAX_INPUT_TOKENS,
+        content.get('chunk_tokens') or SUMMARIZER_CHUNK_TOKENS,
+    )
+    return str(text_to_summarize), summary_objective, limits
+
+def _summarizer_prompts(summary_objective, text_to_summarize, part=None):
+    """Builds the Summarizer's prompts. 'part' = (i, n) marks one chunk of a longer text."""
+    # Define the prompts for the LLM
+    system_prompt = """You are an expert summarization AI. Your task is to reduce the provided text to its essential points, guided by the user's specific objective. The summary must be concise, accurate, and directly address the stated goal."""
+    label = f"TEXT TO SUMMARIZE (PART {part[0]} OF {part[1]})" if part else "TEXT TO SUMMARIZE"
+    user_prompt = f"""--- OBJECTIVE ---
+{summary_objective}
+
+--- {label} ---
+{text_to_summarize}
+--- END TEXT ---
+
+Generate the summary now."""
+    return system_prompt, user_prompt
+
+def _reduce_prompts(summary_objective, partial_summaries):
+    """Builds the prompts that merge partial summaries into the final one."""
+    system_prompt = """You are an expert summarization AI. You are given partial summaries of consecutive parts of one long text. Merge them into a single concise, accurate summary that directly addresses the user's objective, removing repetition."""
+    joined = "\n\n".join(f"[PART {i}]\n{summary}" for i, summary in enumerate(partial_summaries, 1))
+    user_prompt = f"""--- OBJECTIVE ---
+{summary_objective}
+
+--- PARTIAL SUMMARIES ---
+{joined}
+--- END PARTIAL SUMMARIES ---
+
+Generate the final summary now."""
+    return system_prompt, user_prompt
+
+def _level_stats(level, stage, inputs, outputs, model):
+    tokens_in = sum(count_tokens(text, model) for text in inputs)
+    tokens_out = sum(count_tokens(text, model) for text in outputs)
+    return {"level": level, "stage": stage, "calls": len(inputs), "tokens_in": tokens_in,
+            "tokens_out": tokens_out, "tokens_saved": max(0, tokens_in - tokens_out)}
+
+def _next_map_level(partials, level, chunk_tokens, max_input_tokens, model):
+    """
+    Returns the chunks for another map level, or None once the partials fit in one reduce call.
+    Also stops if a level failed to shrink the text, so a verbose model cannot loop forever.
+    """
+    if len(partials) <= 1 or level["tokens_out"] <= max_input_tokens or level["tokens_out"] >= level["tokens_in"]:
+        return None
+    return split_by_tokens("\n\n".join(partials), chunk_tokens, model)
+
+def _map_reduce_summary(text, objective, limits, client, generation_model):
+    """
+    Hierarchical summarization for inputs larger than max_input_tokens:
+    map (summarize each chunk in parallel) until the partials fit, then reduce them in one call.
+    Returns (summary, levels) where levels records the token savings of every level.
+    """
+    max_input_tokens, chunk_tokens = limits
+    chunks = split_by_tokens(text, chunk_tokens, generation_model)
+    levels = []
+    with ThreadPoolExecutor(max_workers=SUMMARIZER_MAX_PARALLEL) as pool:
+        while chunks:
+            logging.info(f"[Summarizer] Map level {len(levels) + 1}: {len(chunks)} chunks in parallel...")
+            with span("map_level", level=len(levels) + 1, chunks=len(chunks)):
+                futures = [
+                    pool.submit(contextvars.copy_context().run, call_llm_robust,
+                                *_summarizer_prompts(objective, chunk, part=(i, len(chunks))),
+                                client=client, generation_model=generation_model)
+                    for i, chunk in enumerate(chunks, 1)
+                ]
+                partials = [future.result() for future in futures]
+            levels.append(_level_stats(len(levels) + 1, "map", chunks, partials, generation_model))
+            chunks = _next_map_level(partials, levels[-1], chunk_tokens, max_input_tokens, generation_model)
+
+    if len(partials) == 1:
+        return partials[0], levels
+    system_prompt, user_prompt = _reduce_prompts(objective, partials)
+    with span("reduce", partials=len(partials)):
+        summary = call_llm_robust(system_prompt, user_prompt, client=client, generation_model=generation_model)
+    levels.append(_level_stats(len(levels) + 1, "reduce", partials, [summary], generation_model))
+    return summary, levels
+
 def agent_summarizer(mcp_message, client, generation_model):
     """
     Reduces a large text to a concise summary based on an objective.
     Acts as a gatekeeper to manage token counts and costs.
+    UPGRADE: Texts over max_input_tokens are summarized hierarchically (map-reduce, chunks in parallel);
+    the per-level token savings are returned in the message metadata.
     """
     logging.info("[Summarizer] Activated. Reducing context...")
     try:
-        # Unpack the inputs from the MCP message
-        text_to_summarize = mcp_message['content'].get('text_to_summarize')
-        summary_objective = mcp_message['content'].get('summary_objective')
+        text, objective, limits = _summarizer_inputs(mcp_message)
 
-        if not text_to_summarize or not summary_objective:
-            raise ValueError("Summarizer requires 'text_to_summarize' and 'summary_objective' in the input content.")
+        # Call the hardened LLM helper to perform the summarization
+        # (queued in the bulk lane, so planner calls go first under rate limiting)
+        with priority_lane("bulk"):
+            if count_tokens(text, generation_model) <= limits[0]:
+                system_prompt, user_prompt = _summarizer_prompts(objective, text)
+                summary = call_llm_robust(
+                    system_prompt,
+                    user_prompt,
+                    client=client,
+                    generation_model=generation_model
+                )
+                # Return the summary in the standard MCP format
+                return create_mcp_message("Summarizer", {"summary": summary})
 
-        # Define the prompts for the LLM
-        system_prompt = """You are an expert summarization AI. Your task is to reduce the provided text to its essential points, guided by the user's specific objective. The summary must be concise, accurate, and directly address the stated goal."""
-        user_prompt = f"""--- OBJECTIVE ---
-{summary_objective}
+            summary, levels = _map_reduce_summary(text, objective, limits, client, generation_model)
+        return create_mcp_message("Summarizer", {"summary": summary}, metadata={"summary_levels": levels})
+    except Exception as e:
+        logging.error(f"[Summarizer] An error occurred: {e}")
+        raise e
 
---- TEXT TO SUMMARIZE ---
-{text_to_summarize}
---- END TEXT ---
+# === 4.5. Async Agents (for the asyncio engine) ===
+# Same contracts and prompts as the agents above; they await the async helpers
+# so one event loop can serve many goals. 'client' must be an AsyncOpenAI client.
+async def async_agent_context_librarian(mcp_message, client, index, embedding_model, namespace_context):
+    """Async twin of agent_context_librarian."""
+    logging.info("[Librarian] Activated (async). Analyzing intent...")
+    try:
+        requested_intent = _librarian_intent(mcp_message)
+        results = await async_query_pinecone(
+            query_text=requested_intent,
+            namespace=namespace_context,
+            top_k=1,
+            index=index,
+            client=client,
+            embedding_model=embedding_model
+        )
+        return create_mcp_message("Librarian", _librarian_content(results))
+    except Exception as e:
+        logging.error(f"[Librarian] An error occurred: {e}")
+        raise e
 
-Generate the summary now."""
+async def async_agent_researcher(mcp_message, client, index, generation_model, embedding_model, namespace_knowledge):
+    """Async twin of agent_researcher."""
+    logging.info("[Researcher] Activated (async). Investigating topic with high fidelity...")
+    try:
+        topic = _researcher_topic(mcp_message)
+        results = await async_query_pinecone(
+            query_text=topic,
+            namespace=namespace_knowledge,
+            top_k=3,
+            index=index,
+            client=client,
+            embedding_model=embedding_model
+        )
 
-        # Call the hardened LLM helper to perform the summarization
-        summary = call_llm_robust(
+        sanitized_texts, sources = _researcher_sources(results)
+        fallback = _researcher_fallback(results, sanitized_texts)
+        if fallback:
+            return fallback
+
+        system_prompt, user_prompt = _researcher_prompts(topic, sanitized_texts)
+        findings = await async_call_llm_robust(
             system_prompt,
             user_prompt,
             client=client,
             generation_model=generation_model
         )
+        return _researcher_output(findings, sources)
+    except Exception as e:
+        logging.error(f"[Researcher] An error occurred: {e}")
+        raise e
 
-        # Return the summary in the standard MCP format
-        return create_mcp_message("Summarizer", {"summary": summary})
+async def async_agent_writer(mcp_message, client, generation_model):
+    """Async twin of agent_writer."""
+    logging.info("[Writer] Activated (async). Applying blueprint to source material...")
+    try:
+        system_prompt, user_prompt = _writer_prompts(mcp_message)
+        final_output = await async_call_llm_robust(
+            system_prompt,
+            user_prompt,
+            client=client,
+            generation_model=generation_model
+        )
+        return create_mcp_message("Writer", final_output)
+    except Exception as e:
+        logging.error(f"[Writer] An error occurred: {e}")
+        raise e
+
+async def _async_map_reduce_summary(text, objective, limits, client, generation_model):
+    """Async twin of _map_reduce_summary (each level's chunks are gathered concurrently)."""
+    max_input_tokens, chunk_tokens = limits
+    chunks = split_by_tokens(text, chunk_tokens, generation_model)
+    levels = []
+    while chunks:
+        logging.info(f"[Summarizer] Map level {len(levels) + 1}: {len(chunks)} chunks in parallel...")
+        with span("map_level", level=len(levels) + 1, chunks=len(chunks)):
+            partials = await asyncio.gather(*(
+                async_call_llm_robust(*_summarizer_prompts(objective, chunk, part=(i, len(chunks))),
+                                      client=client, generation_model=generation_model)
+                for i, chunk in enumerate(chunks, 1)
+            ))
+        levels.append(_level_stats(len(levels) + 1, "map", chunks, partials, generation_model))
+        chunks = _next_map_level(partials, levels[-1], chunk_tokens, max_input_tokens, generation_model)
+
+    if len(partials) == 1:
+        return partials[0], levels
+    system_prompt, user_prompt = _reduce_prompts(objective, partials)
+    with span("reduce", partials=len(partials)):
+        summary = await async_call_llm_robust(system_prompt, user_prompt, client=client, generation_model=generation_model)
+    levels.append(_level_stats(len(levels) + 1, "reduce", partials, [summary], generation_model))
+    return summary, levels
+
+async def async_agent_summarizer(mcp_message, client, generation_model):
+    """Async twin of agent_summarizer."""
+    logging.info("[Summarizer] Activated (async). Reducing context...")
+    try:
+        text, objective, limits = _summarizer_inputs(mcp_message)
+        with priority_lane("bulk"):
+            if count_tokens(text, generation_model) <= limits[0]:
+                system_prompt, user_prompt = _summarizer_prompts(objective, text)
+                summary = await async_call_llm_robust(
+                    system_prompt,
+                    user_prompt,
+                    client=client,
+                    generation_model=generation_model
+                )
+                return create_mcp_message("Summarizer", {"summary": summary})
+
+            summary, levels = await _async_map_reduce_summary(text, objective, limits, client, generation_model)
+        return create_mcp_message("Summarizer", {"summary": summary}, metadata={"summary_levels": levels})
     except Exception as e:
         logging.error(f"[Summarizer] An error occurred: {e}")
         raise e
-        
+
 logging.info("✅ Specialist Agents defined and fully upgraded.")
@@ -1,7 +1,10 @@
 # === Imports ===
 import logging
 import json
-from helpers import query_pinecone, call_llm_robust, create_mcp_message
+from helpers import query_pinecone, call_llm_robust, create_mcp_message, pack_context
+
+# Token budget for the Researcher's evidence block (override per call with 'token_budget').
+RESEARCHER_TOKEN_BUDGET = 6000
 
 # === 4.1. Context Librarian Agent ===
 def agent_context_librarian(mcp_message, client, index, embedding_model, namespace_context):
@@ -57,12 +60,14 @@ def agent_researcher(mcp_message, client, index, generation_model, embedding_mod
         if not results:
             return create_mcp_message("Researcher", {"facts": "No evidence found."})
 
-        context_text = "\n\n".join([f"SOURCE: {m['metadata'].get('source')}\nCONTENT: {m['metadata'].get('text')}" for m in results])
+        # UPGRADE: Pack the ranked evidence into a token budget instead of pasting all 15 chunks
+        token_budget = mcp_message['content'].get('token_budget') or RESEARCHER_TOKEN_BUDGET
+        context_text, packing = pack_context(results, token_budget, model=generation_model)
         system_prompt = "Synthesize evidence into a factual report. Cite sources. If data is missing, state it."
         user_prompt = f"Objective: {topic_query}\n\nEvidence:\n{context_text}"
 
         facts = call_llm_robust(system_prompt, user_prompt, client, generation_model)
-        return create_mcp_message("Researcher", {"facts": facts})
+        return create_mcp_message("Researcher", {"facts": facts}, metadata={"context_packing": packing})
     except Exception as e:
         logging.error(f"[Researcher] Error: {e}")
         raise e
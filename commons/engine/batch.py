@@ -0,0 +1,126 @@
+# batch.py
+# Batch goal runner for the Context Engine.
+
+# === Imports ===
+import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from engine import context_engine, ExecutionTrace
+
+# === 1. Shared Index Handle ===
+class SharedIndexProvider:
+    """
+    Wraps a Pinecone client so every goal in the batch reuses one Index handle per name.
+    context_engine only ever calls pc.Index(index_name), so it needs no changes.
+    """
+    def __init__(self, pc):
+        self._pc = pc
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def Index(self, index_name):
+        with self._lock:
+            if index_name not in self._indexes:
+                self._indexes[index_name] = self._pc.Index(index_name)
+            return self._indexes[index_name]
+
+# === 2. Run Summary ===
+def percentile(values, pct):
+    """Nearest-rank percentile (pct in 0-100). Returns 0.0 for an empty list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+def summarize_run(traces, wall_time):
+    """Aggregates a list of ExecutionTraces into run-level throughput, latency and token metrics."""
+    durations = [t.duration for t in traces]
+    succeeded = [t for t in traces if t.status == "Success"]
+    tokens_in = sum(step["tokens_in"] for t in traces for step in t.steps)
+    tokens_out = sum(step["tokens_out"] for t in traces for step in t.steps)
+    return {
+        "goals": len(traces),
+        "succeeded": len(succeeded),
+        "failed": len(traces) - len(succeeded),
+        "wall_time": wall_time,
+        "throughput_goals_per_sec": (len(traces) / wall_time) if wall_time > 0 else 0.0,
+        "latency_p50": percentile(durations, 50),
+        "latency_p95": percentile(durations, 95),
+        "latency_max": max(durations) if durations else 0.0,
+        "tokens_in": tokens_in,
+        "tokens_out": tokens_out,
+        "tokens_total": tokens_in + tokens_out,
+    }
+
+# === 3. The Batch Runner ===
+_EXHAUSTED = object()
+
+class BatchRun:
+    """
+    Iterating a BatchRun yields (goal, result, trace) tuples as each goal completes
+    (completion order, not input order). Once iteration ends, `summary` holds the run metrics.
+    """
+    def __init__(self, goals, config, client, pc, concurrency, step_concurrency):
+        self.goals = goals
+        self.config = dict(config)
+        if step_concurrency is not None:
+            self.config["max_concurrency"] = step_concurrency
+        self.client = client
+        self.pc = SharedIndexProvider(pc)
+        self.concurrency = max(1, concurrency)
+        self.traces = []
+        self.summary = None
+
+    def _run_one(self, goal):
+        try:
+            return context_engine(goal, client=self.client, pc=self.pc, **self.config)
+        except Exception as e:
+            # context_engine reports its own failures on the trace; this is a last-resort guard.
+            logging.error(f"[Batch] Goal crashed outside the engine: {e}")
+            trace = ExecutionTrace(goal)
+            trace.finalize(f"Crashed: {e}")
+            return None, trace
+
+    def __iter__(self):
+        start = time.perf_counter()
+        goals = iter(self.goals)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            # Submit lazily so a huge goal list never sits in memory as futures.
+            for goal in goals:
+                running[pool.submit(self._run_one, goal)] = goal
+                if len(running) >= self.concurrency:
+                    break
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    goal = running.pop(future)
+                    result, trace = future.result()
+                    self.traces.append(trace)
+                    # Refill before yielding so workers stay busy while the caller handles the result.
+                    next_goal = next(goals, _EXHAUSTED)
+                    if next_goal is not _EXHAUSTED:
+                        running[pool.submit(self._run_one, next_goal)] = next_goal
+                    yield goal, result, trace
+        self.summary = summarize_run(self.traces, time.perf_counter() - start)
+        logging.info(
+            f"[Batch] {self.summary['goals']} goals in {self.summary['wall_time']:.2f}s "
+            f"({self.summary['throughput_goals_per_sec']:.2f} goals/s, "
+            f"p50 {self.summary['latency_p50']:.2f}s, p95 {self.summary['latency_p95']:.2f}s)"
+        )
+
+def run_goals(goals, config, client, pc, concurrency=8, step_concurrency=None):
+    """
+    Runs many goals through context_engine with bounded concurrency.
+    All goals share the same OpenAI client and one Index handle per index name.
+
+    Usage:
+        batch = run_goals(goals, config, client, pc, concurrency=16)
+        for goal, result, trace in batch:
+            ...
+        print(batch.summary)
+    """
+    return BatchRun(goals, config, client, pc, concurrency, step_concurrency)
@@ -0,0 +1,434 @@
+# benchmark.py
+# Offline benchmark harness for the Context Engine: deterministic stand-ins for the
+# OpenAI and Pinecone clients, canned scenarios, and a runner reporting overhead and latency.
+
+# === Imports ===
+import hashlib
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import engine
+import helpers
+from engine import context_engine, set_plan_cache
+from helpers import helper_moderate_content, set_token_encoding, set_response_cache, set_embedding_cache
+from batch import SharedIndexProvider, summarize_run, percentile
+
+# === 1. Latency Distributions ===
+# A distribution is a callable taking a random.Random and returning seconds.
+def constant(ms):
+    return lambda rng: ms / 1000.0
+
+def uniform(low_ms, high_ms):
+    return lambda rng: rng.uniform(low_ms, high_ms) / 1000.0
+
+def lognormal(median_ms, sigma=0.5):
+    """Right-skewed latency, like real APIs: most calls near the median, a long tail."""
+    return lambda rng: rng.lognormvariate(math.log(median_ms), sigma) / 1000.0 if median_ms > 0 else 0.0
+
+# Per-operation latency profiles. "zero" isolates the engine's own overhead;
+# "realistic" approximates hosted APIs; "fast" keeps the same shape at 1/20 of the cost.
+LATENCY_PROFILES = {
+    "zero": {op: constant(0) for op in ("chat", "embedding", "moderation", "query", "upsert")},
+    "realistic": {
+        "chat": lognormal(900, 0.4),
+        "embedding": lognormal(120, 0.3),
+        "moderation": lognormal(150, 0.3),
+        "query": lognormal(40, 0.3),
+        "upsert": lognormal(60, 0.3),
+    },
+    "fast": {
+        "chat": lognormal(45, 0.4),
+        "embedding": lognormal(6, 0.3),
+        "moderation": lognormal(8, 0.3),
+        "query": lognormal(2, 0.3),
+        "upsert": lognormal(3, 0.3),
+    },
+}
+
+class _Latency:
+    """Samples and sleeps per-operation latency, and tallies calls and simulated time (thread-safe)."""
+    def __init__(self, profile, seed):
+        self.profile = LATENCY_PROFILES[profile] if isinstance(profile, str) else dict(profile)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = {}
+        self.seconds = {}
+
+    def sample(self, op):
+        with self._lock:
+            delay = self.profile.get(op, constant(0))(self._rng)
+            self.calls[op] = self.calls.get(op, 0) + 1
+            self.seconds[op] = self.seconds.get(op, 0.0) + delay
+        return delay
+
+    def wait(self, op):
+        delay = self.sample(op)
+        if delay > 0:
+            time.sleep(delay)
+
+# === 2. Fake OpenAI Client ===
+_VOCABULARY = (
+    "the agreement provider client data retention confidential obligations notice period termination "
+    "product launch creative professionals performance storage design value proposition messaging "
+    "brand voice tone clarity evidence source policy summary key points section clause party term"
+).split()
+
+def _digest(*parts):
+    return hashlib.sha256(json.dumps(parts, default=str).encode("utf-8")).hexdigest()
+
+def _words(seed, count):
+    rng = random.Random(seed)
+    return " ".join(rng.choice(_VOCABULARY) for _ in range(count))
+
+def _usage(prompt_words, completion_words):
+    # Roughly 4 tokens per 3 English words.
+    prompt_tokens, completion_tokens = prompt_words * 4 // 3, completion_words * 4 // 3
+    return types.SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                                 total_tokens=prompt_tokens + completion_tokens)
+
+class FakeOpenAI:
+    """
+    Stands in for openai.OpenAI: chat.completions.create (incl. stream=True), embeddings.create
+    and moderations.create. Responses are deterministic functions of the request.
+    Planner calls (json_mode with the goal as user message) return the canned plan for that goal.
+    """
+    def __init__(self, plans=None, profile="fast", seed=0, completion_words=120, embedding_dim=16, flagged_terms=()):
+        self.plans = dict(plans or {})
+        self.latency = _Latency(profile, seed)
+        self.completion_words = completion_words
+        self.embedding_dim = embedding_dim
+        self.flagged_terms = tuple(flagged_terms)
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self._chat))
+        self.embeddings = types.SimpleNamespace(create=self._embed)
+        self.moderations = types.SimpleNamespace(create=self._moderate)
+
+    def _chat(self, model, messages, response_format=None, stream=False, **kwargs):
+        prompt = "\n".join(message["content"] for message in messages)
+        if response_format and response_format.get("type") == "json_object":
+            goal = messages[-1]["content"]
+            content = json.dumps({"plan": self.plans.get(goal) or default_plan(goal)})
+        else:
+            content = _words(_digest(model, prompt), self.completion_words)
+        usage = _usage(len(prompt.split()), len(content.split()))
+        self.latency.wait("chat")
+        if stream:
+            return self._stream(content)
+        message = types.SimpleNamespace(content=content)
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)], usage=usage)
+
+    def _stream(self, content):
+        words = content.split(" ")
+        for i in range(0, len(words), 8):
+            delta = " ".join(words[i:i + 8]) + (" " if i + 8 < len(words) else "")
+            yield types.SimpleNamespace(choices=[types.SimpleNamespace(delta=types.SimpleNamespace(content=delta))])
+
+    def embed_text(self, text):
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return [digest[i % len(digest)] / 255.0 for i in range(self.embedding_dim)]
+
+    def _embed(self, input, model, **kwargs):
+        texts = [input] if isinstance(input, str) else list(input)
+        self.latency.wait("embedding")
+        data = [types.SimpleNamespace(index=i, embedding=self.embed_text(text)) for i, text in enumerate(texts)]
+        return types.SimpleNamespace(data=data, usage=_usage(sum(len(t.split()) for t in texts), 0))
+
+    def _moderate(self, input, **kwargs):
+        self.latency.wait("moderation")
+        flagged = any(term in str(input).lower() for term in self.flagged_terms)
+        categories = {"harassment": False, "hate": False, "violence": flagged}
+        scores = {name: (0.9 if value else 0.001) for name, value in categories.items()}
+        result = types.SimpleNamespace(flagged=flagged, categories=categories, category_scores=scores)
+        return types.SimpleNamespace(results=[result])
+
+# === 3. Fake Pinecone ===
+class FakeIndex:
+    """Stands in for a Pinecone Index: query returns deterministic matches from the namespace's records."""
+    def __init__(self, records, latency):
+        self.records = records
+        self.latency = latency
+        self._lock = threading.Lock()
+
+    def query(self, vector, namespace, top_k, include_metadata=True, **kwargs):
+        self.latency.wait("query")
+        records = self.records.get(namespace, [])
+        if not records:
+            return {"matches": []}
+        start = int(_digest(vector)[:8], 16) % len(records)
+        picked = [records[(start + i) % len(records)] for i in range(min(top_k, len(records)))]
+        return {"matches": [
+            {"id": record["id"], "score": round(0.95 - 0.05 * rank, 2), "metadata": record["metadata"]}
+            for rank, record in enumerate(picked)
+        ]}
+
+    def upsert(self, vectors, namespace, **kwargs):
+        self.latency.wait("upsert")
+        with self._lock:
+            self.records.setdefault(namespace, []).extend(
+                {"id": vector["id"], "metadata": vector.get("metadata", {})} for vector in vectors
+            )
+        return {"upserted_count": len(vectors)}
+
+    def delete(self, ids, namespace, **kwargs):
+        doomed = set(ids)
+        with self._lock:
+            self.records[namespace] = [r for r in self.records.get(namespace, []) if r["id"] not in doomed]
+
+class FakePinecone:
+    """Stands in for pinecone.Pinecone: Index(name) hands out one FakeIndex per name over shared records."""
+    def __init__(self, records=None, profile="fast", seed=1):
+        self.records = records if records is not None else build_corpus()
+        self.latency = _Latency(profile, seed)
+        self._indexes = {}
+
+    def Index(self, name):
+        if name not in self._indexes:
+            self._indexes[name] = FakeIndex(self.records, self.latency)
+        return self._indexes[name]
+
+# === 3.5. Offline Tokenizer ===
+# Split like cl100k_base's pre-tokenizer: a word takes at most one leading space, and a run of
+# whitespace before a word leaves its last space to the word. So text cut just before " word"
+# (see ingestion._safe_cut) tokenizes the same in pieces as whole.
+_PIECE = re.compile(r" ?\S+|\s+(?!\S)|\s+")
+
+class OfflineEncoding:
+    """
+    Stands in for a tiktoken encoding, which downloads its files on first use: each word (with
+    at most one leading space) and each whitespace run is one token, so decode(encode(t)) == t.
+    Counts run about 25% below cl100k_base on English text. Install with helpers.set_token_encoding.
+    """
+    name = "offline-words"
+
+    def __init__(self):
+        self._ids = {}
+        self._pieces = []
+        self._lock = threading.Lock()
+
+    def encode(self, text, **kwargs):
+        ids = []
+        for piece in _PIECE.findall(text):
+            token = self._ids.get(piece)
+            if token is None:
+                with self._lock:
+                    token = self._ids.setdefault(piece, len(self._pieces))
+                    if token == len(self._pieces):
+                        self._pieces.append(piece)
+            ids.append(token)
+        return ids
+
+    def encode_batch(self, texts, **kwargs):
+        return [self.encode(text) for text in texts]
+
+    def decode(self, tokens, **kwargs):
+        return "".join(self._pieces[token] for token in tokens)
+
+    def decode_batch(self, batch, **kwargs):
+        return [self.decode(tokens) for tokens in batch]
+
+# === 4. Scenarios ===
+BENCHMARK_CONFIG = {
+    "index_name": "genai-mas-mcp-ch3",
+    "generation_model": "gpt-5.1",
+    "embedding_model": "text-embedding-3-small",
+    "namespace_context": "ContextLibrary",
+    "namespace_knowledge": "KnowledgeStore",
+}
+
+_BLUEPRINTS = {
+    "legal_precise": {"scene_goal": "Answer precisely, citing clauses.", "style_guide": "Formal legal register."},
+    "client_faq": {"scene_goal": "Explain in plain language.", "style_guide": "Short, friendly, non-legalistic."},
+    "marketing_aspirational": {"scene_goal": "Inspire creative professionals.", "style_guide": "Confident, benefit-led."},
+    "persuasive_pitch": {"scene_goal": "Persuade the reader.", "style_guide": "Energetic, concrete, on-brand."},
+}
+
+_DOCUMENTS = [
+    "Non-Disclosure Agreement (NDA)", "Service Agreement v1", "Provider Inc. Privacy Policy",
+    "QuantumDrive Q-1 Spec Sheet", "ChronoTech Press Release", "Brand Tone and Voice Guide",
+]
+
+def build_corpus(chunks_per_document=8, chunk_words=250):
+    """Canned vector-store records: blueprints in ContextLibrary, document chunks in KnowledgeStore."""
+    return {
+        BENCHMARK_CONFIG["namespace_context"]: [
+            {"id": f"blueprint_{name}", "metadata": {"blueprint_json": json.dumps(blueprint), "text": name}}
+            for name, blueprint in _BLUEPRINTS.items()
+        ],
+        BENCHMARK_CONFIG["namespace_knowledge"]: [
+            {"id": f"{doc}_chunk_{n}", "metadata": {"text": f"{doc}. " + _words(_digest(doc, n), chunk_words), "source": f"{doc}.txt"}}
+            for doc in _DOCUMENTS for n in range(chunks_per_document)
+        ],
+    }
+
+def _research_then_summarize(topic, objective):
+    return [
+        {"step": 1, "agent": "Researcher", "input": {"topic_query": topic}},
+        {"step": 2, "agent": "Summarizer", "input": {"text_to_summarize": "$$STEP_1_OUTPUT$$", "summary_objective": objective}},
+    ]
+
+def _blueprint_and_research_then_write(intent, topic):
+    return [
+        {"step": 1, "agent": "Librarian", "input": {"intent_query": intent}},
+        {"step": 2, "agent": "Researcher", "input": {"topic_query": topic}},
+        {"step": 3, "agent": "Writer", "input": {"blueprint": "$$STEP_1_OUTPUT$$", "facts": "$$STEP_2_OUTPUT$$"}},
+    ]
+
+def default_plan(goal):
+    return _blueprint_and_research_then_write("neutral informative answer", goal)
+
+# Goals from the Chapter 8 (legal), Chapter 9 (marketing) and Chapter 10 (universal) notebooks, with the plans a planner would produce.
+SCENARIOS = {
+    "ch8_legal": {
+        "First, retrieve the content of the Non-Disclosure Agreement (NDA) from the knowledge base. Then, summarize its key points.":
+            _research_then_summarize("Non-Disclosure Agreement (NDA) content", "Summarize the key points of the NDA"),
+        "What are the key confidentiality obligations in the Service Agreement v1, and what is the termination notice period? Please cite your sources.":
+            _blueprint_and_research_then_write("precise legal answer with citations", "Service Agreement v1 confidentiality obligations and termination notice period"),
+        "First, summarize the Provider Inc. Privacy Policy. Then, using ONLY the information in that summary, draft a short, client-facing paragraph for a website FAQ that explains our data retention policy in simple, non-legalistic terms.":
+            _research_then_summarize("Provider Inc. Privacy Policy", "Summarize the data retention policy") + [
+                {"step": 3, "agent": "Librarian", "input": {"intent_query": "client-facing FAQ in plain language"}},
+                {"step": 4, "agent": "Writer", "input": {"blueprint": "$$STEP_3_OUTPUT$$", "facts": "$$STEP_2_OUTPUT$$"}},
+            ],
+    },
+    "ch9_marketing": {
+        "Summarize the key points of the QuantumDrive":
+            _research_then_summarize("QuantumDrive Q-1", "Summarize the key points of the QuantumDrive"),
+        "Analyze the ChronoTech press release and summarize their core product messaging and value proposition. Please cite your sources.":
+            _blueprint_and_research_then_write("competitive analysis with citations", "ChronoTech press release product messaging and value proposition"),
+        "Using the official product spec sheet, write a short marketing description for the new QuantumDrive Q-1. The description should be confident, aspirational, and focus on the benefits for creative professionals. Please cite your sources.":
+            _blueprint_and_research_then_write("confident aspirational marketing copy", "QuantumDrive Q-1 spec sheet benefits for creative professionals"),
+    },
+    "ch10_universal": {
+        "Write a persuasive pitch on our brand tone and voice guide":
+            _blueprint_and_research_then_write("persuasive pitch", "brand tone and voice guide"),
+        "First, retrieve the content of the Non-Disclosure Agreement (NDA) from the knowledge base. Then, summarize its key points.":
+            _research_then_summarize("Non-Disclosure Agreement (NDA) content", "Summarize the key points of the NDA"),
+        "Analyze the ChronoTech press release and summarize their core product messaging and value proposition. Please cite your sources.":
+            _blueprint_and_research_then_write("competitive analysis with citations", "ChronoTech press release product messaging and value proposition"),
+    },
+}
+
+# === 5. The Benchmark ===
+def _run_goal(goal, client, pc, config, moderation):
+    """Runs one goal the way the notebooks do (optional pre/post moderation). Returns (trace, moderation_seconds)."""
+    moderation_time = 0.0
+    if moderation:
+        start = time.perf_counter()
+        helper_moderate_content(text_to_moderate=goal, client=client)
+        moderation_time += time.perf_counter() - start
+    result, trace = context_engine(goal, client=client, pc=pc, **config)
+    if moderation and result:
+        start = time.perf_counter()
+        helper_moderate_content(text_to_moderate=json.dumps(result) if isinstance(result, (dict, list)) else str(result), client=client)
+        moderation_time += time.perf_counter() - start
+    return trace, moderation_time
+
+def _run_scenario(goals, plans, profile, repeats, concurrency, max_concurrency, moderation, seed):
+    client = FakeOpenAI(plans, profile=profile, seed=seed)
+    pc = FakePinecone(profile=profile, seed=seed + 1)
+    config = dict(BENCHMARK_CONFIG, max_concurrency=max_concurrency)
+    indexes = SharedIndexProvider(pc)
+    workload = [goal for _ in range(repeats) for goal in goals]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        runs = list(pool.map(lambda goal: _run_goal(goal, client, indexes, config, moderation), workload))
+    wall_time = time.perf_counter() - start
+    traces = [trace for trace, _ in runs]
+    api_calls = dict(client.latency.calls)
+    api_seconds = dict(client.latency.seconds)
+    for op, count in pc.latency.calls.items():
+        api_calls[op] = api_calls.get(op, 0) + count
+        api_seconds[op] = api_seconds.get(op, 0.0) + pc.latency.seconds[op]
+    return traces, wall_time, sum(m for _, m in runs), api_calls, api_seconds
+
+@contextmanager
+def _caches_uninstalled():
+    """Removes the installed response, embedding and plan caches for the duration of the block, then restores them."""
+    previous = (helpers._RESPONSE_CACHE, helpers._EMBEDDING_CACHE, engine._PLAN_CACHE)
+    set_response_cache(None)
+    set_embedding_cache(None)
+    set_plan_cache(None)
+    try:
+        yield
+    finally:
+        set_response_cache(previous[0])
+        set_embedding_cache(previous[1])
+        set_plan_cache(previous[2])
+
+def _stage_ms(traces):
+    """Mean self time per goal for each span kind (planner, embedding, vector_query, sanitize, llm, ...)."""
+    totals = {}
+    for trace in traces:
+        for step in trace.latency_breakdown():
+            for name, ms in step["by_span"].items():
+                totals[name] = totals.get(name, 0.0) + ms
+    return {name: round(ms / max(1, len(traces)), 3) for name, ms in sorted(totals.items(), key=lambda item: -item[1])}
+
+def _benchmark_scenario(report, name, plans, profile, repeats, concurrency, max_concurrency, moderation, seed):
+    """
+    Runs one scenario (zero-latency baseline, then the chosen profile) and adds its entry to the report.
+    The baseline runs with the caches uninstalled so it cannot warm them for the profiled pass.
+    """
+    goals = list(plans)
+    logging.info(f"[Benchmark] Scenario '{name}': {len(goals)} goals x {repeats} repeats...")
+    with _caches_uninstalled():
+        baseline, _, _, _, _ = _run_scenario(goals, plans, "zero", repeats, 1, max_concurrency, moderation, seed)
+    traces, wall_time, moderation_time, api_calls, api_seconds = _run_scenario(
+        goals, plans, profile, repeats, concurrency, max_concurrency, moderation, seed)
+    overhead = [t.duration * 1000 for t in baseline]
+    summary = summarize_run(traces, wall_time)
+    report["scenarios"][name] = {
+        "goals": summary["goals"],
+        "succeeded": summary["succeeded"],
+        "overhead_ms_p50": round(percentile(overhead, 50), 3),
+        "overhead_ms_p95": round(percentile(overhead, 95), 3),
+        "throughput_goals_per_sec": round(summary["throughput_goals_per_sec"], 3),
+        "latency_p50": round(summary["latency_p50"], 4),
+        "latency_p95": round(summary["latency_p95"], 4),
+        "stage_ms": _stage_ms(traces),
+        "moderation_ms": round(moderation_time * 1000 / max(1, len(traces)), 3),
+        "api_calls_per_goal": {op: round(n / max(1, len(traces)), 2) for op, n in sorted(api_calls.items())},
+        "api_ms_per_goal": {op: round(s * 1000 / max(1, len(traces)), 3) for op, s in sorted(api_seconds.items())},
+    }
+
+def run_benchmark(scenarios=None, profile="fast", repeats=3, concurrency=4, max_concurrency=4, moderation=True, seed=0, offline_tokenizer=True):
+    """
+    Runs every scenario twice: once with zero-latency stand-ins, which measures the engine's own
+    overhead per goal, and once with the chosen latency profile, which measures throughput and
+    per-stage latency. No API keys are needed. With offline_tokenizer=True (the default) token
+    counting uses OfflineEncoding for the run, so no network access is needed either; pass False
+    to count with tiktoken, which must be able to download (or find cached) its encoding files.
+
+    Usage:
+        report = run_benchmark(profile="fast", repeats=5)
+        print(format_report(report))
+    Installed caches, rate limiter and single-flight settings apply to the profiled pass as in production,
+    so their effect shows up too; the overhead baseline runs without the caches so it starts them cold.
+    """
+    scenarios = SCENARIOS if scenarios is None else scenarios
+    report = {"profile": profile if isinstance(profile, str) else "custom", "repeats": repeats,
+              "concurrency": concurrency, "max_concurrency": max_concurrency, "scenarios": {}}
+    previous_encoding = set_token_encoding(OfflineEncoding()) if offline_tokenizer else None
+    try:
+        for name, plans in scenarios.items():
+            _benchmark_scenario(report, name, plans, profile, repeats, concurrency, max_concurrency, moderation, seed)
+    finally:
+        if offline_tokenizer:
+            set_token_encoding(previous_encoding)
+    return report
+
+def format_report(report):
+    """Renders a run_benchmark report as a plain-text table."""
+    lines = [f"Profile: {report['profile']}  repeats: {report['repeats']}  concurrency: {report['concurrency']}  step concurrency: {report['max_concurrency']}",
+             f"{'scenario':<16}{'ok':>7}{'overhead p50':>14}{'overhead p95':>14}{'goals/s':>10}{'p50 s':>9}{'p95 s':>9}"]
+    for name, s in report["scenarios"].items():
+        lines.append(f"{name:<16}{s['succeeded']:>3}/{s['goals']:<3}{s['overhead_ms_p50']:>11.2f} ms{s['overhead_ms_p95']:>11.2f} ms"
+                     f"{s['throughput_goals_per_sec']:>10.2f}{s['latency_p50']:>9.3f}{s['latency_p95']:>9.3f}")
+        stages = ", ".join(f"{stage} {ms:.1f}" for stage, ms in s["stage_ms"].items())
+        lines.append(f"  stages (ms/goal): {stages}")
+    return "\n".join(lines)
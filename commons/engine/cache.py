@@ -0,0 +1,615 @@
+# cache.py
+# Response, embedding and plan caching for the Context Engine.
+
+# === Imports ===
+import copy
+import difflib
+import hashlib
+import json
+import logging
+import math
+import mmap
+import os
+import re
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+# === 1. Cache Keys ===
+def make_cache_key(*parts):
+    """
+    Builds a content-addressed key (SHA-256) from the parts of a request.
+    The parts are serialized as JSON so that ('a', 'bc') and ('ab', 'c') never collide.
+    """
+    payload = json.dumps(parts, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+# === 2. Disk Tiers ===
+class SQLiteCacheStore:
+    """Persists cache entries in a single SQLite file (shared safely across threads)."""
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def set(self, key, value, created_at):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at) VALUES (?, ?, ?)",
+                (key, value, created_at),
+            )
+            self._conn.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def evict(self, max_entries=None, ttl=None):
+        """Drops expired entries, then the oldest ones beyond max_entries."""
+        with self._lock:
+            if ttl is not None:
+                self._conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - ttl,))
+            if max_entries is not None:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key NOT IN "
+                    "(SELECT key FROM responses ORDER BY created_at DESC LIMIT ?)",
+                    (max_entries,),
+                )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+class DirectoryCacheStore:
+    """Persists cache entries as one JSON file per key, sharded by key prefix."""
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _file_for(self, key):
+        return os.path.join(self.path, key[:2], f"{key}.json")
+
+    def get(self, key):
+        try:
+            with open(self._file_for(key), "r", encoding="utf-8") as f:
+                record = json.load(f)
+            return record["value"], record["created_at"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def set(self, key, value, created_at):
+        file_path = self._file_for(key)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        # Write-then-rename so a crash never leaves a half-written entry behind.
+        tmp_path = f"{file_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"value": value, "created_at": created_at}, f, ensure_ascii=False)
+        os.replace(tmp_path, file_path)
+
+    def delete(self, key):
+        try:
+            os.remove(self._file_for(key))
+        except OSError:
+            pass
+
+    def _entries(self):
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                if name.endswith(".json"):
+                    yield os.path.join(root, name)
+
+    def evict(self, max_entries=None, ttl=None):
+        """Drops expired entries, then the oldest ones beyond max_entries (by mtime)."""
+        entries = sorted(self._entries(), key=os.path.getmtime, reverse=True)
+        cutoff = time.time() - ttl if ttl is not None else None
+        for position, file_path in enumerate(entries):
+            too_old = cutoff is not None and os.path.getmtime(file_path) < cutoff
+            too_many = max_entries is not None and position >= max_entries
+            if too_old or too_many:
+                os.remove(file_path)
+
+    def clear(self):
+        for file_path in list(self._entries()):
+            os.remove(file_path)
+
+    def __len__(self):
+        return sum(1 for _ in self._entries())
+
+# === 3. The Response Cache ===
+# A full disk tier is evicted down to this fraction of max_disk_entries, so the (O(N log N))
+# eviction pass runs once per ~10% of max_disk_entries writes instead of on every write.
+DISK_LOW_WATER = 0.9
+
+class ResponseCache:
+    """
+    A two-tier cache for LLM responses: an in-memory LRU tier in front of an optional disk tier.
+    Entries expire after `ttl` seconds (None = never) and each tier is bounded by size.
+    The disk tier's size is tracked with a running count; it is only re-counted after an eviction.
+    """
+    def __init__(self, max_entries=1024, ttl=None, disk_path=None, disk_backend="sqlite", max_disk_entries=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk = None
+        self._disk_entries = 0
+        if disk_path:
+            if disk_backend == "sqlite":
+                self.disk = SQLiteCacheStore(disk_path)
+            elif disk_backend == "directory":
+                self.disk = DirectoryCacheStore(disk_path)
+            else:
+                raise ValueError(f"Unknown disk_backend '{disk_backend}'. Use 'sqlite' or 'directory'.")
+            self.disk.evict(max_entries=max_disk_entries, ttl=ttl)
+            if max_disk_entries is not None:
+                self._disk_entries = len(self.disk)
+        logging.info(f"ResponseCache initialized (memory: {max_entries} entries, disk: {disk_path or 'disabled'}).")
+
+    def make_key(self, system_prompt, user_prompt, model, json_mode=False):
+        """The cache key for one LLM request: a hash of the full (prompts, model, mode) tuple."""
+        return make_cache_key("llm", system_prompt, user_prompt, model, bool(json_mode))
+
+    def _expired(self, created_at):
+        return self.ttl is not None and (time.time() - created_at) > self.ttl
+
+    def get(self, key):
+        """Returns the cached value, or None on a miss."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created_at = entry
+                if not self._expired(created_at):
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._memory[key]
+
+        if self.disk is not None:
+            entry = self.disk.get(key)
+            if entry is not None:
+                value, created_at = entry
+                if not self._expired(created_at):
+                    # Promote the disk hit into the memory tier.
+                    self._remember(key, value, created_at)
+                    with self._lock:
+                        self.hits += 1
+                    return value
+                self.disk.delete(key)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _remember(self, key, value, created_at):
+        with self._lock:
+            self._memory[key] = (value, created_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def set(self, key, value):
+        created_at = time.time()
+        self._remember(key, value, created_at)
+        if self.disk is not None:
+            self.disk.set(key, value, created_at)
+            if self.max_disk_entries is not None:
+                self._count_disk_write()
+
+    def _count_disk_write(self):
+        """Counts one disk write; past max_disk_entries, evicts in one batch down to the low-water mark."""
+        # Overwrites are counted too; that only brings the next eviction (and exact re-count) forward.
+        with self._lock:
+            self._disk_entries += 1
+            if self._disk_entries <= self.max_disk_entries:
+                return
+            self._disk_entries = 0
+        low_water = max(1, int(self.max_disk_entries * DISK_LOW_WATER)) if self.max_disk_entries else 0
+        self.disk.evict(max_entries=low_water, ttl=self.ttl)
+        remaining = len(self.disk)
+        with self._lock:
+            self._disk_entries += remaining
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self.hits = 0
+            self.misses = 0
+            self._disk_entries = 0
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+                "memory_entries": len(self._memory),
+            }
+
+# === 4. The Embedding Cache ===
+def normalize_embedding_text(text):
+    """
+    Normalizes a text exactly as get_embedding does before sending it (newlines to spaces).
+    Nothing else is folded: texts the API would embed differently must not share an entry.
+    """
+    return text.replace("\n", " ")
+
+
+class MmapVectorStore:
+    """
+    Stores float32 vectors as fixed-size records in one memory-mapped file.
+    A small append-only key log maps each cache key to its record slot.
+    """
+    _FLOAT_BYTES = array("f").itemsize
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._data_path = os.path.join(path, "vectors.f32")
+        self._keys_path = os.path.join(path, "keys.log")
+        self._meta_path = os.path.join(path, "meta.json")
+        self._lock = threading.Lock()
+        self._slots = {}
+        self._mmap = None
+        self._data_file = None
+        self.dim = None
+
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path, "r", encoding="utf-8") as f:
+                self.dim = json.load(f)["dim"]
+        if os.path.exists(self._keys_path):
+            with open(self._keys_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    key, _, slot = line.rstrip("\n").partition("\t")
+                    if slot:
+                        self._slots[key] = int(slot)
+        if self.dim is not None:
+            self._open_data()
+            # Ignore log entries whose record never made it to disk (e.g. after a crash).
+            capacity = len(self._mmap) // self._record_bytes if self._mmap is not None else 0
+            self._slots = {k: v for k, v in self._slots.items() if v < capacity}
+
+    @property
+    def _record_bytes(self):
+        return self.dim * self._FLOAT_BYTES
+
+    def _open_data(self):
+        self._data_file = open(self._data_path, "a+b")
+        size = os.path.getsize(self._data_path)
+        self._mmap = mmap.mmap(self._data_file.fileno(), size) if size else None
+
+    def _grow_to(self, size):
+        if self._mmap is not None:
+            self._mmap.close()
+        self._data_file.truncate(size)
+        self._mmap = mmap.mmap(self._data_file.fileno(), size)
+
+    def get(self, key):
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None or self._mmap is None:
+                return None
+            offset = slot * self._record_bytes
+            vector = array("f")
+            vector.frombytes(self._mmap[offset:offset + self._record_bytes])
+            return vector
+
+    def set(self, key, vector):
+        with self._lock:
+            if self.dim is None:
+                self.dim = len(vector)
+                with open(self._meta_path, "w", encoding="utf-8") as f:
+                    json.dump({"dim": self.dim}, f)
+                self._open_data()
+            if len(vector) != self.dim:
+                raise ValueError(f"Embedding dimension {len(vector)} does not match cache dimension {self.dim}.")
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = len(self._slots)
+                needed = (slot + 1) * self._record_bytes
+                current = len(self._mmap) if self._mmap is not None else 0
+                if needed > current:
+                    # Grow geometrically so appends stay amortized O(1).
+                    self._grow_to(max(needed, 2 * current))
+            offset = slot * self._record_bytes
+            self._mmap[offset:offset + self._record_bytes] = vector.tobytes()
+            if key not in self._slots:
+                self._slots[key] = slot
+                with open(self._keys_path, "a", encoding="utf-8") as f:
+                    f.write(f"{key}\t{slot}\n")
+
+    def flush(self):
+        with self._lock:
+            if self._mmap is not None:
+                self._mmap.flush()
+
+    def close(self):
+        with self._lock:
+            if self._mmap is not None:
+                self._mmap.flush()
+                self._mmap.close()
+                self._mmap = None
+            if self._data_file is not None:
+                self._data_file.close()
+                self._data_file = None
+
+    def __len__(self):
+        return len(self._slots)
+
+
+class EmbeddingCache:
+    """
+    Caches embedding vectors keyed on (embedding_model, normalized text).
+    Vectors are held as compact float32 arrays in an LRU memory tier, backed by
+    an optional mmap disk tier so repeated queries survive across sessions.
+    """
+    def __init__(self, max_entries=4096, disk_path=None):
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk = MmapVectorStore(disk_path) if disk_path else None
+        logging.info(f"EmbeddingCache initialized (memory: {max_entries} vectors, disk: {disk_path or 'disabled'}).")
+
+    def make_key(self, text, model):
+        return make_cache_key("embedding", model, normalize_embedding_text(text))
+
+    def get(self, text, model):
+        """Returns the cached vector as a list of floats, or None on a miss."""
+        key = self.make_key(text, model)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return vector.tolist()
+
+        if self.disk is not None:
+            vector = self.disk.get(key)
+            if vector is not None:
+                self._remember(key, vector)
+                with self._lock:
+                    self.hits += 1
+                return vector.tolist()
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _remember(self, key, vector):
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def set(self, text, model, embedding):
+        key = self.make_key(text, model)
+        vector = array("f", embedding)
+        self._remember(key, vector)
+        if self.disk is not None:
+            self.disk.set(key, vector)
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_entries": len(self.disk) if self.disk is not None else 0,
+            }
+
+# === 5. The Plan Cache ===
+def _tidy_goal(goal):
+    return re.sub(r"\s+", " ", goal).strip().rstrip(".!?").strip()
+
+def normalize_goal(goal):
+    """Case-folds a goal and strips whitespace and trailing punctuation, so trivial variants share a key."""
+    return _tidy_goal(goal).lower()
+
+def _goal_tokens(goal):
+    return re.findall(r"\w+(?:[-'.]\w+)*|[^\w\s]", _tidy_goal(goal))
+
+def _unit_vector(embedding):
+    norm = math.sqrt(sum(x * x for x in embedding)) or 1.0
+    return [x / norm for x in embedding]
+
+def goal_substitutions(cached_goal, new_goal):
+    """
+    Diffs two goals word by word and returns the (old_phrase, new_phrase) pairs that turn one
+    into the other, or None when the goals differ by more than replaced phrases
+    (an inserted or dropped clause means the plan's shape may differ too).
+    """
+    old_tokens = _goal_tokens(cached_goal)
+    new_tokens = _goal_tokens(new_goal)
+    matcher = difflib.SequenceMatcher(None, [t.lower() for t in old_tokens], [t.lower() for t in new_tokens], autojunk=False)
+    substitutions = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        if tag != "replace":
+            return None
+        substitutions.append((" ".join(old_tokens[i1:i2]), " ".join(new_tokens[j1:j2])))
+    return substitutions
+
+def reparameterize_plan(plan, substitutions):
+    """
+    Rewrites a cached plan for a new goal by applying the goal substitutions to every string
+    input ($$STEP_N_OUTPUT$$ references are left alone). Returns None if a substitution
+    does not appear anywhere in the plan, since the plan then cannot be adapted safely.
+    """
+    plan = copy.deepcopy(plan)
+    if not substitutions:
+        return plan
+    patterns = [(re.compile(r"(?<!\w)" + r"\s+".join(map(re.escape, old.split())) + r"(?!\w)", re.IGNORECASE), new) for old, new in substitutions]
+    used = set()
+
+    def rewrite(value):
+        if isinstance(value, str):
+            if value.startswith("$$") and value.endswith("$$"):
+                return value
+            for i, (pattern, new) in enumerate(patterns):
+                value, count = pattern.subn(lambda _: new, value)
+                if count:
+                    used.add(i)
+            return value
+        if isinstance(value, dict):
+            return {k: rewrite(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [rewrite(v) for v in value]
+        return value
+
+    for step in plan:
+        if "input" in step:
+            step["input"] = rewrite(step["input"])
+    return plan if len(used) == len(patterns) else None
+
+class PlanCache:
+    """
+    Caches execution plans so repeat goal shapes skip the planner's LLM call.
+    Lookups try the normalized goal first, then (when an `embed_fn` is supplied) the most
+    similar cached goal at or above `similarity_threshold`. A similar goal's plan is
+    re-parameterized for the new goal, e.g. "retrieve the NDA then summarize" ->
+    "retrieve the lease then summarize" rewrites 'NDA' to 'lease' in the step inputs.
+    Plans are scoped by (capabilities, model), so a toolkit change never reuses stale plans.
+    """
+    def __init__(self, max_entries=512, embed_fn=None, similarity_threshold=0.9, disk_path=None):
+        self.max_entries = max_entries
+        self.embed_fn = embed_fn
+        self.similarity_threshold = similarity_threshold
+        self.disk_path = disk_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        if disk_path and os.path.exists(disk_path):
+            with open(disk_path, "r", encoding="utf-8") as f:
+                saved = list(json.load(f).items())
+            # The file is saved least recently used first; keep only the newest max_entries.
+            for key, entry in saved[max(0, len(saved) - max_entries):]:
+                self._entries[key] = entry
+        logging.info(f"PlanCache initialized ({max_entries} plans, semantic: {'on' if embed_fn else 'off'}, disk: {disk_path or 'disabled'}).")
+
+    def make_scope(self, capabilities, model):
+        return make_cache_key("plan-scope", capabilities, model)
+
+    def make_key(self, goal, capabilities, model):
+        return make_cache_key("plan", normalize_goal(goal), capabilities, model)
+
+    def _embed(self, goal):
+        return _unit_vector(self.embed_fn(normalize_goal(goal)))
+
+    def lookup(self, goal, capabilities, model):
+        """Returns (plan, match) where match is 'exact', 'semantic' or None (plan is None on a miss)."""
+        key = self.make_key(goal, capabilities, model)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(entry["plan"]), "exact"
+
+        if self.embed_fn is not None:
+            scope = self.make_scope(capabilities, model)
+            query = self._embed(goal)
+            with self._lock:
+                candidates = [(sum(a * b for a, b in zip(query, e["embedding"])), k, e)
+                              for k, e in self._entries.items() if e["scope"] == scope and e.get("embedding")]
+            for score, cached_key, entry in sorted(candidates, key=lambda c: c[0], reverse=True):
+                if score < self.similarity_threshold:
+                    break
+                substitutions = goal_substitutions(entry["goal"], goal)
+                plan = reparameterize_plan(entry["plan"], substitutions) if substitutions is not None else None
+                if plan is not None:
+                    logging.info(f"[PlanCache] Reusing plan for '{entry['goal']}' (similarity {score:.2f}).")
+                    with self._lock:
+                        if cached_key in self._entries:
+                            self._entries.move_to_end(cached_key)
+                        self.hits += 1
+                        self.semantic_hits += 1
+                    return plan, "semantic"
+
+        with self._lock:
+            self.misses += 1
+        return None, None
+
+    def set(self, goal, capabilities, model, plan):
+        """Stores a plan for a goal. Also useful for pre-loading known plan templates."""
+        entry = {
+            "goal": goal,
+            "plan": copy.deepcopy(plan),
+            "scope": self.make_scope(capabilities, model),
+            "embedding": self._embed(goal) if self.embed_fn is not None else None,
+        }
+        key = self.make_key(goal, capabilities, model)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        if self.disk_path:
+            self.save()
+
+    def save(self):
+        """Writes every cached plan to `disk_path` (atomically)."""
+        with self._lock:
+            snapshot = dict(self._entries)
+        tmp_path = f"{self.disk_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, self.disk_path)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.semantic_hits = 0
+            self.misses = 0
+        if self.disk_path and os.path.exists(self.disk_path):
+            os.remove(self.disk_path)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+                "entries": len(self._entries),
+            }
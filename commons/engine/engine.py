@@ -3,52 +3,201 @@ import logging
 import time
 import json
 import copy
-from helpers import call_llm_robust, create_mcp_message, count_tokens # Added count_tokens import
+import re
+import hashlib
+import itertools
+import uuid
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import asyncio
+from helpers import call_llm_robust, create_mcp_message, count_tokens, counter_scope, counter_context, record_counter # Added count_tokens import
+from helpers import async_call_llm_robust
+from helpers import query_namespaces, async_query_namespaces, prefetch_scope, set_prefetched_matches, priority_lane
+from helpers import Span, span, step_span, activate_span
 from registry import AGENT_TOOLKIT
 
 # === 6.1. The Tracer ===
+# UPGRADE: Structured trace events. Every plan, step and finalize is also emitted as a compact record
+# to the installed sinks (see trace_sinks.py); step inputs and outputs travel as payload references.
+_TRACE_SINKS = []
+_PAYLOAD_STORE = None
+_KEEP_PAYLOADS = True
+PAYLOAD_INLINE_BYTES = 256
+
+def set_trace_sinks(sinks, payload_store=None, keep_payloads=True):
+    """
+    Installs the sinks (objects with emit(record)) and the payload store (put(digest, serialized))
+    used by every new ExecutionTrace. With keep_payloads=False, trace.steps holds only the compact
+    records instead of full inputs and outputs, so long-running services keep bounded memory.
+    """
+    global _TRACE_SINKS, _PAYLOAD_STORE, _KEEP_PAYLOADS
+    _TRACE_SINKS = list(sinks or [])
+    _PAYLOAD_STORE = payload_store
+    _KEEP_PAYLOADS = keep_payloads
+    logging.info(f"Trace sinks installed: {[type(sink).__name__ for sink in _TRACE_SINKS] or 'none'}.")
+
+def payload_ref(value, store=None, inline_bytes=PAYLOAD_INLINE_BYTES):
+    """
+    Describes a payload by its SHA-256 and size. Small payloads are also kept inline;
+    larger ones are written to the payload store (if any) and referenced by digest.
+    """
+    serialized = json.dumps(value, ensure_ascii=False, default=str)
+    data = serialized.encode("utf-8")
+    digest = hashlib.sha256(data).hexdigest()
+    ref = {"sha256": digest, "bytes": len(data)}
+    if len(data) <= inline_bytes:
+        ref["inline"] = value
+    elif store is not None:
+        store.put(digest, serialized)
+    return ref
+
 class ExecutionTrace:
     """Logs the entire execution flow for debugging and analysis."""
-    def __init__(self, goal):
+    def __init__(self, goal, sinks=None, payload_store=None, keep_payloads=None):
         self.goal = goal
+        self.trace_id = uuid.uuid4().hex
+        self.sinks = list(_TRACE_SINKS if sinks is None else sinks)
+        self.payload_store = _PAYLOAD_STORE if payload_store is None else payload_store
+        self.keep_payloads = _KEEP_PAYLOADS if keep_payloads is None else keep_payloads
+        self._sequence = itertools.count()
         self.plan = None
+        self.plan_spans = None
         self.steps = []
         self.status = "Initialized"
         self.final_output = None
         self.start_time = time.time()
+        # UPGRADE: Durations are measured with perf_counter (monotonic, high resolution).
+        self._perf_start = time.perf_counter()
+        # UPGRADE: Event counters reported by the helpers while this goal runs (e.g. cache hits).
+        self.counters = {}
         logging.info(f"ExecutionTrace initialized for goal: '{self.goal}'")
 
-    def log_plan(self, plan):
+    def _ref(self, value):
+        return payload_ref(value, self.payload_store)
+
+    def _emit(self, event, **fields):
+        """Builds a compact record and hands it to every sink. A failing sink never fails the goal."""
+        record = {"event": event, "trace_id": self.trace_id, "seq": next(self._sequence), **fields}
+        for sink in self.sinks:
+            try:
+                sink.emit(record)
+            except Exception as e:
+                logging.warning(f"Trace sink {type(sink).__name__} failed: {e}")
+        return record
+
+    def log_plan(self, plan, spans=None):
+        """Logs the plan, plus the planner's timing span tree (LLM generation, retries, plan cache lookup)."""
         self.plan = plan
+        self.plan_spans = spans
+        if self.sinks:
+            self._emit("plan", goal=self.goal, steps=len(plan) if isinstance(plan, list) else None, plan=self._ref(plan), spans=spans)
         logging.info("Plan has been logged to the trace.")
 
     # UPGRADE: Added tokens_in and tokens_out parameters
-    def log_step(self, step_num, agent, planned_input, mcp_output, resolved_input, tokens_in=0, tokens_out=0):
-        """Logs the details of a single execution step, including token metrics."""
-        self.steps.append({
-            "step": step_num,
-            "agent": agent,
-            "planned_input": planned_input,
-            "resolved_context": resolved_input,
-            "output": mcp_output['content'],
-            "tokens_in": tokens_in,
-            "tokens_out": tokens_out,
-            # Calculate savings specifically for the summarizer
-            "tokens_saved": max(0, tokens_in - tokens_out) if agent == "Summarizer" else 0
-        })
-        logging.info(f"Step {step_num} ({agent}) logged to the trace. [In: {tokens_in}, Out: {tokens_out}]")
+    def log_step(self, step_num, agent, planned_input, mcp_output, resolved_input, tokens_in=0, tokens_out=0, started=None, finished=None, spans=None):
+        """
+        Logs the details of a single execution step, including token metrics, monotonic start/end times
+        and the step's timing span tree (embedding, vector query, sanitization, LLM generation, retries).
+        """
+        metadata = mcp_output.get('metadata', {}) if isinstance(mcp_output, dict) else {}
+        # Calculate savings specifically for the summarizer
+        tokens_saved = max(0, tokens_in - tokens_out) if agent == "Summarizer" else 0
+        # Map-reduce Summarizer: savings of each map/reduce level (empty for a single pass)
+        tokens_saved_by_level = [
+            {"level": level["level"], "stage": level["stage"], "tokens_saved": level["tokens_saved"]}
+            for level in metadata.get("summary_levels", [])
+        ]
+        if self.keep_payloads:
+            self.steps.append({
+                "step": step_num,
+                "agent": agent,
+                "planned_input": planned_input,
+                "resolved_context": resolved_input,
+                "output": mcp_output['content'],
+                # Agent-reported telemetry (e.g. the Researcher's context packing stats)
+                "metadata": metadata,
+                "tokens_in": tokens_in,
+                "tokens_out": tokens_out,
+                "tokens_saved": tokens_saved,
+                "tokens_saved_by_level": tokens_saved_by_level,
+                "started": started,
+                "finished": finished,
+                "spans": spans
+            })
+        if self.sinks or not self.keep_payloads:
+            record = self._emit(
+                "step", step=step_num, agent=agent, started=started, finished=finished,
+                tokens_in=tokens_in, tokens_out=tokens_out, tokens_saved=tokens_saved,
+                input=self._ref(resolved_input), output=self._ref(mcp_output['content']), metadata=metadata, spans=spans
+            )
+            if not self.keep_payloads:
+                self.steps.append(dict(record, tokens_saved_by_level=tokens_saved_by_level))
+        logging.info("Step %s (%s) logged to the trace. [In: %s, Out: %s]", step_num, agent, tokens_in, tokens_out)
 
     def finalize(self, status, final_output=None):
         self.status = status
         self.final_output = final_output
-        self.duration = time.time() - self.start_time
+        self.duration = time.perf_counter() - self._perf_start
+        if self.sinks:
+            self._emit("finalize", status=status, duration=self.duration, counters=dict(self.counters), output=self._ref(final_output))
         logging.info(f"Trace finalized with status '{status}'. Duration: {self.duration:.2f}s")
 
+    def latency_breakdown(self):
+        """
+        Per step: total latency plus the self time spent in each kind of span (so the parts add up
+        to the total), and the retries and backoff sleep absorbed along the way. Times are in ms.
+        Planning comes first, as step None with agent "Planner", when its span was recorded.
+        """
+        breakdown = []
+        planner = [{"step": None, "agent": "Planner", "spans": self.plan_spans}] if self.plan_spans else []
+        for step in planner + self.steps:
+            spans = step.get("spans")
+            if not spans:
+                continue
+            by_span, totals = {}, {"retries": 0, "backoff_ms": 0.0}
+            _accumulate_span(spans, by_span, totals)
+            breakdown.append({
+                "step": step["step"],
+                "agent": step["agent"],
+                "total_ms": spans["duration_ms"],
+                "by_span": {name: round(ms, 3) for name, ms in sorted(by_span.items(), key=lambda item: -item[1])},
+                "retries": totals["retries"],
+                "backoff_ms": round(totals["backoff_ms"], 3),
+            })
+        return breakdown
+
+    @property
+    def cache_hits(self):
+        return self.counters.get("llm_cache_hits", 0)
+
+    @property
+    def cache_misses(self):
+        return self.counters.get("llm_cache_misses", 0)
+
+    @property
+    def embedding_cache_hits(self):
+        return self.counters.get("embedding_cache_hits", 0)
+
+    @property
+    def embedding_cache_misses(self):
+        return self.counters.get("embedding_cache_misses", 0)
+
+    @property
+    def plan_cache_hit(self):
+        return self.counters.get("plan_cache_hits", 0) > 0
+
+def _accumulate_span(node, by_span, totals):
+    # Concurrent children can overlap, so self time is clamped at zero.
+    self_ms = max(0.0, node["duration_ms"] - sum(child["duration_ms"] for child in node["children"]))
+    by_span[node["name"]] = by_span.get(node["name"], 0.0) + self_ms
+    totals["retries"] += node["retries"]
+    totals["backoff_ms"] += node["backoff_ms"]
+    for child in node["children"]:
+        _accumulate_span(child, by_span, totals)
+
 # === 6.2. The Planner ===
-def planner(goal, capabilities, client, generation_model):
-    """Analyzes the goal and generates a structured Execution Plan using the LLM."""
-    logging.info("Planner activated. Analyzing goal and generating execution plan...")
-    system_prompt = f"""
+def _planner_system_prompt(capabilities):
+    return f"""
 You are the strategic core of the Context Engine. Analyze the user's high-level GOAL and create a step-by-step EXECUTION PLAN.
 
 AVAILABLE CAPABILITIES
@@ -61,19 +210,86 @@ INSTRUCTIONS:
 1. The output MUST be a single JSON object with a "plan" key containing a list of step objects.
 2. Use Context Chaining: format "$$STEP_N_OUTPUT$$" for values requiring previous outputs.
 """
+
+_PLAN_CACHE = None
+
+def set_plan_cache(cache):
+    """Installs (or removes, with None) the process-wide PlanCache consulted by the planner."""
+    global _PLAN_CACHE
+    _PLAN_CACHE = cache
+    logging.info(f"Plan cache {'enabled' if cache is not None else 'disabled'}.")
+
+def _record_plan_lookup(match):
+    if match is None:
+        record_counter("plan_cache_misses")
+        return
+    record_counter("plan_cache_hits")
+    if match == "semantic":
+        record_counter("plan_cache_semantic_hits")
+    logging.info(f"Planner: reusing cached plan ({match} match). Skipping LLM planning call.")
+
+def planner(goal, capabilities, client, generation_model, plan_cache=None):
+    """
+    Analyzes the goal and generates a structured Execution Plan using the LLM.
+    UPGRADE: With a plan cache (argument or set_plan_cache), repeat goal shapes reuse a cached plan.
+    """
+    logging.info("Planner activated. Analyzing goal and generating execution plan...")
+    plan_cache = plan_cache if plan_cache is not None else _PLAN_CACHE
+    if plan_cache is not None:
+        plan, match = plan_cache.lookup(goal, capabilities, generation_model)
+        _record_plan_lookup(match)
+        if plan is not None:
+            return plan
+
+    system_prompt = _planner_system_prompt(capabilities)
+    try:
+        # Planner calls jump the rate-limit queue: every goal waits on its plan.
+        with priority_lane("planner"):
+            plan_json_string = call_llm_robust(
+                system_prompt,
+                goal,
+                client=client,
+                generation_model=generation_model,
+                json_mode=True
+            )
+        plan_data = json.loads(plan_json_string)
+        plan = plan_data["plan"]
+    except Exception as e:
+        logging.error(f"Planner failed to generate a valid plan. Error: {e}")
+        raise e
+    if plan_cache is not None:
+        plan_cache.set(goal, capabilities, generation_model, plan)
+    return plan
+
+async def async_planner(goal, capabilities, client, generation_model, plan_cache=None):
+    """Async twin of planner. Requires an AsyncOpenAI 'client'."""
+    logging.info("Planner activated (async). Analyzing goal and generating execution plan...")
+    plan_cache = plan_cache if plan_cache is not None else _PLAN_CACHE
+    if plan_cache is not None:
+        # A semantic lookup embeds the goal (a blocking call), so keep it off the event loop.
+        plan, match = await asyncio.to_thread(plan_cache.lookup, goal, capabilities, generation_model)
+        _record_plan_lookup(match)
+        if plan is not None:
+            return plan
+
+    system_prompt = _planner_system_prompt(capabilities)
     try:
-        plan_json_string = call_llm_robust(
-            system_prompt,
-            goal,
-            client=client,
-            generation_model=generation_model,
-            json_mode=True
-        )
+        with priority_lane("planner"):
+            plan_json_string = await async_call_llm_robust(
+                system_prompt,
+                goal,
+                client=client,
+                generation_model=generation_model,
+                json_mode=True
+            )
         plan_data = json.loads(plan_json_string)
-        return plan_data["plan"]
+        plan = plan_data["plan"]
     except Exception as e:
         logging.error(f"Planner failed to generate a valid plan. Error: {e}")
         raise e
+    if plan_cache is not None:
+        await asyncio.to_thread(plan_cache.set, goal, capabilities, generation_model, plan)
+    return plan
 
 # === 6.3. The Executor ===
 def resolve_dependencies(input_params, state):
@@ -90,78 +306,450 @@ def resolve_dependencies(input_params, state):
         return value
     return resolve(resolved_input)
 
-def context_engine(goal, client, pc, index_name, generation_model, embedding_model, namespace_context, namespace_knowledge):
-    """The main entry point for the Context Engine. Manages Planning and Execution."""
+# === 6.4. The Dependency Graph (DAG-Parallel Execution) ===
+STEP_REFERENCE_PATTERN = re.compile(r"\$\$(STEP_\d+_OUTPUT)\$\$")
+
+def find_references(value):
+    """Returns the set of STEP_N_OUTPUT keys referenced anywhere inside a planned input."""
+    if isinstance(value, str):
+        return set(STEP_REFERENCE_PATTERN.findall(value))
+    elif isinstance(value, dict):
+        return set().union(*(find_references(v) for v in value.values()))
+    elif isinstance(value, list):
+        return set().union(*(find_references(item) for item in value))
+    return set()
+
+def build_dependency_graph(plan):
+    """
+    Maps each plan position to the earlier positions whose output it consumes.
+    Only references to steps that come earlier in the plan count, exactly as in
+    sequential execution (where later outputs do not exist yet).
+    """
+    position_of = {}
+    graph = {}
+    for position, step in enumerate(plan):
+        references = find_references(step.get("input"))
+        graph[position] = {position_of[ref] for ref in references if ref in position_of}
+        position_of[f"STEP_{step.get('step')}_OUTPUT"] = position
+    return graph
+
+class StepScheduler:
+    """
+    Tracks which plan steps are ready, running, finished or failed.
+    Steps whose dependencies are satisfied may run concurrently, but results are
+    released to the trace strictly in plan order. After the first failure no new step
+    starts (queued work is cancelled); steps already running finish, and only the ones
+    before the failing step are logged.
+    """
+    def __init__(self, plan, max_concurrency):
+        self.plan = plan
+        self.graph = build_dependency_graph(plan)
+        self.max_concurrency = max(1, max_concurrency)
+        self.state = {}
+        self.results = {}
+        self.pending = list(range(len(plan)))
+        self.running = 0
+        self.first_failure = None
+        self.next_to_log = 0
+
+    @property
+    def limit(self):
+        # Work at or beyond the earliest failure would never have run sequentially.
+        return self.first_failure[0] if self.first_failure else len(self.plan)
+
+    def next_ready(self):
+        """Yields (position, step, visible_state) for each step that can start now."""
+        for position in list(self.pending):
+            if self.first_failure is not None:
+                # A failed goal should not spend further LLM calls on steps it will never report.
+                self.pending.clear()
+                return
+            if self.running >= self.max_concurrency:
+                return
+            if position >= self.limit:
+                self.pending.remove(position)
+                continue
+            if all(dep in self.results for dep in self.graph[position]):
+                self.pending.remove(position)
+                self.running += 1
+                yield position, self.plan[position], self.visible_state(position)
+
+    def visible_state(self, position):
+        """
+        The outputs a step may resolve: only those of the earlier steps it depends on, so a
+        reference to a later step stays unresolved exactly as in a sequential run.
+        """
+        return {f"STEP_{self.plan[dep].get('step')}_OUTPUT": self.results[dep][0]["content"]
+                for dep in self.graph[position] if dep in self.results}
+
+    def complete(self, position, result):
+        self.running -= 1
+        self.results[position] = result
+        if position < self.limit:
+            self.state[f"STEP_{self.plan[position].get('step')}_OUTPUT"] = result[0]["content"]
+
+    def fail(self, position, error):
+        self.running -= 1
+        if self.first_failure is None or position < self.first_failure[0]:
+            self.first_failure = (position, error)
+
+    def cancel(self, position):
+        """Accounts for a started step whose work was cancelled before it finished."""
+        self.running -= 1
+
+    def loggable(self):
+        """Yields (step, result) for finished steps that are next in plan order."""
+        while self.next_to_log in self.results and self.next_to_log < self.limit:
+            yield self.plan[self.next_to_log], self.results[self.next_to_log]
+            self.next_to_log += 1
+
+    def has_work(self):
+        return bool(self.pending) or self.running > 0
+
+def _log_step_result(trace, step, result):
+    mcp_output, resolved_input, t_in, t_out, started, finished, spans = result
+    # UPGRADE: Pass token counts into the log_step call
+    trace.log_step(
+        step.get("step"),
+        step.get("agent"),
+        step.get("input"),
+        mcp_output,
+        resolved_input,
+        tokens_in=t_in,
+        tokens_out=t_out,
+        started=started,
+        finished=finished,
+        spans=spans
+    )
+
+def _log_ready_steps(trace, scheduler):
+    """Logs finished steps in plan order and returns them as (step, result) pairs."""
+    # 3. Log finished steps in plan order
+    logged = []
+    for step, result in scheduler.loggable():
+        _log_step_result(trace, step, result)
+        logged.append((step, result))
+    return logged
+
+def _finalize_run(trace, plan, scheduler):
+    if scheduler.first_failure is not None:
+        position, e = scheduler.first_failure
+        step_num = plan[position].get("step")
+        agent_name = plan[position].get("agent")
+        error_message = f"Execution failed at step {step_num} ({agent_name}): {e}"
+        logging.error(f"--- Executor: FATAL ERROR --- {error_message}")
+        trace.finalize(f"Failed at Step {step_num}")
+        return None, trace
+
+    # --- Finalization ---
+    final_output = scheduler.state.get(f"STEP_{len(plan)}_OUTPUT")
+    trace.finalize("Success", final_output)
+    logging.info("--- [Context Engine] Task Complete ---")
+    return final_output, trace
+
+def context_engine(goal, client, pc, index_name, generation_model, embedding_model, namespace_context, namespace_knowledge, max_concurrency=1, stream=False):
+    """
+    The main entry point for the Context Engine. Manages Planning and Execution.
+    UPGRADE: Independent plan steps can run concurrently: pass max_concurrency > 1 to opt in
+      (the default of 1 executes the plan step by step). When a step fails, no further steps
+      are started, so with max_concurrency > 1 only steps already in flight still run.
+    UPGRADE: stream=True returns a generator of events instead of (result, trace):
+      {"event": "plan", "plan": [...]}
+      {"event": "step", "step": n, "agent": name, "output": ...}   (in plan order)
+      {"event": "token", "step": n, "delta": "..."}                (final Writer output, as generated)
+      {"event": "done", "status": ..., "output": ..., "trace": ExecutionTrace}
+    """
     logging.info(f"--- [Context Engine] Starting New Task --- Goal: {goal}")
     trace = ExecutionTrace(goal)
-    registry = AGENT_TOOLKIT
+    if stream:
+        return _stream_goal(trace, goal, client, pc, index_name, generation_model, embedding_model, namespace_context, namespace_knowledge, max_concurrency)
+    # UPGRADE: Every helper call made for this goal reports its counters to this trace.
+    with counter_scope(trace.counters):
+        return _run_goal(trace, goal, client, pc, index_name, generation_model, embedding_model, namespace_context, namespace_knowledge, max_concurrency)
+
+def _prepare_step(step, state):
+    """Resolves a step's inputs and wraps them in the MCP request (plus input token count and monotonic start time)."""
+    logging.info(f"--- Executor: Starting Step {step.get('step')}: {step.get('agent')} ---")
+    started = time.monotonic()
+    with span("prepare"):
+        # 1. Resolve inputs
+        resolved_input = resolve_dependencies(step.get("input"), state)
+        # UPGRADE: Count Input Tokens (The context being sent to the agent)
+        t_in = count_tokens(str(resolved_input))
+    return create_mcp_message("Engine", resolved_input), resolved_input, t_in, started
+
+def _measure_output(step, mcp_output, resolved_input, t_in, started):
+    output_data = mcp_output["content"]
+    with span("measure"):
+        # UPGRADE: Count Output Tokens (The response generated by the agent)
+        t_out = count_tokens(str(output_data))
+    logging.info(f"--- Executor: Step {step.get('step')} completed. ---")
+    return mcp_output, resolved_input, t_in, t_out, started, time.monotonic()
+
+def _handler_dependencies(client, index, generation_model, embedding_model, namespace_context, namespace_knowledge):
+    return dict(
+        client=client,
+        index=index,
+        generation_model=generation_model,
+        embedding_model=embedding_model,
+        namespace_context=namespace_context,
+        namespace_knowledge=namespace_knowledge
+    )
+
+def _execute_step(step, state, registry, dependencies, handler=None):
+    """Resolves, runs and measures one plan step. Returns everything log_step needs."""
+    handler = handler or registry.get_handler(step.get("agent"), **dependencies)
+    # UPGRADE: Each step runs in a root timing span; the helpers nest their spans under it.
+    with step_span("step", step=step.get("step"), agent=step.get("agent")) as timing:
+        mcp_request, resolved_input, t_in, started = _prepare_step(step, state)
+        # 2. Call the agent
+        with span("agent", agent=step.get("agent")):
+            mcp_output = handler(mcp_request)
+        result = _measure_output(step, mcp_output, resolved_input, t_in, started)
+    return result + (timing.to_dict(),)
+
+def _retrieval_queries(plan, registry, dependencies):
+    """
+    Collects the plan's literal retrieval queries as {namespace: (query_text, top_k)}.
+    Queries built from earlier outputs ($$STEP_N_OUTPUT$$) cannot be known up front and are skipped.
+    """
+    queries = {}
+    for step in plan:
+        spec = registry.retrieval_inputs.get(step.get("agent"))
+        step_input = step.get("input")
+        if spec is None or not isinstance(step_input, dict):
+            continue
+        input_key, namespace_arg, top_k = spec
+        query_text = step_input.get(input_key)
+        namespace = dependencies[namespace_arg]
+        if isinstance(query_text, str) and query_text and not find_references(query_text) and namespace not in queries:
+            queries[namespace] = (query_text, top_k)
+    # A single query gains nothing from fan-out; the agent will run it as usual.
+    return queries if len(queries) > 1 else {}
+
+def _prefetched(queries, results):
+    return {(namespace, query_text): (top_k, results[namespace]) for namespace, (query_text, top_k) in queries.items()}
 
+def _prefetch_retrieval(plan, registry, dependencies):
+    """
+    UPGRADE: Retrieval fan-out. Embeds every literal Librarian/Researcher query in one batched
+    call and runs the namespace queries concurrently; the agents then reuse the results.
+    Returns {} when there is nothing to fan out or the prefetch fails (agents query as usual).
+    """
+    queries = _retrieval_queries(plan, registry, dependencies)
+    if not queries:
+        return {}
     try:
-        index = pc.Index(index_name)
-        capabilities = registry.get_capabilities_description()
+        results = query_namespaces(queries, index=dependencies["index"], client=dependencies["client"], embedding_model=dependencies["embedding_model"])
+        return _prefetched(queries, results)
+    except Exception as e:
+        logging.warning(f"Retrieval fan-out failed; agents will query individually. Error: {e}")
+        return {}
+
+async def _async_prefetch_retrieval(plan, registry, dependencies):
+    """Async twin of _prefetch_retrieval."""
+    queries = _retrieval_queries(plan, registry, dependencies)
+    if not queries:
+        return {}
+    try:
+        results = await async_query_namespaces(queries, index=dependencies["index"], client=dependencies["client"], embedding_model=dependencies["embedding_model"])
+        return _prefetched(queries, results)
+    except Exception as e:
+        logging.warning(f"Retrieval fan-out failed; agents will query individually. Error: {e}")
+        return {}
+
+def _plan_goal(trace, goal, client, pc, index_name, generation_model):
+    """Phase 1: opens the index and plans the goal. Returns (index, plan)."""
+    index = pc.Index(index_name)
+    capabilities = AGENT_TOOLKIT.get_capabilities_description()
+    with step_span("planner") as timing:
         plan = planner(goal, capabilities, client=client, generation_model=generation_model)
-        trace.log_plan(plan)
+    trace.log_plan(plan, spans=timing.to_dict())
+    return index, plan
+
+def _drive_scheduler(trace, scheduler, registry, dependencies, context):
+    """
+    Phase 2: Execute (DAG-parallel). Runs the scheduler to completion on a thread pool
+    and yields each (step, result) as it is logged, in plan order.
+    """
+    running = {}
+    with ThreadPoolExecutor(max_workers=scheduler.max_concurrency) as pool:
+        while scheduler.has_work():
+            for position, step, visible_state in scheduler.next_ready():
+                # Bind the agent before submitting, so an unknown agent fails before later steps start.
+                try:
+                    handler = registry.get_handler(step.get("agent"), **dependencies)
+                except Exception as e:
+                    scheduler.fail(position, e)
+                    continue
+                # Each worker runs in a copy of the goal's context so helper counters reach its trace.
+                future = pool.submit(context.copy().run, _execute_step, step, visible_state, registry, dependencies, handler)
+                running[future] = position
+
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                position = running.pop(future)
+                try:
+                    scheduler.complete(position, future.result())
+                except Exception as e:
+                    scheduler.fail(position, e)
+            if scheduler.first_failure is not None:
+                # Drop work that has not started yet; running threads cannot be interrupted.
+                for future in [f for f in running if f.cancel()]:
+                    scheduler.cancel(running.pop(future))
+            yield from _log_ready_steps(trace, scheduler)
+
+def _run_goal(trace, goal, client, pc, index_name, generation_model, embedding_model, namespace_context, namespace_knowledge, max_concurrency=1):
+    """Plans and executes a single goal, recording everything on the given trace."""
+    registry = AGENT_TOOLKIT
+
+    try:
+        index, plan = _plan_goal(trace, goal, client, pc, index_name, generation_model)
+        scheduler = StepScheduler(plan, max_concurrency)
     except Exception as e:
         trace.finalize(f"Failed during Planning/Init: {e}")
         return None, trace
 
-    # --- Phase 2: Execute ---
-    state = {}
-    for step in plan:
-        step_num = step.get("step")
-        agent_name = step.get("agent")
-        planned_input = step.get("input")
+    dependencies = _handler_dependencies(client, index, generation_model, embedding_model, namespace_context, namespace_knowledge)
+    with prefetch_scope(_prefetch_retrieval(plan, registry, dependencies)):
+        for _ in _drive_scheduler(trace, scheduler, registry, dependencies, contextvars.copy_context()):
+            pass
+    return _finalize_run(trace, plan, scheduler)
+
+def _stream_goal(trace, goal, client, pc, index_name, generation_model, embedding_model, namespace_context, namespace_knowledge, max_concurrency=1):
+    """
+    Generator behind context_engine(..., stream=True). All steps but the last run as usual;
+    the final step runs last (as it would sequentially) and, when its agent supports
+    streaming, its output is relayed token by token.
+    """
+    registry = AGENT_TOOLKIT
+    # A 'with' block cannot span the yields of a generator, so every call runs inside this context.
+    context = counter_context(trace.counters)
 
-        logging.info(f"--- Executor: Starting Step {step_num}: {agent_name} ---")
+    try:
+        index, plan = context.run(_plan_goal, trace, goal, client, pc, index_name, generation_model)
+        scheduler = StepScheduler(plan[:-1], max_concurrency)
+    except Exception as e:
+        trace.finalize(f"Failed during Planning/Init: {e}")
+        yield {"event": "done", "status": trace.status, "output": None, "trace": trace}
+        return
+    yield {"event": "plan", "plan": plan}
+
+    dependencies = _handler_dependencies(client, index, generation_model, embedding_model, namespace_context, namespace_knowledge)
+    context.run(set_prefetched_matches, context.run(_prefetch_retrieval, plan, registry, dependencies))
+    for step, result in _drive_scheduler(trace, scheduler, registry, dependencies, context):
+        yield {"event": "step", "step": step.get("step"), "agent": step.get("agent"), "output": result[0]["content"]}
+
+    if scheduler.first_failure is None and plan:
+        final_step = plan[-1]
+        final_position = len(plan) - 1
         try:
-            handler = registry.get_handler(
-                agent_name,
-                client=client,
-                index=index,
-                generation_model=generation_model,
-                embedding_model=embedding_model,
-                namespace_context=namespace_context,
-                namespace_knowledge=namespace_knowledge
-            )
-            
-            # 1. Resolve inputs
-            resolved_input = resolve_dependencies(planned_input, state)
-            
-            # UPGRADE: Count Input Tokens (The context being sent to the agent)
-            t_in = count_tokens(str(resolved_input))
-            
-            # 2. Call the agent
-            mcp_resolved_input = create_mcp_message("Engine", resolved_input)
-            mcp_output = handler(mcp_resolved_input)
-            output_data = mcp_output["content"]
-            
-            # UPGRADE: Count Output Tokens (The response generated by the agent)
-            t_out = count_tokens(str(output_data))
-            
-            # 3. Update state and log results
-            state[f"STEP_{step_num}_OUTPUT"] = output_data
-            
-            # UPGRADE: Pass token counts into the log_step call
-            trace.log_step(
-                step_num, 
-                agent_name, 
-                planned_input, 
-                mcp_output, 
-                resolved_input, 
-                tokens_in=t_in, 
-                tokens_out=t_out
-            )
-            
-            logging.info(f"--- Executor: Step {step_num} completed. ---")
-            
+            visible_state = {key: scheduler.state[key] for key in find_references(final_step.get("input")) if key in scheduler.state}
+            stream_handler = registry.get_stream_handler(final_step.get("agent"), **dependencies)
+            if stream_handler is None:
+                result = context.run(_execute_step, final_step, visible_state, registry, dependencies)
+            else:
+                # The step spans several context.run calls, so its spans are activated by hand.
+                timing = Span("step", step=final_step.get("step"), agent=final_step.get("agent"))
+                try:
+                    context.run(activate_span, timing)
+                    mcp_request, resolved_input, t_in, started = context.run(_prepare_step, final_step, visible_state)
+                    agent_timing = Span("agent", agent=final_step.get("agent"))
+                    timing.children.append(agent_timing)
+                    context.run(activate_span, agent_timing)
+                    deltas = stream_handler(mcp_request)
+                    while True:
+                        try:
+                            delta = context.run(next, deltas)
+                        except StopIteration as done:
+                            mcp_output = done.value
+                            break
+                        yield {"event": "token", "step": final_step.get("step"), "delta": delta}
+                    agent_timing.finish()
+                    context.run(activate_span, timing)
+                    result = context.run(_measure_output, final_step, mcp_output, resolved_input, t_in, started)
+                finally:
+                    context.run(activate_span, None)
+                result = result + (timing.finish().to_dict(),)
+            scheduler.state[f"STEP_{final_step.get('step')}_OUTPUT"] = result[0]["content"]
+            _log_step_result(trace, final_step, result)
+            yield {"event": "step", "step": final_step.get("step"), "agent": final_step.get("agent"), "output": result[0]["content"]}
         except Exception as e:
-            error_message = f"Execution failed at step {step_num} ({agent_name}): {e}"
-            logging.error(f"--- Executor: FATAL ERROR --- {error_message}")
-            trace.finalize(f"Failed at Step {step_num}")
-            return None, trace
+            scheduler.first_failure = (final_position, e)
 
-    # --- Finalization ---
-    final_output = state.get(f"STEP_{len(plan)}_OUTPUT")
-    trace.finalize("Success", final_output)
-    logging.info("--- [Context Engine] Task Complete ---")
-    return final_output, trace
+    final_output, trace = _finalize_run(trace, plan, scheduler)
+    yield {"event": "done", "status": trace.status, "output": final_output, "trace": trace}
+
+# === 6.5. The Async Engine (asyncio) ===
+async def async_context_engine(goal, client, pc, index_name, generation_model, embedding_model, namespace_context, namespace_knowledge, max_concurrency=1):
+    """
+    Async twin of context_engine for event-loop hosts (e.g. an async web server).
+    'client' must be an AsyncOpenAI client; 'pc' may hand out a blocking or an async index.
+    Many goals can be awaited concurrently from one process without a thread per goal.
+    """
+    logging.info(f"--- [Context Engine] Starting New Async Task --- Goal: {goal}")
+    trace = ExecutionTrace(goal)
+    # Tasks created inside the scope inherit it, so counters still reach this trace.
+    with counter_scope(trace.counters):
+        return await _async_run_goal(trace, goal, client, pc, index_name, generation_model, embedding_model, namespace_context, namespace_knowledge, max_concurrency)
+
+async def _async_execute_step(step, state, registry, dependencies, handler=None):
+    """Async twin of _execute_step."""
+    handler = handler or registry.get_async_handler(step.get("agent"), **dependencies)
+    with step_span("step", step=step.get("step"), agent=step.get("agent")) as timing:
+        mcp_request, resolved_input, t_in, started = _prepare_step(step, state)
+        with span("agent", agent=step.get("agent")):
+            mcp_output = await handler(mcp_request)
+        result = _measure_output(step, mcp_output, resolved_input, t_in, started)
+    return result + (timing.to_dict(),)
+
+async def _async_run_goal(trace, goal, client, pc, index_name, generation_model, embedding_model, namespace_context, namespace_knowledge, max_concurrency=1):
+    registry = AGENT_TOOLKIT
+
+    try:
+        index = pc.Index(index_name)
+        capabilities = registry.get_capabilities_description()
+        with step_span("planner") as timing:
+            plan = await async_planner(goal, capabilities, client=client, generation_model=generation_model)
+        trace.log_plan(plan, spans=timing.to_dict())
+        scheduler = StepScheduler(plan, max_concurrency)
+    except Exception as e:
+        trace.finalize(f"Failed during Planning/Init: {e}")
+        return None, trace
+
+    dependencies = _handler_dependencies(client, index, generation_model, embedding_model, namespace_context, namespace_knowledge)
+    # Tasks created inside the scope copy the current context, so they all see the prefetched results.
+    with prefetch_scope(await _async_prefetch_retrieval(plan, registry, dependencies)):
+        running = {}
+        while scheduler.has_work():
+            for position, step, visible_state in scheduler.next_ready():
+                try:
+                    handler = registry.get_async_handler(step.get("agent"), **dependencies)
+                except Exception as e:
+                    scheduler.fail(position, e)
+                    continue
+                task = asyncio.create_task(_async_execute_step(step, visible_state, registry, dependencies, handler))
+                running[task] = position
+
+            if not running:
+                break
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                position = running.pop(task)
+                try:
+                    scheduler.complete(position, task.result())
+                except Exception as e:
+                    scheduler.fail(position, e)
+            if scheduler.first_failure is not None:
+                # Steps after the failure would never be logged: cancel their in-flight LLM calls.
+                doomed = [task for task, position in running.items() if position > scheduler.limit]
+                for task in doomed:
+                    task.cancel()
+                await asyncio.gather(*doomed, return_exceptions=True)
+                for task in doomed:
+                    scheduler.cancel(running.pop(task))
+            _log_ready_steps(trace, scheduler)
+
+    return _finalize_run(trace, plan, scheduler)
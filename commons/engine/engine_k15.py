@@ -1,8 +1,8 @@
 # === Imports ===
+import copy
 import logging
 import time
 import json
-import copy
 import re
 from helpers import call_llm_robust, create_mcp_message, count_tokens
 from registry import AGENT_TOOLKIT
@@ -32,6 +32,8 @@ class ExecutionTrace:
             "planned_input": planned_input,
             "resolved_context": resolved_input,
             "output": mcp_output.get('content') if isinstance(mcp_output, dict) else mcp_output,
+            # Agent-reported telemetry (e.g. the Researcher's context packing stats)
+            "metadata": mcp_output.get('metadata', {}) if isinstance(mcp_output, dict) else {},
             "tokens_in": tokens_in,
             "tokens_out": tokens_out,
             # Telemetry for cost efficiency: specifically tracking context reduction
@@ -79,39 +81,102 @@ INSTRUCTIONS:
         raise e
 
 # === 6.3. The Executor ===
+# Pattern to match $$STEP_1_OUTPUT$$, $$STEP_2_OUTPUT$$, etc. (compiled once, at import)
+STEP_REFERENCE_PATTERN = re.compile(r"\$\$(STEP_\d+_OUTPUT)\$\$")
+
+class LiteralNode:
+    """
+    A value with no placeholders. Strings and numbers resolve to the planned value itself;
+    dicts and lists resolve to a deep copy, so an agent mutating its input never alters the
+    cached plan (or the next resolution of it), as with the original deep-copying resolver.
+    """
+    references = ()
+
+    def __init__(self, value):
+        self.value = value
+        self.mutable = isinstance(value, (dict, list))
+
+    def resolve(self, state):
+        return copy.deepcopy(self.value) if self.mutable else self.value
+
+class ReferenceNode:
+    """A string that is EXACTLY one placeholder. Resolves to the raw state object (could be dict/list)."""
+    def __init__(self, ref_key, raw):
+        self.ref_key = ref_key
+        self.raw = raw
+        self.references = (ref_key,)
+
+    def resolve(self, state):
+        return state.get(self.ref_key, self.raw)
+
+class TemplateNode:
+    """A string with placeholders embedded in text. Resolves to the text with each replaced by str(output)."""
+    def __init__(self, parts):
+        # parts alternate literal text (even positions) and reference keys (odd positions)
+        self.parts = parts
+        self.references = tuple(parts[1::2])
+
+    def resolve(self, state):
+        pieces = list(self.parts)
+        for i in range(1, len(pieces), 2):
+            ref_key = pieces[i]
+            pieces[i] = str(state.get(ref_key, f"$${ref_key}$$"))
+        return "".join(pieces)
+
+class DictNode:
+    def __init__(self, items):
+        self.items = items
+        self.references = tuple(ref for _, node in items for ref in node.references)
+
+    def resolve(self, state):
+        return {key: node.resolve(state) for key, node in self.items}
+
+class ListNode:
+    def __init__(self, nodes):
+        self.nodes = nodes
+        self.references = tuple(ref for node in nodes for ref in node.references)
+
+    def resolve(self, state):
+        return [node.resolve(state) for node in self.nodes]
+
+def compile_input(value):
+    """
+    Parses a planned input once into a tree of literal and reference nodes.
+    Sub-trees without placeholders collapse into a single LiteralNode, so resolving only
+    walks the parts that hold references (literal dicts and lists are copied whole).
+    """
+    if isinstance(value, str):
+        parts = STEP_REFERENCE_PATTERN.split(value)
+        if len(parts) == 1:
+            return LiteralNode(value)
+        if len(parts) == 3 and not parts[0].strip() and not parts[2].strip():
+            return ReferenceNode(parts[1], value)
+        return TemplateNode(parts)
+    if isinstance(value, dict):
+        items = [(key, compile_input(item)) for key, item in value.items()]
+        if not any(node.references for _, node in items):
+            return LiteralNode(value)
+        return DictNode(items)
+    if isinstance(value, list):
+        nodes = [compile_input(item) for item in value]
+        if not any(node.references for node in nodes):
+            return LiteralNode(value)
+        return ListNode(nodes)
+    return LiteralNode(value)
+
+def compile_plan(plan):
+    """Compiles every step's input at planning time. Returns one node tree per step, in plan order."""
+    return [compile_input(step.get("input")) for step in plan]
+
 def resolve_dependencies(input_params, state):
     """
     Upgraded Resolver: Uses Regex to find $$STEP_N_OUTPUT$$ placeholders within strings,
     making context chaining resilient against extraneous LLM text.
+    UPGRADE: Accepts a pre-compiled node tree (see compile_input); raw inputs are compiled on the fly.
+    Literal dicts and lists are deep-copied, so the plan is never shared with an agent.
     """
-    resolved_input = copy.deepcopy(input_params)
-    # Pattern to match $$STEP_1_OUTPUT$$, $$STEP_2_OUTPUT$$, etc.
-    pattern = r"\$\$(STEP_\d+_OUTPUT)\$\$"
-
-    def resolve(value):
-        if isinstance(value, str):
-            matches = re.findall(pattern, value)
-            if not matches:
-                return value
-            
-            # If the value is EXACTLY one placeholder, return the raw object (could be dict/list)
-            if re.fullmatch(pattern, value.strip()):
-                ref_key = matches[0]
-                return state.get(ref_key, value)
-            
-            # If the placeholder is embedded in text, replace with string representation
-            for ref_key in matches:
-                replacement = str(state.get(ref_key, f"$${ref_key}$$"))
-                value = value.replace(f"$${ref_key}$$", replacement)
-            return value
-            
-        elif isinstance(value, dict):
-            return {k: resolve(v) for k, v in value.items()}
-        elif isinstance(value, list):
-            return [resolve(item) for item in value]
-        return value
-
-    return resolve(resolved_input)
+    node = input_params if hasattr(input_params, "resolve") else compile_input(input_params)
+    return node.resolve(state)
 
 def context_engine(goal, client, pc, index_name, generation_model, embedding_model, namespace_context, namespace_knowledge):
     """
@@ -129,12 +194,14 @@ def context_engine(goal, client, pc, index_name, generation_model, embedding_mod
         
         plan = planner(goal, capabilities, client=client, generation_model=generation_model)
         trace.log_plan(plan)
+        # Parse every step's placeholders once, up front
+        compiled_inputs = compile_plan(plan)
     except Exception as e:
         trace.finalize(f"Init Error: {e}")
         return None, trace
 
     state = {}
-    for step in plan:
+    for step, compiled_input in zip(plan, compiled_inputs):
         step_num = step.get("step")
         agent_name = step.get("agent")
         planned_input = step.get("input")
@@ -151,8 +218,8 @@ def context_engine(goal, client, pc, index_name, generation_model, embedding_mod
                 namespace_knowledge=namespace_knowledge
             )
             
-            # 1. Regex-based Resolution
-            resolved_input = resolve_dependencies(planned_input, state)
+            # 1. Compiled Resolution (placeholders were parsed at planning time)
+            resolved_input = resolve_dependencies(compiled_input, state)
             
             # 2. Token Accountability (Input)
             t_in = count_tokens(str(resolved_input))
@@ -3,10 +3,19 @@
 # === Imports for this section ===
 import logging
 import json
+import os
 import time
 import tiktoken
 import re
 import copy
+import threading
+import asyncio
+import inspect
+import contextvars
+import functools
+import weakref
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from tenacity import retry, stop_after_attempt, wait_random_exponential
 from openai import APIError # Import specific error for better handling
 
@@ -14,14 +23,449 @@ from openai import APIError # Import specific error for better handling
 logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
+# === Telemetry Counters (Scoped per Goal) ===
+# The engine opens a counter scope for each goal so that helpers can report
+# events (e.g. cache hits) to the active ExecutionTrace without extra parameters.
+_ACTIVE_COUNTERS = contextvars.ContextVar("active_counters", default=None)
+_COUNTERS_LOCK = threading.Lock()
+
+@contextmanager
+def counter_scope(counters):
+    """Routes record_counter() calls made inside the block into the given dict."""
+    token = _ACTIVE_COUNTERS.set(counters)
+    try:
+        yield counters
+    finally:
+        _ACTIVE_COUNTERS.reset(token)
+
+def counter_context(counters):
+    """
+    Returns a copy of the current context with the counter scope set. Use it where a
+    'with' block cannot span the work (generators, worker threads): context.run(fn, ...).
+    """
+    context = contextvars.copy_context()
+    context.run(_ACTIVE_COUNTERS.set, counters)
+    return context
+
+def record_counter(name, amount=1):
+    """Increments a named counter in the active scope (no-op outside a scope)."""
+    counters = _ACTIVE_COUNTERS.get()
+    if counters is not None:
+        with _COUNTERS_LOCK:
+            counters[name] = counters.get(name, 0) + amount
+
+# === Timing Spans (Scoped per Step) ===
+# The engine opens a root span for each plan step; the helpers below nest child spans
+# under it (embedding, vector query, sanitization, LLM generation), measured with perf_counter.
+# Outside a step, span() records nothing.
+_ACTIVE_SPAN = contextvars.ContextVar("active_span", default=None)
+
+class Span:
+    """A timed operation with nested children, plus the tenacity retries and backoff sleep it absorbed."""
+    def __init__(self, name, **attrs):
+        self.name = name
+        self.attrs = attrs
+        self.children = []
+        self.retries = 0
+        self.backoff = 0.0
+        self.start = time.perf_counter()
+        self.end = None
+
+    def finish(self):
+        if self.end is None:
+            self.end = time.perf_counter()
+        return self
+
+    @property
+    def duration(self):
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def to_dict(self, origin=None):
+        """Serializes the span tree; start_ms is relative to the root span's start."""
+        origin = self.start if origin is None else origin
+        return {
+            "name": self.name,
+            "attrs": self.attrs,
+            "start_ms": round((self.start - origin) * 1000, 3),
+            "duration_ms": round(self.duration * 1000, 3),
+            "retries": self.retries,
+            "backoff_ms": round(self.backoff * 1000, 3),
+            "children": [child.to_dict(origin) for child in list(self.children)],
+        }
+
+def activate_span(root):
+    """Makes 'root' the active span of the current context (None clears it). Returns the ContextVar token."""
+    return _ACTIVE_SPAN.set(root)
+
+@contextmanager
+def step_span(name, **attrs):
+    """Opens a root span for the block (the engine uses one per plan step)."""
+    root = Span(name, **attrs)
+    token = activate_span(root)
+    try:
+        yield root
+    finally:
+        root.finish()
+        _ACTIVE_SPAN.reset(token)
+
+@contextmanager
+def span(name, **attrs):
+    """Times the block as a child of the active span (no-op outside a step)."""
+    parent = _ACTIVE_SPAN.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(name, **attrs)
+    parent.children.append(child)
+    token = _ACTIVE_SPAN.set(child)
+    try:
+        yield child
+    finally:
+        child.finish()
+        _ACTIVE_SPAN.reset(token)
+
+def timed(name):
+    """Decorator: runs every call of a (sync or async) function inside span(name)."""
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def _record_retry(retry_state):
+    """tenacity before_sleep hook: charges the retry and its backoff sleep to the active span and counters."""
+    sleep = retry_state.next_action.sleep if retry_state.next_action is not None else 0.0
+    current = _ACTIVE_SPAN.get()
+    if current is not None:
+        with _COUNTERS_LOCK:
+            current.retries += 1
+            current.backoff += sleep
+    record_counter("retries")
+    record_counter("retry_backoff_ms", int(sleep * 1000))
+    logging.info(f"Retrying {getattr(retry_state.fn, '__name__', 'call')} (attempt {retry_state.attempt_number} failed); backing off {sleep:.2f}s.")
+
+# === Prefetched Retrieval (Scoped per Goal) ===
+# The engine can fan out a plan's retrieval queries up front (query_namespaces);
+# query_pinecone then serves matching queries from the prefetched results.
+_PREFETCHED_MATCHES = contextvars.ContextVar("prefetched_matches", default=None)
+
+def set_prefetched_matches(prefetched):
+    """
+    Installs prefetched results, {(namespace, query_text): (top_k, matches)}, for the current context.
+    Returns the ContextVar token. Use prefetch_scope() where a 'with' block fits.
+    """
+    return _PREFETCHED_MATCHES.set(prefetched)
+
+@contextmanager
+def prefetch_scope(prefetched):
+    token = set_prefetched_matches(prefetched)
+    try:
+        yield prefetched
+    finally:
+        _PREFETCHED_MATCHES.reset(token)
+
+def _prefetched_matches(query_text, namespace, top_k):
+    prefetched = _PREFETCHED_MATCHES.get()
+    if not prefetched:
+        return None
+    entry = prefetched.get((namespace, query_text))
+    if entry is None or entry[0] < top_k:
+        return None
+    record_counter("retrieval_prefetch_hits")
+    return entry[1][:top_k]
+
+# === Response Cache (Optional) ===
+# Any object exposing make_key(), get() and set() works (see cache.ResponseCache).
+_RESPONSE_CACHE = None
+
+def set_response_cache(cache):
+    """Installs (or removes, with None) the process-wide cache used by call_llm_robust."""
+    global _RESPONSE_CACHE
+    _RESPONSE_CACHE = cache
+    logging.info(f"Response cache {'enabled' if cache is not None else 'disabled'}.")
+
+# === Rate Limiting (Optional) ===
+# Any object exposing acquire(), async_acquire(), settle() and pause() works (see rate_limiter.RateLimiter).
+# Each request attempt is metered before it is sent, using the count_tokens estimate.
+_RATE_LIMITER = None
+_ACTIVE_LANE = contextvars.ContextVar("priority_lane", default="default")
+
+def set_rate_limiter(limiter):
+    """Installs (or removes, with None) the process-wide rate limiter shared by LLM and embedding calls."""
+    global _RATE_LIMITER
+    _RATE_LIMITER = limiter
+    logging.info(f"Rate limiter {'enabled' if limiter is not None else 'disabled'}.")
+
+@contextmanager
+def priority_lane(lane):
+    """Queues every metered call made inside the block in the given lane (e.g. "planner", "bulk")."""
+    token = _ACTIVE_LANE.set(lane)
+    try:
+        yield lane
+    finally:
+        _ACTIVE_LANE.reset(token)
+
+def _throttle(model, *texts):
+    """Waits for rate-limit capacity for one request. Returns the token estimate that was charged."""
+    limiter = _RATE_LIMITER
+    if limiter is None:
+        return 0
+    estimate = sum(count_tokens(text, model) for text in texts)
+    waited_ms = int(limiter.acquire(model, estimate, lane=_ACTIVE_LANE.get()) * 1000)
+    if waited_ms:
+        record_counter("rate_limit_wait_ms", waited_ms)
+    return estimate
+
+async def _async_throttle(model, *texts):
+    limiter = _RATE_LIMITER
+    if limiter is None:
+        return 0
+    estimate = sum(count_tokens(text, model) for text in texts)
+    waited_ms = int(await limiter.async_acquire(model, estimate, lane=_ACTIVE_LANE.get()) * 1000)
+    if waited_ms:
+        record_counter("rate_limit_wait_ms", waited_ms)
+    return estimate
+
+def _settle_usage(model, estimate, response):
+    """Corrects the limiter with the usage the API reported (when it reports any)."""
+    total = getattr(getattr(response, "usage", None), "total_tokens", None)
+    if _RATE_LIMITER is not None and isinstance(total, int):
+        _RATE_LIMITER.settle(model, total - estimate)
+
+def _on_rate_limited(model, error):
+    """On a 429, pauses the model's queue for Retry-After so queued calls do not pile onto the retry."""
+    if _RATE_LIMITER is None or getattr(error, "status_code", None) != 429:
+        return
+    try:
+        retry_after = float(error.response.headers.get("retry-after", 1.0))
+    except Exception:
+        retry_after = 1.0
+    _RATE_LIMITER.pause(model, retry_after)
+
+# === Request Coalescing (Single-flight) ===
+# Concurrent identical requests (same prompts/model, or same text/embedding model) share
+# one upstream call: the first caller makes it, the others wait and receive its result
+# (or its exception). Unlike the caches, this also catches duplicates that are in flight.
+class SingleFlight:
+    """Thread-based single-flight group: do(key, fn) runs fn once per key among concurrent callers."""
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args):
+        """Returns (result, shared). 'shared' is True when this caller reused another caller's call."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = {"done": threading.Event(), "result": None, "error": None}
+                self._calls[key] = call
+        if not leader:
+            call["done"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"], True
+        try:
+            call["result"] = fn(*args)
+            return call["result"], False
+        except BaseException as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call["done"].set()
+
+class AsyncSingleFlight:
+    """asyncio twin of SingleFlight (one group per event loop)."""
+    def __init__(self):
+        self._calls = weakref.WeakKeyDictionary()
+
+    async def do(self, key, fn, *args):
+        calls = self._calls.setdefault(asyncio.get_running_loop(), {})
+        future = calls.get(key)
+        if future is not None:
+            # shield: a cancelled follower must not cancel the shared call.
+            return await asyncio.shield(future), True
+        future = asyncio.ensure_future(fn(*args))
+        calls[key] = future
+        future.add_done_callback(lambda _: calls.pop(key, None))
+        return await asyncio.shield(future), False
+
+_SINGLE_FLIGHT = SingleFlight()
+_ASYNC_SINGLE_FLIGHT = AsyncSingleFlight()
+_SINGLE_FLIGHT_ENABLED = True
+
+def set_single_flight(enabled):
+    """Turns request coalescing on or off for call_llm_robust and get_embedding (on by default)."""
+    global _SINGLE_FLIGHT_ENABLED
+    _SINGLE_FLIGHT_ENABLED = bool(enabled)
+    logging.info(f"Request coalescing {'enabled' if enabled else 'disabled'}.")
+
+def _coalesced(counter, key, fn, *args):
+    if not _SINGLE_FLIGHT_ENABLED:
+        return fn(*args)
+    result, shared = _SINGLE_FLIGHT.do(key, fn, *args)
+    if shared:
+        record_counter(counter)
+    return result
+
+async def _async_coalesced(counter, key, fn, *args):
+    if not _SINGLE_FLIGHT_ENABLED:
+        return await fn(*args)
+    result, shared = await _ASYNC_SINGLE_FLIGHT.do(key, fn, *args)
+    if shared:
+        record_counter(counter)
+    return result
+
+# Keys include the client's identity: clients may differ in endpoint, credentials or
+# organization, so only callers sharing a client may share its calls.
+def _llm_flight_key(system_prompt, user_prompt, client, generation_model, json_mode):
+    return ("llm", id(client), system_prompt, user_prompt, generation_model, bool(json_mode))
+
+def _embedding_flight_key(text, client, embedding_model):
+    # Same normalization as the request itself, so texts that embed identically coalesce.
+    return ("embedding", id(client), embedding_model, text.replace("\n", " "))
+
 # === LLM Interaction (Hardened with Dependency Injection) ===
-@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(6))
-def call_llm_robust(system_prompt, user_prompt, client, generation_model, json_mode=False):
+def call_llm_robust(system_prompt, user_prompt, client, generation_model, json_mode=False, cache=None, stream=False):
     """
     A centralized function to handle all LLM interactions with retries.
     UPGRADE: Now requires the 'client' and 'generation_model' objects to be passed in.
+    UPGRADE: Byte-identical requests are served from the response cache when one is configured.
+    UPGRADE: stream=True returns a generator of text deltas instead of the full string.
     """
+    cache = cache if cache is not None else _RESPONSE_CACHE
+    if stream:
+        return _stream_llm(system_prompt, user_prompt, client, generation_model, json_mode, cache)
+    return _complete_llm(system_prompt, user_prompt, client, generation_model, json_mode, cache)
+
+@timed("llm")
+def _complete_llm(system_prompt, user_prompt, client, generation_model, json_mode, cache):
+    """The non-streaming path of call_llm_robust (response cache, then a coalesced API call)."""
+    flight_key = _llm_flight_key(system_prompt, user_prompt, client, generation_model, json_mode)
+    if cache is None:
+        return _coalesced("llm_coalesced", flight_key, _call_llm_with_retries, system_prompt, user_prompt, client, generation_model, json_mode)
+
+    cache_key = cache.make_key(system_prompt, user_prompt, generation_model, json_mode)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        logging.info("LLM response served from cache.")
+        record_counter("llm_cache_hits")
+        return cached
+
+    record_counter("llm_cache_misses")
+    content = _coalesced("llm_coalesced", flight_key, _call_llm_with_retries, system_prompt, user_prompt, client, generation_model, json_mode)
+    cache.set(cache_key, content)
+    return content
+
+def _stream_llm(system_prompt, user_prompt, client, generation_model, json_mode, cache):
+    """Yields the completion as it is generated. A cached response is yielded as one delta."""
+    # The generator is resumed from the caller's frames, so the span is attached by hand, not entered.
+    parent = _ACTIVE_SPAN.get()
+    timing = Span("llm_stream", model=generation_model)
+    if parent is not None:
+        parent.children.append(timing)
+    cache_key = cache.make_key(system_prompt, user_prompt, generation_model, json_mode) if cache is not None else None
+    if cache is not None:
+        cached = cache.get(cache_key)
+        if cached is not None:
+            logging.info("LLM response served from cache.")
+            record_counter("llm_cache_hits")
+            timing.finish()
+            yield cached
+            return
+        record_counter("llm_cache_misses")
+
+    # Only opening the stream is retried; once tokens flow, a failure is surfaced to the caller.
+    token = _ACTIVE_SPAN.set(timing)
+    try:
+        response, estimate = _open_llm_stream(system_prompt, user_prompt, client, generation_model, json_mode)
+    finally:
+        _ACTIVE_SPAN.reset(token)
+    # The deltas are trimmed like the non-streamed (and cached) text: leading whitespace is dropped
+    # and trailing whitespace is held back until more text follows, so "".join(deltas) == text.strip().
+    parts = []
+    held = ""
+    usage = None
+    try:
+        for chunk in response:
+            # With include_usage the API reports usage on a final chunk that has no choices.
+            usage = getattr(chunk, "usage", None) or usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not parts and delta:
+                delta = delta.lstrip()
+            if delta:
+                text = held + delta
+                delta = text.rstrip()
+                held = text[len(delta):]
+            if delta:
+                if not parts:
+                    timing.attrs["first_token_ms"] = round(timing.duration * 1000, 3)
+                parts.append(delta)
+                yield delta
+    except Exception as e:
+        logging.error(f"LLM stream interrupted: {e}")
+        raise e
+    finally:
+        timing.finish()
+    logging.info("LLM stream completed.")
+    text = "".join(parts)
+    _settle_stream_usage(generation_model, estimate, usage, text)
+    if cache is not None:
+        cache.set(cache_key, text)
+
+def _settle_stream_usage(model, estimate, usage, text):
+    """Corrects the limiter once a stream ends; without reported usage, the generated text is counted."""
+    if _RATE_LIMITER is None:
+        return
+    total = getattr(usage, "total_tokens", None)
+    if not isinstance(total, int):
+        total = estimate + count_tokens(text, model)
+    _RATE_LIMITER.settle(model, total - estimate)
+
+@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(6), before_sleep=_record_retry)
+def _open_llm_stream(system_prompt, user_prompt, client, generation_model, json_mode=False):
+    """Opens a streaming chat completion (retried by tenacity). Returns (stream, charged token estimate)."""
+    logging.info("Attempting to open LLM stream...")
+    estimate = _throttle(generation_model, system_prompt, user_prompt)
+    try:
+        response_format = {"type": "json_object"} if json_mode else {"type": "text"}
+        response = client.chat.completions.create(
+            model=generation_model,
+            response_format=response_format,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        return response, estimate
+    except APIError as e:
+        _on_rate_limited(generation_model, e)
+        logging.error(f"OpenAI API Error while opening LLM stream: {e}")
+        raise e
+    except Exception as e:
+        logging.error(f"An unexpected error occurred while opening LLM stream: {e}")
+        raise e
+
+@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(6), before_sleep=_record_retry)
+def _call_llm_with_retries(system_prompt, user_prompt, client, generation_model, json_mode=False):
+    """Performs the actual chat completion request (retried by tenacity)."""
     logging.info("Attempting to call LLM...")
+    estimate = _throttle(generation_model, system_prompt, user_prompt)
     try:
         response_format = {"type": "json_object"} if json_mode else {"type": "text"}
         # UPGRADE: Uses the passed-in client and model name for the API call.
@@ -33,28 +477,62 @@ def call_llm_robust(system_prompt, user_prompt, client, generation_model, json_m
                 {"role": "user", "content": user_prompt}
             ],
         )
+        _settle_usage(generation_model, estimate, response)
         logging.info("LLM call successful.")
         return response.choices[0].message.content.strip()
     except APIError as e:
+        _on_rate_limited(generation_model, e)
         logging.error(f"OpenAI API Error in call_llm_robust: {e}")
         raise e
     except Exception as e:
         logging.error(f"An unexpected error occurred in call_llm_robust: {e}")
         raise e
 
+# === Embedding Cache (Optional) ===
+# Any object exposing get(text, model) and set(text, model, embedding) works (see cache.EmbeddingCache).
+_EMBEDDING_CACHE = None
+
+def set_embedding_cache(cache):
+    """Installs (or removes, with None) the process-wide cache used by get_embedding."""
+    global _EMBEDDING_CACHE
+    _EMBEDDING_CACHE = cache
+    logging.info(f"Embedding cache {'enabled' if cache is not None else 'disabled'}.")
+
 # === Embeddings (Hardened with Dependency Injection) ===
-@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(6))
-def get_embedding(text, client, embedding_model):
+@timed("embedding")
+def get_embedding(text, client, embedding_model, cache=None):
     """
     Generates embeddings for a single text query with retries.
     UPGRADE: Now requires the 'client' and 'embedding_model' objects.
+    UPGRADE: Repeated queries are served from the embedding cache when one is configured.
     """
+    cache = cache if cache is not None else _EMBEDDING_CACHE
+    flight_key = _embedding_flight_key(text, client, embedding_model)
+    if cache is None:
+        return _coalesced("embedding_coalesced", flight_key, _get_embedding_with_retries, text, client, embedding_model)
+
+    cached = cache.get(text, embedding_model)
+    if cached is not None:
+        record_counter("embedding_cache_hits")
+        return cached
+
+    record_counter("embedding_cache_misses")
+    embedding = _coalesced("embedding_coalesced", flight_key, _get_embedding_with_retries, text, client, embedding_model)
+    cache.set(text, embedding_model, embedding)
+    return embedding
+
+@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(6), before_sleep=_record_retry)
+def _get_embedding_with_retries(text, client, embedding_model):
+    """Performs the actual embeddings request (retried by tenacity)."""
     text = text.replace("\n", " ")
+    estimate = _throttle(embedding_model, text)
     try:
         # UPGRADE: Uses the passed-in client and model name.
         response = client.embeddings.create(input=[text], model=embedding_model)
+        _settle_usage(embedding_model, estimate, response)
         return response.data[0].embedding
     except APIError as e:
+        _on_rate_limited(embedding_model, e)
         logging.error(f"OpenAI API Error in get_embedding: {e}")
         raise e
     except Exception as e:
@@ -72,65 +550,553 @@ def create_mcp_message(sender, content, metadata=None):
     }
 
 # === Pinecone Interaction (Hardened with Dependency Injection) ===
+@timed("vector_query")
 def query_pinecone(query_text, namespace, top_k, index, client, embedding_model):
     """
     Embeds the query text and searches the specified Pinecone namespace.
     UPGRADE: Now requires 'index', 'client', and 'embedding_model' objects.
     """
     logging.info(f"Querying Pinecone namespace '{namespace}'...")
+    prefetched = _prefetched_matches(query_text, namespace, top_k)
+    if prefetched is not None:
+        logging.info("Pinecone results served from the retrieval fan-out.")
+        return prefetched
     try:
         # UPGRADE: Passes the necessary dependencies down to get_embedding.
         query_embedding = get_embedding(query_text, client=client, embedding_model=embedding_model)
         # UPGRADE: Uses the passed-in index object for the query.
-        response = index.query(
-            vector=query_embedding,
-            namespace=namespace,
-            top_k=top_k,
-            include_metadata=True
+        with span("index_query", namespace=namespace):
+            response = index.query(
+                vector=query_embedding,
+                namespace=namespace,
+                top_k=top_k,
+                include_metadata=True
+            )
+        logging.info("Pinecone query successful.")
+        return response['matches']
+    except Exception as e:
+        logging.error(f"Error querying Pinecone (Namespace: {namespace}): {e}")
+        raise e
+
+# === Retrieval Fan-out ===
+@timed("embeddings")
+def get_embeddings(texts, client, embedding_model, cache=None):
+    """
+    Embeds several texts in ONE batched embeddings request (cached texts are skipped).
+    Returns the vectors in input order.
+    """
+    cache = cache if cache is not None else _EMBEDDING_CACHE
+    embeddings = [None] * len(texts)
+    missing = []
+    for i, text in enumerate(texts):
+        cached = cache.get(text, embedding_model) if cache is not None else None
+        if cached is not None:
+            record_counter("embedding_cache_hits")
+            embeddings[i] = cached
+        else:
+            missing.append(i)
+
+    if missing:
+        if cache is not None:
+            record_counter("embedding_cache_misses", len(missing))
+        batch = [texts[i] for i in missing]
+        flight_key = ("embeddings", id(client), embedding_model) + tuple(text.replace("\n", " ") for text in batch)
+        fresh = _coalesced("embedding_coalesced", flight_key, _get_embeddings_with_retries, batch, client, embedding_model)
+        for i, embedding in zip(missing, fresh):
+            embeddings[i] = embedding
+            if cache is not None:
+                cache.set(texts[i], embedding_model, embedding)
+    return embeddings
+
+@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(6), before_sleep=_record_retry)
+def _get_embeddings_with_retries(texts, client, embedding_model):
+    """Performs one batched embeddings request (retried by tenacity)."""
+    estimate = _throttle(embedding_model, *texts)
+    try:
+        response = client.embeddings.create(input=[text.replace("\n", " ") for text in texts], model=embedding_model)
+        _settle_usage(embedding_model, estimate, response)
+        # The API returns one item per input; sort by index rather than trusting the order.
+        data = sorted(response.data, key=lambda item: getattr(item, "index", 0))
+        return [item.embedding for item in data]
+    except APIError as e:
+        _on_rate_limited(embedding_model, e)
+        logging.error(f"OpenAI API Error in get_embeddings: {e}")
+        raise e
+    except Exception as e:
+        logging.error(f"An unexpected error occurred in get_embeddings: {e}")
+        raise e
+
+def _normalize_queries(queries, top_k):
+    """Accepts {namespace: query_text} or {namespace: (query_text, top_k)}."""
+    return {
+        namespace: (query, top_k) if isinstance(query, str) else (query[0], query[1])
+        for namespace, query in queries.items()
+    }
+
+@timed("vector_fanout")
+def query_namespaces(queries, index, client, embedding_model, top_k=3):
+    """
+    Retrieval fan-out: embeds every query string in one batched request, then queries
+    all namespaces concurrently. 'queries' maps namespace -> query_text (or (query_text, top_k)).
+    Returns {namespace: matches}.
+    """
+    queries = _normalize_queries(queries, top_k)
+    logging.info(f"Querying Pinecone namespaces {list(queries)} (fan-out)...")
+    try:
+        texts = list(dict.fromkeys(query for query, _ in queries.values()))
+        vectors = dict(zip(texts, get_embeddings(texts, client=client, embedding_model=embedding_model)))
+
+        def query_one(namespace):
+            query, k = queries[namespace]
+            with span("index_query", namespace=namespace):
+                response = index.query(vector=vectors[query], namespace=namespace, top_k=k, include_metadata=True)
+            return response['matches']
+
+        with ThreadPoolExecutor(max_workers=len(queries) or 1) as pool:
+            futures = {namespace: pool.submit(contextvars.copy_context().run, query_one, namespace) for namespace in queries}
+            results = {namespace: future.result() for namespace, future in futures.items()}
+        logging.info("Pinecone fan-out successful.")
+        return results
+    except Exception as e:
+        logging.error(f"Error in Pinecone fan-out (Namespaces: {list(queries)}): {e}")
+        raise e
+
+# === Async Twins (for the asyncio engine) ===
+# These mirror call_llm_robust, get_embedding and query_pinecone for an
+# AsyncOpenAI client, so one event loop can hold many in-flight goals.
+# The response and embedding caches are shared with the blocking helpers.
+@timed("llm")
+async def async_call_llm_robust(system_prompt, user_prompt, client, generation_model, json_mode=False, cache=None):
+    """Async twin of call_llm_robust. Requires an AsyncOpenAI 'client'."""
+    cache = cache if cache is not None else _RESPONSE_CACHE
+    flight_key = _llm_flight_key(system_prompt, user_prompt, client, generation_model, json_mode)
+    if cache is None:
+        return await _async_coalesced("llm_coalesced", flight_key, _async_call_llm_with_retries, system_prompt, user_prompt, client, generation_model, json_mode)
+
+    cache_key = cache.make_key(system_prompt, user_prompt, generation_model, json_mode)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        logging.info("LLM response served from cache.")
+        record_counter("llm_cache_hits")
+        return cached
+
+    record_counter("llm_cache_misses")
+    content = await _async_coalesced("llm_coalesced", flight_key, _async_call_llm_with_retries, system_prompt, user_prompt, client, generation_model, json_mode)
+    cache.set(cache_key, content)
+    return content
+
+@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(6), before_sleep=_record_retry)
+async def _async_call_llm_with_retries(system_prompt, user_prompt, client, generation_model, json_mode=False):
+    """Performs the actual async chat completion request (tenacity awaits between attempts)."""
+    logging.info("Attempting to call LLM (async)...")
+    estimate = await _async_throttle(generation_model, system_prompt, user_prompt)
+    try:
+        response_format = {"type": "json_object"} if json_mode else {"type": "text"}
+        response = await client.chat.completions.create(
+            model=generation_model,
+            response_format=response_format,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
         )
+        _settle_usage(generation_model, estimate, response)
+        logging.info("LLM call successful.")
+        return response.choices[0].message.content.strip()
+    except APIError as e:
+        _on_rate_limited(generation_model, e)
+        logging.error(f"OpenAI API Error in async_call_llm_robust: {e}")
+        raise e
+    except Exception as e:
+        logging.error(f"An unexpected error occurred in async_call_llm_robust: {e}")
+        raise e
+
+@timed("embedding")
+async def async_get_embedding(text, client, embedding_model, cache=None):
+    """Async twin of get_embedding. Requires an AsyncOpenAI 'client'."""
+    cache = cache if cache is not None else _EMBEDDING_CACHE
+    flight_key = _embedding_flight_key(text, client, embedding_model)
+    if cache is None:
+        return await _async_coalesced("embedding_coalesced", flight_key, _async_get_embedding_with_retries, text, client, embedding_model)
+
+    cached = cache.get(text, embedding_model)
+    if cached is not None:
+        record_counter("embedding_cache_hits")
+        return cached
+
+    record_counter("embedding_cache_misses")
+    embedding = await _async_coalesced("embedding_coalesced", flight_key, _async_get_embedding_with_retries, text, client, embedding_model)
+    cache.set(text, embedding_model, embedding)
+    return embedding
+
+@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(6), before_sleep=_record_retry)
+async def _async_get_embedding_with_retries(text, client, embedding_model):
+    """Performs the actual async embeddings request (retried by tenacity)."""
+    text = text.replace("\n", " ")
+    estimate = await _async_throttle(embedding_model, text)
+    try:
+        response = await client.embeddings.create(input=[text], model=embedding_model)
+        _settle_usage(embedding_model, estimate, response)
+        return response.data[0].embedding
+    except APIError as e:
+        _on_rate_limited(embedding_model, e)
+        logging.error(f"OpenAI API Error in async_get_embedding: {e}")
+        raise e
+    except Exception as e:
+        logging.error(f"An unexpected error occurred in async_get_embedding: {e}")
+        raise e
+
+@timed("vector_query")
+async def async_query_pinecone(query_text, namespace, top_k, index, client, embedding_model):
+    """
+    Async twin of query_pinecone.
+    Works with an async index (e.g. Pinecone's IndexAsyncio) or, for a blocking
+    index, runs the query in a worker thread so the event loop is never blocked.
+    """
+    logging.info(f"Querying Pinecone namespace '{namespace}' (async)...")
+    prefetched = _prefetched_matches(query_text, namespace, top_k)
+    if prefetched is not None:
+        logging.info("Pinecone results served from the retrieval fan-out.")
+        return prefetched
+    try:
+        query_embedding = await async_get_embedding(query_text, client=client, embedding_model=embedding_model)
+        query_kwargs = dict(vector=query_embedding, namespace=namespace, top_k=top_k, include_metadata=True)
+        with span("index_query", namespace=namespace):
+            if inspect.iscoroutinefunction(index.query):
+                response = await index.query(**query_kwargs)
+            else:
+                response = await asyncio.to_thread(index.query, **query_kwargs)
         logging.info("Pinecone query successful.")
         return response['matches']
     except Exception as e:
         logging.error(f"Error querying Pinecone (Namespace: {namespace}): {e}")
         raise e
 
+@timed("embeddings")
+async def async_get_embeddings(texts, client, embedding_model, cache=None):
+    """Async twin of get_embeddings."""
+    cache = cache if cache is not None else _EMBEDDING_CACHE
+    embeddings = [None] * len(texts)
+    missing = []
+    for i, text in enumerate(texts):
+        cached = cache.get(text, embedding_model) if cache is not None else None
+        if cached is not None:
+            record_counter("embedding_cache_hits")
+            embeddings[i] = cached
+        else:
+            missing.append(i)
+
+    if missing:
+        if cache is not None:
+            record_counter("embedding_cache_misses", len(missing))
+        batch = [texts[i] for i in missing]
+        flight_key = ("embeddings", id(client), embedding_model) + tuple(text.replace("\n", " ") for text in batch)
+        fresh = await _async_coalesced("embedding_coalesced", flight_key, _async_get_embeddings_with_retries, batch, client, embedding_model)
+        for i, embedding in zip(missing, fresh):
+            embeddings[i] = embedding
+            if cache is not None:
+                cache.set(texts[i], embedding_model, embedding)
+    return embeddings
+
+@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(6), before_sleep=_record_retry)
+async def _async_get_embeddings_with_retries(texts, client, embedding_model):
+    """Performs one batched async embeddings request (retried by tenacity)."""
+    estimate = await _async_throttle(embedding_model, *texts)
+    try:
+        response = await client.embeddings.create(input=[text.replace("\n", " ") for text in texts], model=embedding_model)
+        _settle_usage(embedding_model, estimate, response)
+        data = sorted(response.data, key=lambda item: getattr(item, "index", 0))
+        return [item.embedding for item in data]
+    except APIError as e:
+        _on_rate_limited(embedding_model, e)
+        logging.error(f"OpenAI API Error in get_embeddings: {e}")
+        raise e
+    except Exception as e:
+        logging.error(f"An unexpected error occurred in get_embeddings: {e}")
+        raise e
+
+@timed("vector_fanout")
+async def async_query_namespaces(queries, index, client, embedding_model, top_k=3):
+    """Async twin of query_namespaces (one batched embedding, namespace queries gathered concurrently)."""
+    queries = _normalize_queries(queries, top_k)
+    logging.info(f"Querying Pinecone namespaces {list(queries)} (async fan-out)...")
+    try:
+        texts = list(dict.fromkeys(query for query, _ in queries.values()))
+        vectors = dict(zip(texts, await async_get_embeddings(texts, client=client, embedding_model=embedding_model)))
+
+        async def query_one(namespace):
+            query, k = queries[namespace]
+            query_kwargs = dict(vector=vectors[query], namespace=namespace, top_k=k, include_metadata=True)
+            with span("index_query", namespace=namespace):
+                if inspect.iscoroutinefunction(index.query):
+                    response = await index.query(**query_kwargs)
+                else:
+                    response = await asyncio.to_thread(index.query, **query_kwargs)
+            return response['matches']
+
+        matches = await asyncio.gather(*(query_one(namespace) for namespace in queries))
+        logging.info("Pinecone fan-out successful.")
+        return dict(zip(queries, matches))
+    except Exception as e:
+        logging.error(f"Error in Pinecone fan-out (Namespaces: {list(queries)}): {e}")
+        raise e
+
 # === Context Management Utility (New) ===
+# UPGRADE: Encodings are resolved once per model and reused; tiktoken lookups
+# are far more expensive than encoding the short strings the engine counts.
+_ENCODINGS = {}
+_ENCODINGS_LOCK = threading.Lock()
+# Any object exposing encode(), encode_batch() and decode_batch() works (see benchmark.OfflineEncoding).
+_TOKEN_ENCODING = None
+
+def set_token_encoding(encoding):
+    """
+    Installs (or removes, with None) one encoding used for every model instead of tiktoken's,
+    e.g. an offline stand-in where tiktoken cannot download its files. Returns the previous one.
+    """
+    global _TOKEN_ENCODING
+    previous, _TOKEN_ENCODING = _TOKEN_ENCODING, encoding
+    logging.info(f"Token encoding override {'enabled' if encoding is not None else 'disabled'}.")
+    return previous
+
+def get_encoding_for_model(model="gpt-5.1"):
+    """Returns the (memoized) tiktoken encoding for a model, falling back to cl100k_base."""
+    if _TOKEN_ENCODING is not None:
+        return _TOKEN_ENCODING
+    encoding = _ENCODINGS.get(model)
+    if encoding is None:
+        with _ENCODINGS_LOCK:
+            encoding = _ENCODINGS.get(model)
+            if encoding is None:
+                try:
+                    encoding = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    # Fallback for models that might not be in the tiktoken registry
+                    encoding = _ENCODINGS.get("cl100k_base") or tiktoken.get_encoding("cl100k_base")
+                    _ENCODINGS["cl100k_base"] = encoding
+                _ENCODINGS[model] = encoding
+    return encoding
+
 def count_tokens(text, model="gpt-5.1"):
     """Counts the number of tokens in a text string for a given model."""
-    try:
-        encoding = tiktoken.encoding_for_model(model)
-    except KeyError:
-        # Fallback for models that might not be in the tiktoken registry
-        encoding = tiktoken.get_encoding("cl100k_base")
-    return len(encoding.encode(text))
+    return len(get_encoding_for_model(model).encode(text))
+
+def count_tokens_many(texts, model="gpt-5.1"):
+    """Counts tokens for a list of strings in one encode_batch call (returns a list of counts)."""
+    if not texts:
+        return []
+    return [len(tokens) for tokens in get_encoding_for_model(model).encode_batch(list(texts))]
+
+def split_by_tokens(text, chunk_tokens, model="gpt-5.1"):
+    """Splits text into consecutive pieces of at most chunk_tokens tokens (decoded back to strings)."""
+    encoding = get_encoding_for_model(model)
+    tokens = encoding.encode(text)
+    if len(tokens) <= chunk_tokens:
+        return [text]
+    return encoding.decode_batch([tokens[i:i + chunk_tokens] for i in range(0, len(tokens), chunk_tokens)])
+
+# === Context Packing Utility (Token Budget) ===
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+_WORD = re.compile(r"\w+")
+
+def _shingles(text, size=5):
+    """Word n-gram fingerprint used to spot near-duplicate chunks."""
+    words = _WORD.findall(text.lower())
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def _truncate_to_sentences(text, token_budget, model):
+    """Keeps whole leading sentences of text while they fit in token_budget."""
+    kept = []
+    used = 0
+    sentences = _SENTENCE_BOUNDARY.split(text)
+    for sentence, tokens in zip(sentences, count_tokens_many(sentences, model)):
+        # +1 accounts for the joining space between sentences
+        if used + tokens + 1 > token_budget:
+            break
+        kept.append(sentence)
+        used += tokens + 1
+    return " ".join(kept)
+
+def pack_context(matches, token_budget, model="gpt-5.1", dedup_threshold=0.8,
+                 format_chunk=lambda source, text: f"SOURCE: {source}\nCONTENT: {text}", separator="\n\n"):
+    """
+    Greedily packs ranked retrieval matches into a token budget.
+    - Matches are taken in rank order; near-duplicates (shingle Jaccard >= dedup_threshold) are dropped.
+    - A chunk that no longer fits whole is truncated at a sentence boundary; after that, packing stops.
+    - If the top chunk has no sentence that fits, it is cut at the token budget instead, so the
+      context is never empty when there are matches.
+    Returns (packed_text, stats) where stats records packed vs discarded tokens.
+    """
+    entries = [format_chunk(m['metadata'].get('source'), m['metadata'].get('text', '')) for m in matches]
+    entry_tokens = count_tokens_many(entries, model)
+    separator_tokens = count_tokens(separator, model)
+
+    packed, fingerprints = [], []
+    stats = {"token_budget": token_budget, "tokens_packed": 0, "tokens_discarded": 0,
+             "chunks_packed": 0, "chunks_truncated": 0, "chunks_duplicate": 0, "chunks_dropped": 0}
+    used = 0
+    budget_exhausted = False
+    for match, entry, tokens in zip(matches, entries, entry_tokens):
+        if budget_exhausted:
+            stats["chunks_dropped"] += 1
+            stats["tokens_discarded"] += tokens
+            continue
+
+        fingerprint = _shingles(match['metadata'].get('text', ''))
+        if any(fingerprint and len(fingerprint & seen) / len(fingerprint | seen) >= dedup_threshold for seen in fingerprints):
+            stats["chunks_duplicate"] += 1
+            stats["tokens_discarded"] += tokens
+            continue
+
+        cost = tokens + (separator_tokens if packed else 0)
+        if used + cost <= token_budget:
+            packed.append(entry)
+            fingerprints.append(fingerprint)
+            used += cost
+            stats["chunks_packed"] += 1
+            continue
+
+        # Does not fit whole: keep what fits of it at a sentence boundary, then stop.
+        budget_exhausted = True
+        remaining = token_budget - used - (separator_tokens if packed else 0)
+        truncated = _truncate_to_sentences(entry, remaining, model) if remaining > 0 else ""
+        if not truncated and not packed:
+            # Nothing packed yet and no sentence fits: hard-cut the top chunk rather than return no context.
+            truncated = split_by_tokens(entry, max(1, remaining), model)[0]
+        if truncated:
+            truncated_tokens = count_tokens(truncated, model)
+            packed.append(truncated)
+            used += truncated_tokens + (separator_tokens if len(packed) > 1 else 0)
+            stats["chunks_truncated"] += 1
+            stats["tokens_discarded"] += max(0, tokens - truncated_tokens)
+        else:
+            stats["chunks_dropped"] += 1
+            stats["tokens_discarded"] += tokens
 
+    stats["tokens_packed"] = used
+    logging.info(f"[Packer] Packed {stats['chunks_packed']} chunks ({used}/{token_budget} tokens), "
+                 f"discarded {stats['tokens_discarded']} tokens.")
+    return separator.join(packed), stats
 
 # === Security Utility (New for Chapter 7) ===
+# List of simple, high-confidence patterns to detect injection attempts
+DEFAULT_INJECTION_PATTERNS = [
+    r"ignore previous instructions",
+    r"ignore all prior commands",
+    r"you are now in.*mode",
+    r"act as",
+    r"ignore any legal advice",
+    r"print your instructions",
+    # A simple pattern to catch attempts to inject system-level commands
+    r"sudo|apt-get|yum|pip install"
+]
+
+# A global inline flag such as (?i) or (?x) would leak into (or break) a combined alternation.
+_GLOBAL_INLINE_FLAGS = re.compile(r"\(\?[aiLmsux]+\)")
+
+def _compile_injection_pattern(pattern, position):
+    """Compiles one pattern (case-insensitive), raising a ValueError that names the offending entry."""
+    if not isinstance(pattern, str):
+        raise ValueError(f"Injection pattern #{position} must be a string, got {type(pattern).__name__}: {pattern!r}")
+    try:
+        return re.compile(pattern, re.IGNORECASE)
+    except re.error as e:
+        raise ValueError(f"Invalid injection pattern #{position} {pattern!r}: {e}") from e
+
+class InjectionScanner:
+    """
+    UPGRADE: Every pattern is compiled (and validated) on its own, and matched in list
+    order like the original loop, so groups, backreferences and inline flags behave as
+    written. When the patterns can be safely combined, one case-insensitive alternation
+    pre-screens each text in a single pass: clean texts (the common case) never reach
+    the per-pattern loop.
+    """
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self._compiled = [_compile_injection_pattern(pattern, i) for i, pattern in enumerate(self.patterns)]
+        self._prefilter = None
+        if self._compiled and all(c.groups == 0 and not _GLOBAL_INLINE_FLAGS.search(c.pattern) for c in self._compiled):
+            try:
+                self._prefilter = re.compile("|".join(f"(?:{c.pattern})" for c in self._compiled), re.IGNORECASE)
+            except re.error:
+                self._prefilter = None
+
+    def scan(self, text):
+        """Returns the first pattern (in list order) that matches the text, or None if clean."""
+        if self._prefilter is not None and self._prefilter.search(text) is None:
+            return None
+        for pattern, compiled in zip(self.patterns, self._compiled):
+            if compiled.search(text):
+                return pattern
+        return None
+
+def load_injection_patterns(path):
+    """
+    Loads a pattern set from a JSON file: either a list of regexes or {"patterns": [...]}.
+    Every pattern is compiled up front; a bad one raises a ValueError naming it and the file.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    patterns = data["patterns"] if isinstance(data, dict) else data
+    for i, pattern in enumerate(patterns):
+        try:
+            _compile_injection_pattern(pattern, i)
+        except ValueError as e:
+            raise ValueError(f"{path}: {e}") from e
+    return patterns
+
+def configure_injection_patterns(patterns):
+    """Replaces the active pattern set (compiled once, shared by all sanitizer calls)."""
+    global _INJECTION_SCANNER
+    _INJECTION_SCANNER = InjectionScanner(patterns)
+    logging.info(f"[Sanitizer] Loaded {len(_INJECTION_SCANNER.patterns)} injection patterns.")
+
+# The pattern set is compiled at startup: from the JSON file named by the
+# CONTEXT_ENGINE_INJECTION_PATTERNS environment variable, else from the defaults.
+_INJECTION_SCANNER = InjectionScanner(
+    load_injection_patterns(os.environ["CONTEXT_ENGINE_INJECTION_PATTERNS"])
+    if os.environ.get("CONTEXT_ENGINE_INJECTION_PATTERNS") else DEFAULT_INJECTION_PATTERNS
+)
+
+def scan_for_injection(text):
+    """Returns the injection pattern detected in the text, or None if it is clean."""
+    return _INJECTION_SCANNER.scan(text)
+
+@timed("sanitize")
 def helper_sanitize_input(text):
     """
     A simple sanitization function to detect and flag potential prompt injection patterns.
     Returns the text if clean, or raises a ValueError if a threat is detected.
     """
-    # List of simple, high-confidence patterns to detect injection attempts
-    injection_patterns = [
-        r"ignore previous instructions",
-        r"ignore all prior commands",
-        r"you are now in.*mode",
-        r"act as",
-        r"ignore any legal advice",
-        r"print your instructions",
-        # A simple pattern to catch attempts to inject system-level commands
-        r"sudo|apt-get|yum|pip install"
-    ]
-    
-    for pattern in injection_patterns:
-        if re.search(pattern, text, re.IGNORECASE):
-            logging.warning(f"[Sanitizer] Potential threat detected with pattern: '{pattern}'")
-            raise ValueError(f"Input sanitization failed. Potential threat detected.")
-            
+    pattern = scan_for_injection(text)
+    if pattern is not None:
+        logging.warning(f"[Sanitizer] Potential threat detected with pattern: '{pattern}'")
+        raise ValueError(f"Input sanitization failed. Potential threat detected (pattern: '{pattern}').")
+
     logging.info("[Sanitizer] Input passed sanitization check.")
     return text
 
+@timed("sanitize")
+def sanitize_many(texts):
+    """
+    Batch sanitizer: scans each text once and returns a list aligned with the input,
+    holding the text if clean or None if it was flagged (the pattern is logged).
+    """
+    results = []
+    flagged = 0
+    for text in texts:
+        pattern = scan_for_injection(text)
+        if pattern is None:
+            results.append(text)
+        else:
+            flagged += 1
+            logging.warning(f"[Sanitizer] Potential threat detected with pattern: '{pattern}'")
+            results.append(None)
+    logging.info(f"[Sanitizer] Batch scanned {len(results)} texts, {flagged} flagged.")
+    return results
+
 # FILE: commons/ch8/helpers.py
 # === Moderation Utility (New for Chapter 8) ===
 def helper_moderate_content(text_to_moderate, client):
@@ -161,5 +1127,3 @@ def helper_moderate_content(text_to_moderate, client):
         return {"flagged": True, "categories": {"error": str(e)}, "scores": {}}
 
 logging.info("✅ Helper functions defined and upgraded.")
-
-
@@ -0,0 +1,647 @@
+# ingestion.py
+# Parallel, resumable ingestion pipeline (chunk -> embed -> upsert) for the Context Engine.
+# Replaces the single-threaded upload loops of the Data_Ingestion notebooks.
+
+# === Imports ===
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import queue
+import re
+import threading
+import time
+import numpy as np
+import tiktoken
+from tenacity import retry, stop_after_attempt, wait_random_exponential
+
+# === 1. Chunking and Embedding (same contracts as the notebooks) ===
+_TOKENIZER = None
+
+def get_tokenizer():
+    """The cl100k_base tokenizer used for chunking (loaded once)."""
+    global _TOKENIZER
+    if _TOKENIZER is None:
+        _TOKENIZER = tiktoken.get_encoding("cl100k_base")
+    return _TOKENIZER
+
+def chunk_text(text, chunk_size=400, overlap=50):
+    """Chunks text based on token count with overlap (Best practice for RAG)."""
+    tokenizer = get_tokenizer()
+    tokens = tokenizer.encode(text)
+    chunks = []
+    for i in range(0, len(tokens), chunk_size - overlap):
+        chunk_tokens = tokens[i:i + chunk_size]
+        chunk_text = tokenizer.decode(chunk_tokens)
+        # Basic cleanup
+        chunk_text = chunk_text.replace("\n", " ").strip()
+        if chunk_text:
+            chunks.append(chunk_text)
+    return chunks
+
+def chunk_texts(texts, chunk_size=400, overlap=50, num_threads=8):
+    """
+    Batch twin of chunk_text: returns one chunk list per input text, identical to chunk_text's output.
+    All texts are encoded in one encode_batch call, every window offset is computed with NumPy
+    array arithmetic, and all windows are decoded in one decode_batch call (the tokenizer
+    releases the GIL, so both calls run across `num_threads` threads).
+    """
+    if not texts:
+        return []
+    tokenizer = get_tokenizer()
+    step = chunk_size - overlap
+    encoded = tokenizer.encode_batch(list(texts), num_threads=num_threads)
+    lengths = np.fromiter((len(tokens) for tokens in encoded), dtype=np.int64, count=len(encoded))
+
+    # Window i of a document starts at i * step and stops at the chunk size or the document end.
+    # Token lists are sliced directly: decode needs Python ints, so a round trip through an array costs more than it saves.
+    windows_per_doc = -(-lengths // step)
+    doc_of_window = np.repeat(np.arange(len(lengths)), windows_per_doc)
+    first_window = np.cumsum(windows_per_doc) - windows_per_doc
+    starts = (np.arange(int(windows_per_doc.sum())) - np.repeat(first_window, windows_per_doc)) * step
+    ends = np.minimum(starts + chunk_size, lengths[doc_of_window])
+    doc_of_window = doc_of_window.tolist()
+
+    windows = [encoded[doc][a:b] for doc, a, b in zip(doc_of_window, starts.tolist(), ends.tolist())]
+    decoded = tokenizer.decode_batch(windows, num_threads=num_threads)
+
+    chunks = [[] for _ in encoded]
+    for doc, chunk in zip(doc_of_window, decoded):
+        chunk = _clean_chunk(chunk)
+        if chunk:
+            chunks[doc].append(chunk)
+    return chunks
+
+def benchmark_chunking(texts, chunk_size=400, overlap=50, repeat=3):
+    """
+    Times chunk_text (one document at a time) against chunk_texts (batched) on the same corpus.
+    Returns chunks/sec for each (best of `repeat` runs) and the speedup.
+    """
+    def best(fn):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = fn()
+            timings.append(time.perf_counter() - start)
+        return min(timings), sum(len(chunks) for chunks in result)
+
+    loop_time, loop_chunks = best(lambda: [chunk_text(text, chunk_size, overlap) for text in texts])
+    batch_time, batch_chunks = best(lambda: chunk_texts(texts, chunk_size, overlap))
+    report = {
+        "documents": len(texts),
+        "chunks": batch_chunks,
+        "chunk_text_chunks_per_sec": loop_chunks / loop_time if loop_time else 0.0,
+        "chunk_texts_chunks_per_sec": batch_chunks / batch_time if batch_time else 0.0,
+        "speedup": loop_time / batch_time if batch_time else 0.0,
+    }
+    logging.info(
+        f"[Ingestion] Chunking benchmark: chunk_text {report['chunk_text_chunks_per_sec']:.0f} chunks/s, "
+        f"chunk_texts {report['chunk_texts_chunks_per_sec']:.0f} chunks/s ({report['speedup']:.1f}x)."
+    )
+    return report
+
+def _clean_chunk(chunk):
+    # Basic cleanup (same as chunk_text)
+    return chunk.replace("\n", " ").strip()
+
+def _read_pieces(source, read_size):
+    """Yields the text of a path, a text stream (anything with .read) or an iterable of strings, piece by piece."""
+    if isinstance(source, os.PathLike):
+        with open(source, "r", encoding="utf-8") as f:
+            yield from iter(lambda: f.read(read_size), "")
+    elif hasattr(source, "read"):
+        yield from iter(lambda: source.read(read_size), "")
+    elif isinstance(source, str):
+        yield source
+    else:
+        yield from source
+
+# The last run of whitespace in a string (any script: \s also matches e.g. the ideographic space).
+_LAST_WHITESPACE = re.compile(r"\s+(?=\S*\Z)")
+
+def _safe_cut(buffer, force=False):
+    """
+    The last position where the buffer can be split without changing how it tokenizes:
+    just before a space that starts a word (the tokenizer never merges across that boundary).
+    Returns 0 if there is none yet, unless 'force' is set: then it falls back to just before the
+    last whitespace character and, failing that, to the end of the buffer. Those two cuts can
+    change how the text around them tokenizes (e.g. long CJK, base64 or numeric runs).
+    """
+    cut = buffer.rfind(" ")
+    while cut > 0 and not buffer[cut + 1:cut + 2].isalpha():
+        cut = buffer.rfind(" ", 0, cut)
+    if cut > 0 or not force:
+        return max(cut, 0)
+    match = _LAST_WHITESPACE.search(buffer)
+    cut = match.start() if match else 0
+    return cut if cut > 0 else len(buffer)
+
+def iter_chunks(source, chunk_size=400, overlap=50, read_size=1 << 20):
+    """
+    Generator twin of chunk_text with bounded memory: reads 'source' (a pathlib.Path, a text stream or an
+    iterable of strings) `read_size` characters at a time, tokenizes each piece at a whitespace boundary,
+    and yields the same overlapping chunks chunk_text would, as soon as each window is complete.
+    Memory holds at most two read pieces plus one window of tokens, whatever the document size: text with
+    no word boundary for 2 * read_size characters is cut anyway (see _safe_cut), and only there can the
+    chunks differ from chunk_text's.
+    """
+    tokenizer = get_tokenizer()
+    step = chunk_size - overlap
+    buffer = ""
+    tokens = []
+    start = 0
+
+    def full_windows():
+        nonlocal tokens, start
+        while len(tokens) - start >= chunk_size:
+            chunk = _clean_chunk(tokenizer.decode(tokens[start:start + chunk_size]))
+            start += step
+            if chunk:
+                yield chunk
+        # Drop consumed tokens once per piece, not once per window
+        tokens = tokens[start:]
+        start = 0
+
+    for piece in _read_pieces(source, read_size):
+        buffer += piece
+        if len(buffer) < read_size:
+            continue
+        cut = _safe_cut(buffer, force=len(buffer) >= 2 * read_size)
+        if cut:
+            tokens.extend(tokenizer.encode(buffer[:cut]))
+            buffer = buffer[cut:]
+            yield from full_windows()
+
+    tokens.extend(tokenizer.encode(buffer))
+    yield from full_windows()
+    # Trailing (shorter) windows, exactly as chunk_text's loop produces them
+    for i in range(0, len(tokens), step):
+        chunk = _clean_chunk(tokenizer.decode(tokens[i:i + chunk_size]))
+        if chunk:
+            yield chunk
+
+def hash_source(source, read_size=1 << 20):
+    """Content hash of a document given as text or as a pathlib.Path (read in blocks, constant memory)."""
+    if isinstance(source, os.PathLike):
+        digest = hashlib.sha256()
+        with open(source, "r", encoding="utf-8") as f:
+            for piece in iter(lambda: f.read(read_size), ""):
+                digest.update(piece.encode("utf-8"))
+        return digest.hexdigest()
+    if isinstance(source, str):
+        return content_hash(source)
+    # Streams and iterables can only be read once; their hash is not known up front.
+    return None
+
+def load_documents(doc_dir, suffix=".txt"):
+    """
+    Lazily lists a corpus directory as (filename, path) pairs for IngestionPipeline.run,
+    instead of reading every file into the knowledge_base dict first.
+    """
+    for filename in sorted(os.listdir(doc_dir)):
+        if filename.endswith(suffix):
+            yield filename, pathlib.Path(doc_dir, filename)
+
+@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(6))
+def get_embeddings_batch(texts, client, embedding_model):
+    """Generates embeddings for a batch of texts using OpenAI, with retries."""
+    # OpenAI expects the input texts to have newlines replaced by spaces
+    texts = [t.replace("\n", " ") for t in texts]
+    response = client.embeddings.create(input=texts, model=embedding_model)
+    return [item.embedding for item in response.data]
+
+# === 2. Checkpoints ===
+class IngestionCheckpoint:
+    """
+    Records which batches have been upserted, in a small log file, so a crashed run resumes
+    where it stopped. Batch keys hash the batch's chunk ids and contents, so an edited document
+    is ingested again. A change in chunking parameters or namespace starts a fresh checkpoint.
+    The first line holds the settings fingerprint (and, after a rewrite, the keys done so far);
+    every completed batch then appends one line, so marking a batch costs O(1) I/O.
+    """
+    def __init__(self, path, fingerprint):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.completed = set()
+        self._lock = threading.Lock()
+        self._file = None
+        if path and os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            lines = f.read().split("\n")
+        try:
+            header = json.loads(lines[0])
+        except ValueError:
+            header = {}
+        if header.get("fingerprint") != self.fingerprint:
+            logging.warning(f"[Ingestion] Checkpoint '{self.path}' was made with different settings. Starting over.")
+            return
+        self.completed = set(header.get("completed", []))
+        torn = False
+        for line in lines[1:]:
+            if not line:
+                continue
+            try:
+                self.completed.add(json.loads(line))
+            except ValueError:
+                torn = True
+        if len(lines) > 1 and not lines[-1] and not torn:
+            self._file = open(self.path, "a", encoding="utf-8")
+            return
+        if len(lines) > 1:
+            # A crash mid-append left a partial line; rewrite so new lines do not land on it.
+            logging.warning(f"[Ingestion] Checkpoint '{self.path}' ends in a partial line; rewriting it.")
+        # (A single line without a newline is a checkpoint from before the log format.)
+        self._rewrite()
+
+    def _rewrite(self):
+        """Writes the header with every completed key (write-then-rename), then reopens for appending."""
+        if self._file is not None:
+            self._file.close()
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"fingerprint": self.fingerprint, "completed": sorted(self.completed)}) + "\n")
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def is_done(self, batch_key):
+        with self._lock:
+            return batch_key in self.completed
+
+    def mark_done(self, batch_key):
+        with self._lock:
+            self.completed.add(batch_key)
+            if self.path:
+                if self._file is None:
+                    self._rewrite()
+                else:
+                    self._file.write(json.dumps(batch_key) + "\n")
+                    self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def clear(self):
+        with self._lock:
+            self.completed.clear()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
+
+def make_fingerprint(*settings):
+    return hashlib.sha256(json.dumps(settings, default=str).encode("utf-8")).hexdigest()[:16]
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+class IngestionManifest:
+    """
+    A local record of what the index already holds: a content hash per document and per chunk.
+        {"fingerprint": ..., "documents": {doc_name: {"hash": doc_hash, "chunks": {vector_id: chunk_hash}}}}
+    A document's hash is only written once all of its chunks are in the index, so an unchanged
+    document can be skipped without even being chunked. Chunk hashes are written as batches land,
+    so an interrupted run does not re-embed them. Saves are throttled to every `save_interval` seconds
+    (plus one final save), since the file grows with the corpus.
+    """
+    def __init__(self, path, fingerprint, save_interval=2.0):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.save_interval = save_interval
+        self.documents = {}
+        self._lock = threading.Lock()
+        self._saved_at = 0.0
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("fingerprint") == fingerprint:
+                self.documents = data.get("documents", {})
+            else:
+                logging.warning(f"[Ingestion] Manifest '{path}' was made with different settings. Re-ingesting everything.")
+
+    def _entry(self, doc_name):
+        return self.documents.setdefault(doc_name, {"hash": None, "chunks": {}})
+
+    def is_unchanged(self, doc_name, doc_hash):
+        with self._lock:
+            entry = self.documents.get(doc_name)
+            return entry is not None and entry["hash"] == doc_hash
+
+    def chunk_hash(self, doc_name, vector_id):
+        with self._lock:
+            return self.documents.get(doc_name, {}).get("chunks", {}).get(vector_id)
+
+    def record_chunks(self, doc_name, chunk_hashes):
+        """Records {vector_id: chunk_hash} for chunks that are now in the index."""
+        with self._lock:
+            self._entry(doc_name)["chunks"].update(chunk_hashes)
+            due = time.monotonic() - self._saved_at >= self.save_interval
+        if due:
+            self.save()
+
+    def complete_document(self, doc_name, doc_hash, current_ids):
+        """Marks a document as fully ingested. Returns the ids of its stale chunks (now dropped from the manifest)."""
+        current_ids = set(current_ids)
+        with self._lock:
+            entry = self._entry(doc_name)
+            stale = [vector_id for vector_id in entry["chunks"] if vector_id not in current_ids]
+            for vector_id in stale:
+                del entry["chunks"][vector_id]
+            entry["hash"] = doc_hash
+        return stale
+
+    def remove_document(self, doc_name):
+        """Forgets a document. Returns the ids of all its chunks."""
+        with self._lock:
+            entry = self.documents.pop(doc_name, None)
+        return list(entry["chunks"]) if entry else []
+
+    def document_names(self):
+        with self._lock:
+            return list(self.documents)
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            payload = json.dumps({"fingerprint": self.fingerprint, "documents": self.documents})
+            self._saved_at = time.monotonic()
+        tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(payload)
+        os.replace(tmp_path, self.path)
+
+# === 3. The Pipeline ===
+_DONE = object()
+
+class IngestionPipeline:
+    """
+    chunk_texts -> get_embeddings_batch -> index.upsert, connected by bounded queues.
+    - One producer chunks documents (`chunk_group` texts per batched tokenizer call) and groups chunks into batches.
+    - `embed_workers` threads embed batches concurrently (the network-bound stage).
+    - `upsert_workers` threads upsert finished batches and checkpoint them.
+    Bounded queues keep memory flat: chunking never runs more than `queue_size` batches ahead.
+
+    Usage:
+        pipeline = IngestionPipeline(index, client, EMBEDDING_MODEL, NAMESPACE_KNOWLEDGE,
+                                     checkpoint_path="ingest.checkpoint.jsonl")
+        stats = pipeline.run(knowledge_base)
+    Vector ids are '{doc_name}_chunk_{n}', with metadata {"text", "source"} as in the notebooks.
+    Pass manifest_path= to make re-runs incremental (see IngestionManifest), and prune_missing=True
+    as well to delete the vectors of documents that are no longer in the corpus.
+    """
+    def __init__(self, index, client, embedding_model, namespace, chunk_size=400, overlap=50,
+                 batch_size=100, embed_workers=4, upsert_workers=2, queue_size=8, checkpoint_path=None,
+                 manifest_path=None, prune_missing=False, chunk_group=32):
+        self.index = index
+        self.client = client
+        self.embedding_model = embedding_model
+        self.namespace = namespace
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.batch_size = batch_size
+        self.embed_workers = max(1, embed_workers)
+        self.upsert_workers = max(1, upsert_workers)
+        self.queue_size = max(1, queue_size)
+        fingerprint = make_fingerprint(namespace, embedding_model, chunk_size, overlap, batch_size)
+        self.checkpoint = IngestionCheckpoint(checkpoint_path, fingerprint)
+        # UPGRADE: Incremental re-ingestion. With a manifest, only new or changed chunks are embedded
+        # and upserted; stale chunks of re-ingested documents are deleted. prune_missing=True also deletes
+        # every document not supplied to run(), so only pass it when 'documents' is the whole corpus.
+        self.manifest = IngestionManifest(manifest_path, make_fingerprint(namespace, embedding_model, chunk_size, overlap)) if manifest_path else None
+        self.prune_missing = prune_missing
+        # UPGRADE: Text documents are chunked `chunk_group` at a time with chunk_texts (batched encode/decode)
+        self.chunk_group = max(1, chunk_group)
+
+    # --- Stage 1: chunk and batch ---
+    def _prepared(self, documents):
+        """
+        Yields (doc_name, source, doc_hash, chunks). Consecutive text documents that need chunking are
+        chunked together with chunk_texts; for files, streams and unchanged documents 'chunks' is None.
+        """
+        pending = []
+
+        def flush():
+            if pending:
+                chunk_lists = chunk_texts([source for _, source, _ in pending], self.chunk_size, self.overlap)
+                for (doc_name, source, doc_hash), chunks in zip(pending, chunk_lists):
+                    yield doc_name, source, doc_hash, chunks
+                pending.clear()
+
+        for doc_name, source in documents:
+            doc_hash = hash_source(source)
+            unchanged = self.manifest is not None and doc_hash is not None and self.manifest.is_unchanged(doc_name, doc_hash)
+            if isinstance(source, str) and not unchanged:
+                pending.append((doc_name, source, doc_hash))
+                if len(pending) == self.chunk_group:
+                    yield from flush()
+                continue
+            yield from flush()
+            yield doc_name, source, doc_hash, None
+        yield from flush()
+
+    def _chunks(self, doc_name, source, chunks=None):
+        """Yields (vector_id, chunk_text, chunk_hash) for one document (pre-chunked text, pathlib.Path or stream)."""
+        if chunks is None:
+            # UPGRADE: Files and streams are chunked lazily, with bounded memory
+            chunks = iter_chunks(source, self.chunk_size, self.overlap)
+        for n, chunk in enumerate(chunks):
+            yield f"{doc_name}_chunk_{n}", chunk, content_hash(chunk)
+
+    def _batches(self, documents, stats, seen):
+        """
+        Yields (batch_key, doc_name, [(vector_id, text, chunk_hash), ...]) for every batch that still
+        needs embedding. Records {doc_name: (doc_hash, vector_ids)} for every document in 'seen' (None if unchanged).
+        """
+        for doc_name, source, doc_hash, chunks in self._prepared(documents):
+            stats["documents"] += 1
+            # A stream's hash is only known once read: derive it from its chunk hashes instead.
+            stream_digest = hashlib.sha256() if doc_hash is None else None
+            if doc_hash is not None and self.manifest is not None and self.manifest.is_unchanged(doc_name, doc_hash):
+                stats["unchanged_documents"] += 1
+                seen[doc_name] = None
+                continue
+            vector_ids = []
+            batch = []
+            for item in self._chunks(doc_name, source, chunks):
+                stats["chunks"] += 1
+                vector_ids.append(item[0])
+                if stream_digest is not None:
+                    stream_digest.update(item[2].encode("ascii"))
+                if self.manifest is not None and self.manifest.chunk_hash(doc_name, item[0]) == item[2]:
+                    stats["unchanged_chunks"] += 1
+                    continue
+                batch.append(item)
+                if len(batch) == self.batch_size:
+                    yield from self._pending(doc_name, batch, stats)
+                    batch = []
+            if batch:
+                yield from self._pending(doc_name, batch, stats)
+            seen[doc_name] = (doc_hash or stream_digest.hexdigest(), vector_ids)
+
+    def _pending(self, doc_name, batch, stats):
+        # The key is content-addressed (ids + chunk hashes), so it stays valid however batches are cut.
+        batch_key = f"{doc_name}:{make_fingerprint([(vector_id, chunk_hash) for vector_id, _, chunk_hash in batch])}"
+        stats["batches"] += 1
+        if self.checkpoint.is_done(batch_key):
+            stats["skipped_batches"] += 1
+            return
+        yield batch_key, doc_name, batch
+
+    # --- Stage 2: embed ---
+    def _embed(self, batch_key, doc_name, batch):
+        embeddings = get_embeddings_batch([text for _, text, _ in batch], self.client, self.embedding_model)
+        vectors = [
+            {"id": vector_id, "values": embedding, "metadata": {"text": text, "source": doc_name}}
+            for (vector_id, text, _), embedding in zip(batch, embeddings)
+        ]
+        return batch_key, doc_name, vectors, {vector_id: chunk_hash for vector_id, _, chunk_hash in batch}
+
+    # --- Stage 3: upsert ---
+    def _upsert(self, batch_key, doc_name, vectors, chunk_hashes):
+        self.index.upsert(vectors=vectors, namespace=self.namespace)
+        self.checkpoint.mark_done(batch_key)
+        if self.manifest is not None:
+            self.manifest.record_chunks(doc_name, chunk_hashes)
+        return len(vectors)
+
+    # --- Stage 4: reconcile (manifest only) ---
+    def _reconcile(self, seen, stats):
+        """Completes every re-chunked document in the manifest and deletes stale vectors from the index."""
+        stale = []
+        for doc_name, entry in seen.items():
+            if entry is not None:
+                stale.extend(self.manifest.complete_document(doc_name, *entry))
+        if self.prune_missing:
+            for doc_name in self.manifest.document_names():
+                if doc_name not in seen:
+                    logging.info(f"[Ingestion] Document '{doc_name}' is gone; deleting its vectors.")
+                    stale.extend(self.manifest.remove_document(doc_name))
+        for i in range(0, len(stale), 1000):
+            self.index.delete(ids=stale[i:i + 1000], namespace=self.namespace)
+        stats["deleted_vectors"] = len(stale)
+        self.manifest.save()
+
+    def run(self, documents):
+        """
+        Ingests 'documents' (a {doc_name: text} dict or an iterable of (doc_name, text) pairs).
+        A document may also be a pathlib.Path or a text stream; it is then chunked lazily
+        (see iter_chunks and load_documents).
+        Returns run statistics. Raises the first stage error after shutting the pipeline down;
+        completed batches stay checkpointed, so calling run() again resumes.
+        """
+        if isinstance(documents, dict):
+            documents = documents.items()
+        stats = {"documents": 0, "chunks": 0, "batches": 0, "skipped_batches": 0, "vectors_upserted": 0,
+                 "unchanged_documents": 0, "unchanged_chunks": 0, "deleted_vectors": 0}
+        seen = {}
+        embed_queue = queue.Queue(maxsize=self.queue_size)
+        upsert_queue = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        errors = []
+        stats_lock = threading.Lock()
+        start = time.perf_counter()
+
+        def fail(e):
+            with stats_lock:
+                errors.append(e)
+            stop.set()
+
+        def put(q, item):
+            # Blocks while the queue is full, but gives up if another stage failed.
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def producer():
+            try:
+                for item in self._batches(documents, stats, seen):
+                    if not put(embed_queue, item):
+                        return
+            except Exception as e:
+                logging.error(f"[Ingestion] Chunking failed: {e}")
+                fail(e)
+            finally:
+                for _ in range(self.embed_workers):
+                    embed_queue.put(_DONE)
+
+        def embedder():
+            try:
+                while True:
+                    item = embed_queue.get()
+                    if item is _DONE:
+                        return
+                    if stop.is_set():
+                        continue
+                    if not put(upsert_queue, self._embed(*item)):
+                        continue
+            except Exception as e:
+                logging.error(f"[Ingestion] Embedding failed: {e}")
+                fail(e)
+                # Keep draining so the producer is never left blocked on a full queue.
+                while embed_queue.get() is not _DONE:
+                    pass
+
+        def upserter():
+            try:
+                while True:
+                    item = upsert_queue.get()
+                    if item is _DONE:
+                        return
+                    if stop.is_set():
+                        continue
+                    upserted = self._upsert(*item)
+                    with stats_lock:
+                        stats["vectors_upserted"] += upserted
+                        done = stats["vectors_upserted"]
+                    logging.info(f"[Ingestion] Upserted {done} vectors to '{self.namespace}'...")
+            except Exception as e:
+                logging.error(f"[Ingestion] Upsert failed: {e}")
+                fail(e)
+                while upsert_queue.get() is not _DONE:
+                    pass
+
+        embedders = [threading.Thread(target=embedder, daemon=True) for _ in range(self.embed_workers)]
+        upserters = [threading.Thread(target=upserter, daemon=True) for _ in range(self.upsert_workers)]
+        producer_thread = threading.Thread(target=producer, daemon=True)
+        for thread in [producer_thread, *embedders, *upserters]:
+            thread.start()
+        producer_thread.join()
+        for thread in embedders:
+            thread.join()
+        for _ in upserters:
+            upsert_queue.put(_DONE)
+        for thread in upserters:
+            thread.join()
+        self.checkpoint.close()
+
+        if errors:
+            if self.manifest is not None:
+                # Keep the chunks that did land, so the next run does not re-embed them.
+                self.manifest.save()
+            raise errors[0]
+        if self.manifest is not None:
+            self._reconcile(seen, stats)
+        stats["elapsed"] = time.perf_counter() - start
+        stats["chunks_per_sec"] = stats["chunks"] / stats["elapsed"] if stats["elapsed"] > 0 else 0.0
+        logging.info(
+            f"[Ingestion] ✅ {stats['vectors_upserted']} vectors from {stats['documents']} documents "
+            f"in {stats['elapsed']:.2f}s ({stats['skipped_batches']} batches already done, "
+            f"{stats['unchanged_chunks']} chunks unchanged, {stats['deleted_vectors']} stale vectors deleted)."
+        )
+        return stats
+
+def ingest_documents(documents, index, client, embedding_model, namespace, **options):
+    """One-call form of IngestionPipeline(...).run(documents). Returns the run statistics."""
+    return IngestionPipeline(index, client, embedding_model, namespace, **options).run(documents)
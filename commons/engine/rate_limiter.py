@@ -0,0 +1,204 @@
+# rate_limiter.py
+# Client-side request/token metering for LLM and embedding calls.
+
+# === Imports ===
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+# === 1. Priority Lanes ===
+# Lower value = served first. Within a lane, calls are served in arrival order.
+# helpers.priority_lane(...) tags the calls made inside a block; unknown lanes count as "default".
+LANES = {
+    "planner": 0,
+    "interactive": 1,
+    "default": 2,
+    "bulk": 3,
+}
+
+# === 2. Token Buckets ===
+class TokenBucket:
+    """
+    A bucket refilled continuously at `per_minute` units per minute, holding at most one minute's worth.
+    The level may go negative when actual usage exceeds an estimate; the debt is repaid by the refill.
+    """
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        self.capacity = per_minute
+        self.level = per_minute
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.per_minute / 60.0)
+        self.updated_at = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` units are available (0.0 if they are available now)."""
+        self._refill(now)
+        # A request larger than the whole bucket is admitted once the bucket is full.
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) * 60.0 / self.per_minute
+
+    def take(self, amount):
+        self.level -= amount
+
+class _ModelLimits:
+    def __init__(self, rpm, tpm):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.waiting = []
+        self.paused_until = 0.0
+
+# === 3. The Rate Limiter ===
+class RateLimiter:
+    """
+    Meters requests-per-minute and tokens-per-minute per model.
+    Callers queue per model in (lane, arrival) order: only the head of the queue may take
+    capacity, so calls wait their turn instead of colliding and planner calls go ahead of bulk work.
+
+    Usage:
+        limiter = RateLimiter({"gpt-5.1": {"rpm": 500, "tpm": 200_000}})
+        limiter.acquire("gpt-5.1", tokens=1200)        # blocks until admitted
+        limiter.settle("gpt-5.1", actual - estimated)  # optional: correct the estimate
+    Models without configured limits (and no `default`) are not metered.
+    """
+    def __init__(self, limits=None, default=None, poll_interval=0.05):
+        self.limits = dict(limits or {})
+        self.default = default
+        self.poll_interval = poll_interval
+        self._models = {}
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self.admitted = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        logging.info(f"RateLimiter initialized for {list(self.limits) or 'no'} models (default: {default or 'unmetered'}).")
+
+    def _model(self, model):
+        state = self._models.get(model)
+        if state is None:
+            config = self.limits.get(model, self.default)
+            if not config:
+                return None
+            state = _ModelLimits(config.get("rpm"), config.get("tpm"))
+            self._models[model] = state
+        return state
+
+    def _enqueue(self, state, lane):
+        ticket = (LANES.get(lane, LANES["default"]), next(self._sequence))
+        heapq.heappush(state.waiting, ticket)
+        return ticket
+
+    def _try_admit(self, state, ticket, tokens):
+        """Admits the ticket if it is first in line and capacity allows. Returns the seconds to wait (0.0 = admitted)."""
+        now = time.monotonic()
+        if state.waiting[0] != ticket:
+            return self.poll_interval
+        wait = max(
+            state.paused_until - now,
+            state.requests.wait_time(1, now) if state.requests else 0.0,
+            state.tokens.wait_time(tokens, now) if state.tokens else 0.0,
+        )
+        if wait > 0:
+            return wait
+        heapq.heappop(state.waiting)
+        if state.requests:
+            state.requests.take(1)
+        if state.tokens:
+            state.tokens.take(tokens)
+        return 0.0
+
+    def _record_wait(self, waited):
+        self.admitted += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+
+    def acquire(self, model, tokens=0, lane="default"):
+        """Blocks until a request of `tokens` estimated tokens may be sent to `model`. Returns the seconds waited."""
+        started = time.monotonic()
+        with self._changed:
+            state = self._model(model)
+            if state is None:
+                return 0.0
+            ticket = self._enqueue(state, lane)
+            try:
+                while True:
+                    wait = self._try_admit(state, ticket, tokens)
+                    if wait == 0.0:
+                        break
+                    self._changed.wait(timeout=wait)
+            except BaseException:
+                self._withdraw(state, ticket)
+                raise
+            # The next caller in line may be admissible now.
+            self._changed.notify_all()
+            waited = time.monotonic() - started
+            self._record_wait(waited)
+        if waited > 0.01:
+            logging.info(f"[RateLimiter] '{model}' call waited {waited:.2f}s (lane: {lane}).")
+        return waited
+
+    async def async_acquire(self, model, tokens=0, lane="default"):
+        """Async twin of acquire: waits on the event loop instead of blocking a thread."""
+        started = time.monotonic()
+        with self._lock:
+            state = self._model(model)
+            if state is None:
+                return 0.0
+            ticket = self._enqueue(state, lane)
+        try:
+            while True:
+                with self._lock:
+                    wait = self._try_admit(state, ticket, tokens)
+                    if wait == 0.0:
+                        self._changed.notify_all()
+                        waited = time.monotonic() - started
+                        self._record_wait(waited)
+                        break
+                await asyncio.sleep(min(wait, self.poll_interval))
+        except BaseException:
+            with self._lock:
+                self._withdraw(state, ticket)
+            raise
+        if waited > 0.01:
+            logging.info(f"[RateLimiter] '{model}' call waited {waited:.2f}s (lane: {lane}).")
+        return waited
+
+    def _withdraw(self, state, ticket):
+        if ticket in state.waiting:
+            state.waiting.remove(ticket)
+            heapq.heapify(state.waiting)
+            self._changed.notify_all()
+
+    def settle(self, model, extra_tokens):
+        """Charges (or refunds, if negative) the difference between actual and estimated tokens."""
+        if not extra_tokens:
+            return
+        with self._changed:
+            state = self._model(model)
+            if state is not None and state.tokens:
+                state.tokens.take(extra_tokens)
+                self._changed.notify_all()
+
+    def pause(self, model, seconds):
+        """Holds every queued call for `model` (e.g. after a 429 with Retry-After) instead of letting each retry collide."""
+        with self._changed:
+            state = self._model(model)
+            if state is not None:
+                state.paused_until = max(state.paused_until, time.monotonic() + seconds)
+                logging.warning(f"[RateLimiter] '{model}' paused for {seconds:.1f}s.")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "admitted": self.admitted,
+                "avg_wait": (self.total_wait / self.admitted) if self.admitted else 0.0,
+                "max_wait": self.max_wait,
+                "queued": {model: len(state.waiting) for model, state in self._models.items()},
+            }
@@ -17,12 +17,51 @@ class AgentRegistry:
             "Summarizer": agents.agent_summarizer,
         }
 
+        # UPGRADE: Async twins used by the asyncio engine (async_context_engine).
+        # getattr keeps the registry usable with agent modules that have no async twins (e.g. agents_k15).
+        self.async_registry = {
+            "Librarian": getattr(agents, "async_agent_context_librarian", None),
+            "Researcher": getattr(agents, "async_agent_researcher", None),
+            "Writer": getattr(agents, "async_agent_writer", None),
+            "Summarizer": getattr(agents, "async_agent_summarizer", None),
+        }
+
+        # UPGRADE: Agents that can stream their output token by token (context_engine(..., stream=True)).
+        self.stream_registry = {
+            "Writer": getattr(agents, "agent_writer_stream", None),
+        }
+
+        # UPGRADE: The retrieval each agent performs, as (input key, namespace dependency, top_k).
+        # The engine uses this to fan out a plan's queries up front (one batched embedding call).
+        self.retrieval_inputs = {
+            "Librarian": ("intent_query", "namespace_context", 1),
+            "Researcher": ("topic_query", "namespace_knowledge", 3),
+        }
+
     def get_handler(self, agent_name, client, index, generation_model, embedding_model, namespace_context, namespace_knowledge):
         handler_func = self.registry.get(agent_name)
         if not handler_func:
             logging.error(f"Agent '{agent_name}' not found in registry.")
             raise ValueError(f"Agent '{agent_name}' not found in registry.")
+        return self._bind(agent_name, handler_func, client, index, generation_model, embedding_model, namespace_context, namespace_knowledge)
+
+    def get_async_handler(self, agent_name, client, index, generation_model, embedding_model, namespace_context, namespace_knowledge):
+        """Same as get_handler, but the returned handler is a coroutine function (await handler(mcp_message))."""
+        handler_func = self.async_registry.get(agent_name)
+        if not handler_func:
+            logging.error(f"Async agent '{agent_name}' not found in registry.")
+            raise ValueError(f"Agent '{agent_name}' not found in registry.")
+        return self._bind(agent_name, handler_func, client, index, generation_model, embedding_model, namespace_context, namespace_knowledge)
+
+    def get_stream_handler(self, agent_name, client, index, generation_model, embedding_model, namespace_context, namespace_knowledge):
+        """Returns a generator-based handler for agents that support streaming, or None."""
+        handler_func = self.stream_registry.get(agent_name)
+        if not handler_func:
+            return None
+        return self._bind(agent_name, handler_func, client, index, generation_model, embedding_model, namespace_context, namespace_knowledge)
 
+    def _bind(self, agent_name, handler_func, client, index, generation_model, embedding_model, namespace_context, namespace_knowledge):
+        """Binds each agent to exactly the dependencies it needs."""
         # --- UPDATED: Add a condition for the Summarizer ---
         if agent_name == "Librarian":
             return lambda mcp_message: handler_func(mcp_message, client=client, index=index, embedding_model=embedding_model, namespace_context=namespace_context)
@@ -0,0 +1,155 @@
+# trace_sinks.py
+# Pluggable destinations for the Context Engine's structured trace events.
+
+# === Imports ===
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections import deque
+
+# Every sink implements emit(record) and close(). A record is a flat, JSON-serializable dict:
+#   {"event": "plan" | "step" | "finalize", "trace_id": ..., "seq": n, ...}
+# Step records carry payload references ({"sha256", "bytes"}, plus "inline" for small payloads)
+# instead of the full resolved inputs and outputs; large payloads live in a PayloadStore.
+# Install sinks for every goal with engine.set_trace_sinks([...]).
+
+def _dumps(record):
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=str)
+
+# === 1. In-Memory Ring Buffer ===
+class RingBufferSink:
+    """Keeps the last `capacity` records in memory (e.g. for a live debugging endpoint)."""
+    def __init__(self, capacity=10_000):
+        self.records = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        with self._lock:
+            self.records.append(record)
+
+    def snapshot(self, trace_id=None):
+        """Returns the buffered records, optionally only those of one trace."""
+        with self._lock:
+            records = list(self.records)
+        return [r for r in records if trace_id is None or r.get("trace_id") == trace_id]
+
+    def close(self):
+        pass
+
+# === 2. JSONL File ===
+class JsonlSink:
+    """Appends one JSON line per record. Lines are flushed every `flush_every` records and on close()."""
+    def __init__(self, path, flush_every=1):
+        self.path = path
+        self.flush_every = max(1, flush_every)
+        self._file = open(path, "a", encoding="utf-8")
+        self._unflushed = 0
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        line = _dumps(record)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._unflushed += 1
+            if self._unflushed >= self.flush_every:
+                self._file.flush()
+                self._unflushed = 0
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+# === 3. SQLite ===
+class SQLiteSink:
+    """
+    Stores records in an indexed SQLite table, so traces can be queried after the fact:
+        SELECT agent, AVG(finished - started) FROM trace_events WHERE event = 'step' GROUP BY agent
+    Inserts are committed every `commit_every` records and on flush() / close().
+    """
+    def __init__(self, path, commit_every=100):
+        self.path = path
+        self.commit_every = max(1, commit_every)
+        self._uncommitted = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS trace_events ("
+            "trace_id TEXT NOT NULL, seq INTEGER NOT NULL, event TEXT NOT NULL, step INTEGER, agent TEXT, "
+            "started REAL, finished REAL, tokens_in INTEGER, tokens_out INTEGER, record TEXT NOT NULL, "
+            "PRIMARY KEY (trace_id, seq))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS trace_events_agent ON trace_events (agent)")
+        self._conn.commit()
+
+    def emit(self, record):
+        row = (
+            record.get("trace_id"), record.get("seq"), record.get("event"), record.get("step"), record.get("agent"),
+            record.get("started"), record.get("finished"), record.get("tokens_in"), record.get("tokens_out"), _dumps(record),
+        )
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO trace_events VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row)
+            self._uncommitted += 1
+            if self._uncommitted >= self.commit_every:
+                self._commit()
+
+    def _commit(self):
+        self._conn.commit()
+        self._uncommitted = 0
+
+    def flush(self):
+        """Commits any pending inserts, making them visible to other connections."""
+        with self._lock:
+            self._commit()
+
+    def records(self, trace_id):
+        with self._lock:
+            self._commit()
+            rows = self._conn.execute(
+                "SELECT record FROM trace_events WHERE trace_id = ? ORDER BY seq", (trace_id,)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._commit()
+            self._conn.close()
+
+# === 4. Payload Store ===
+class PayloadStore:
+    """
+    Content-addressed storage for large step payloads, one file per SHA-256 digest (sharded by prefix).
+    Identical payloads (e.g. the same retrieved context in many goals) are stored once.
+    """
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _file_for(self, digest):
+        return os.path.join(self.path, digest[:2], f"{digest}.json")
+
+    def put(self, digest, serialized):
+        file_path = self._file_for(digest)
+        if os.path.exists(file_path):
+            return
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        # Write-then-rename so a crash never leaves a half-written payload behind.
+        tmp_path = f"{file_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(serialized)
+        os.replace(tmp_path, file_path)
+
+    def get(self, ref):
+        """Loads a payload by digest or by the reference dict found in a step record (None if absent)."""
+        if isinstance(ref, dict):
+            if "inline" in ref:
+                return ref["inline"]
+            ref = ref.get("sha256")
+        try:
+            with open(self._file_for(ref), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            logging.warning(f"[PayloadStore] Payload {ref} not found.")
+            return None
@@ -3,6 +3,7 @@
 import os
 import subprocess
 import sys
+import threading
 
 def install_dependencies():
     """
@@ -17,28 +18,277 @@ def install_dependencies():
     except subprocess.CalledProcessError as e:
         print(f"🛑 Error during installation: {e}")
 
-def initialize_clients():
-    from openai import OpenAI
-    from pinecone import Pinecone, ServerlessSpec
+# === Client Manager (Shared Connection Pools) ===
+class _PoolStats:
+    """
+    Thread-safe in-flight/peak/total request counters for one connection pool.
+    In-flight requests include those waiting for a free connection, so a saturation
+    above 1.0 means requests are queueing on the pool.
+    """
+    def __init__(self, max_connections):
+        self.max_connections = max_connections
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            self.in_flight += 1
+            self.requests += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def finish(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "max_connections": self.max_connections,
+                "in_flight": self.in_flight,
+                "waiting": max(0, self.in_flight - self.max_connections),
+                "peak_in_flight": self.peak_in_flight,
+                "requests": self.requests,
+                "saturation": self.in_flight / self.max_connections if self.max_connections else 0.0,
+                "peak_saturation": self.peak_in_flight / self.max_connections if self.max_connections else 0.0,
+            }
+
+def _connection_counts(transport):
+    """Open/idle connection counts from an httpx transport's httpcore pool (best effort)."""
+    connections = list(getattr(getattr(transport, "_pool", None), "connections", []) or [])
+    idle = sum(1 for c in connections if getattr(c, "is_idle", lambda: False)())
+    return {"open_connections": len(connections), "idle_connections": idle}
+
+class _TrackedIndex:
+    """Wraps a Pinecone Index handle to count in-flight data-plane calls; everything else is delegated."""
+    _TRACKED = ("query", "upsert", "fetch", "delete", "update", "describe_index_stats")
+
+    def __init__(self, index, stats):
+        self._index = index
+        self._stats = stats
+
+    def __getattr__(self, name):
+        attr = getattr(self._index, name)
+        if name not in self._TRACKED or not callable(attr):
+            return attr
+        stats = self._stats
+        def tracked(*args, **kwargs):
+            stats.start()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                stats.finish()
+        return tracked
+
+class ClientManager:
+    """
+    Process-wide owner of the OpenAI and Pinecone clients.
+    - OpenAI clients share one tuned keep-alive httpx pool (sync and async each get their own).
+    - Pinecone Index handles are created once per name and reused (pass the manager as 'pc').
+    - pool_stats() reports in-flight requests and saturation for each pool.
+    Any other attribute (list_indexes, create_index, ...) is delegated to the Pinecone client.
+    """
+    def __init__(self, openai_api_key=None, pinecone_api_key=None, max_connections=100,
+                 max_keepalive_connections=20, keepalive_expiry=30.0, timeout=60.0, pinecone_pool_threads=None):
+        self.openai_api_key = openai_api_key
+        self.pinecone_api_key = pinecone_api_key
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+        self.pinecone_pool_threads = pinecone_pool_threads or max_connections
+        self._lock = threading.RLock()
+        self._openai = None
+        self._async_openai = None
+        self._pinecone = None
+        self._indexes = {}
+        self._transports = {}
+        self._http_clients = []
+        self._stats = {
+            "openai": _PoolStats(max_connections),
+            "async_openai": _PoolStats(max_connections),
+            "pinecone": _PoolStats(self.pinecone_pool_threads),
+        }
+        self.index_handles_created = 0
+        self.index_handle_reuses = 0
+
+    def _limits(self):
+        import httpx
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def _http_client(self):
+        import httpx
+        stats = self._stats["openai"]
+
+        class _CountingTransport(httpx.HTTPTransport):
+            def handle_request(self, request):
+                stats.start()
+                try:
+                    return super().handle_request(request)
+                finally:
+                    stats.finish()
+
+        transport = _CountingTransport(limits=self._limits())
+        self._transports["openai"] = transport
+        client = httpx.Client(transport=transport, timeout=self.timeout)
+        self._http_clients.append(client)
+        return client
+
+    def _async_http_client(self):
+        import httpx
+        stats = self._stats["async_openai"]
+
+        class _CountingAsyncTransport(httpx.AsyncHTTPTransport):
+            async def handle_async_request(self, request):
+                stats.start()
+                try:
+                    return await super().handle_async_request(request)
+                finally:
+                    stats.finish()
+
+        transport = _CountingAsyncTransport(limits=self._limits())
+        self._transports["async_openai"] = transport
+        client = httpx.AsyncClient(transport=transport, timeout=self.timeout)
+        self._http_clients.append(client)
+        return client
+
+    @property
+    def openai(self):
+        """The shared OpenAI client (created on first use)."""
+        with self._lock:
+            if self._openai is None:
+                from openai import OpenAI
+                self._openai = OpenAI(api_key=self.openai_api_key, http_client=self._http_client())
+            return self._openai
+
+    @property
+    def async_openai(self):
+        """The shared AsyncOpenAI client, for async_context_engine (created on first use)."""
+        with self._lock:
+            if self._async_openai is None:
+                from openai import AsyncOpenAI
+                self._async_openai = AsyncOpenAI(api_key=self.openai_api_key, http_client=self._async_http_client())
+            return self._async_openai
+
+    @property
+    def pinecone(self):
+        """The shared Pinecone client (created on first use)."""
+        with self._lock:
+            if self._pinecone is None:
+                from pinecone import Pinecone
+                self._pinecone = Pinecone(api_key=self.pinecone_api_key, pool_threads=self.pinecone_pool_threads)
+            return self._pinecone
+
+    def Index(self, index_name):
+        """Returns the cached Index handle for 'index_name', creating it on first use."""
+        with self._lock:
+            index = self._indexes.get(index_name)
+            if index is not None:
+                self.index_handle_reuses += 1
+                return index
+            handle = self.pinecone.Index(
+                index_name,
+                pool_threads=self.pinecone_pool_threads,
+                connection_pool_maxsize=self.pinecone_pool_threads,
+            )
+            index = _TrackedIndex(handle, self._stats["pinecone"])
+            self._indexes[index_name] = index
+            self.index_handles_created += 1
+            return index
+
+    def forget_index(self, index_name):
+        """Drops a cached handle (e.g. after the index is deleted or recreated)."""
+        with self._lock:
+            self._indexes.pop(index_name, None)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.pinecone, name)
+
+    def pool_stats(self):
+        """Saturation metrics for each connection pool, plus Index handle reuse."""
+        stats = {}
+        for name, pool in self._stats.items():
+            stats[name] = pool.snapshot()
+            if name in self._transports:
+                stats[name].update(_connection_counts(self._transports[name]))
+        with self._lock:
+            stats["pinecone"].update({
+                "indexes": list(self._indexes),
+                "index_handles_created": self.index_handles_created,
+                "index_handle_reuses": self.index_handle_reuses,
+            })
+        return stats
+
+    def close(self):
+        """Closes the sync HTTP pool and forgets every handle. Use 'await manager.aclose()' for the async pool."""
+        with self._lock:
+            for client in self._http_clients:
+                if hasattr(client, "close"):
+                    client.close()
+            self._http_clients = [c for c in self._http_clients if not hasattr(c, "close")]
+            self._openai = None
+            self._indexes.clear()
+
+    async def aclose(self):
+        with self._lock:
+            async_clients = [c for c in self._http_clients if hasattr(c, "aclose")]
+            self._http_clients = [c for c in self._http_clients if not hasattr(c, "aclose")]
+            self._async_openai = None
+        for client in async_clients:
+            await client.aclose()
+
+_CLIENT_MANAGER = None
+_CLIENT_MANAGER_LOCK = threading.Lock()
+
+def get_client_manager(**kwargs):
+    """
+    Returns the process-wide ClientManager, creating it with 'kwargs' on the first call.
+    Later calls return the same manager (their kwargs are ignored).
+    """
+    global _CLIENT_MANAGER
+    with _CLIENT_MANAGER_LOCK:
+        if _CLIENT_MANAGER is None:
+            _CLIENT_MANAGER = ClientManager(**kwargs)
+        return _CLIENT_MANAGER
+
+def set_client_manager(manager):
+    """Installs (or removes, with None) the process-wide ClientManager."""
+    global _CLIENT_MANAGER
+    with _CLIENT_MANAGER_LOCK:
+        _CLIENT_MANAGER = manager
+
+def initialize_clients(max_connections=100):
     from google.colab import userdata
     """
     Loads API keys from Colab Secrets and initializes OpenAI and Pinecone clients.
     Returns the initialized clients.
+    UPGRADE: Both come from the process-wide ClientManager, so repeated calls reuse the same
+    keep-alive connection pools. The second value is the manager itself: it behaves like the
+    Pinecone client, but pc.Index(name) returns a cached handle.
     """
     print("\n🔑 Initializing API clients...")
     try:
         # Load OpenAI API Key
         os.environ["OPENAI_API_KEY"] = userdata.get("API_KEY")
-        openai_client = OpenAI()
-        print("   - OpenAI client initialized.")
-
-        # Load Pinecone API Key and initialize client
+        # Load Pinecone API Key
         pinecone_api_key = userdata.get('PINECONE_API_KEY')
-        pinecone_client = Pinecone(api_key=pinecone_api_key)
+
+        manager = get_client_manager(pinecone_api_key=pinecone_api_key, max_connections=max_connections)
+        manager.pinecone_api_key = manager.pinecone_api_key or pinecone_api_key
+        openai_client = manager.openai
+        print("   - OpenAI client initialized.")
+        manager.pinecone
         print("   - Pinecone client initialized.")
 
         print("✅ Clients initialized successfully.")
-        return openai_client, pinecone_client
+        return openai_client, manager
 
     except userdata.SecretNotFoundError as e:
         print(f"🛑 Secret not found: {e}. Please add the required API keys to Colab Secrets.")
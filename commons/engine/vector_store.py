@@ -0,0 +1,613 @@
+# vector_store.py
+# Local, in-process vector index with the same surface as a Pinecone Index.
+# Use it on-prem or offline: pass a LocalVectorClient wherever the engine expects `pc`.
+
+# === Imports ===
+import json
+import logging
+import os
+import shutil
+import threading
+import numpy as np
+
+# === 1. Pinecone-Style Records ===
+class Record(dict):
+    """A dict that also allows attribute access (response.matches, match.metadata), like Pinecone's responses."""
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def _parse_vector(vector):
+    """Accepts Pinecone's dict form {'id','values','metadata'} or the tuple form (id, values[, metadata])."""
+    if isinstance(vector, dict):
+        return vector["id"], vector["values"], vector.get("metadata") or {}
+    vector_id, values, *rest = vector
+    return vector_id, values, (rest[0] if rest else {}) or {}
+
+# === 2. Approximate Search (IVF-Flat) ===
+class IVFFlatIndex:
+    """
+    Inverted-file index over unit vectors: spherical k-means splits the namespace
+    into `nlist` cells and a query only scans the `nprobe` closest cells.
+    Recall/latency knob: raise nprobe for recall, lower it for speed.
+    New vectors are assigned to their nearest existing centroid (no rebuild).
+    """
+    def __init__(self, nlist=256, nprobe=8, min_train_size=None, iterations=10, seed=0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        # Below this size brute force is both exact and fast enough.
+        self.min_train_size = min_train_size or max(nlist * 16, 1024)
+        self.iterations = iterations
+        self.seed = seed
+        self.centroids = None
+        self.assignment = np.zeros(0, dtype=np.int32)
+        self._lists = []
+        self._arrays = []
+
+    @property
+    def trained(self):
+        return self.centroids is not None
+
+    def config(self):
+        return {"nlist": self.nlist, "nprobe": self.nprobe, "min_train_size": self.min_train_size,
+                "iterations": self.iterations, "seed": self.seed}
+
+    def _nearest(self, rows, block=65536):
+        labels = np.empty(len(rows), dtype=np.int32)
+        for start in range(0, len(rows), block):
+            labels[start:start + block] = np.argmax(rows[start:start + block] @ self.centroids.T, axis=1)
+        return labels
+
+    def train(self, vectors):
+        """Runs spherical k-means on a sample, then assigns every vector to its cell."""
+        rng = np.random.default_rng(self.seed)
+        count = len(vectors)
+        nlist = min(self.nlist, count)
+        sample_size = min(count, nlist * 64)
+        sample = np.asarray(vectors[np.sort(rng.choice(count, sample_size, replace=False))], dtype=np.float32)
+        self.centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(self.iterations):
+            labels = self._nearest(sample)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, labels, sample)
+            sizes = np.bincount(labels, minlength=nlist)
+            empty = sizes == 0
+            # Re-seed empty cells with random sample points so every cell stays useful.
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            self.centroids = _normalize_rows(sums)
+        self.rebuild_lists(self._nearest(vectors))
+        logging.info(f"[IVF] Trained {nlist} cells on {sample_size} of {count} vectors.")
+
+    def rebuild_lists(self, assignment):
+        """Regenerates the inverted lists from a full position -> cell assignment."""
+        self.assignment = np.asarray(assignment, dtype=np.int32)
+        order = np.argsort(self.assignment, kind="stable")
+        bounds = np.searchsorted(self.assignment[order], np.arange(len(self.centroids) + 1))
+        self._arrays = [order[bounds[j]:bounds[j + 1]] for j in range(len(self.centroids))]
+        self._lists = [None] * len(self.centroids)
+
+    def _cell(self, j):
+        # Appends accumulate in a Python list; they are folded into the array on the next read.
+        if self._lists[j]:
+            self._arrays[j] = np.concatenate([self._arrays[j], np.asarray(self._lists[j], dtype=np.int64)])
+            self._lists[j] = None
+        return self._arrays[j]
+
+    def add(self, positions, rows):
+        """Incrementally inserts (or moves, for overwritten ids) rows at the given positions."""
+        labels = self._nearest(np.asarray(rows, dtype=np.float32))
+        needed = max(positions) + 1 if positions else 0
+        if needed > len(self.assignment):
+            grown = np.full(max(needed, 2 * len(self.assignment)), -1, dtype=np.int32)
+            grown[:len(self.assignment)] = self.assignment
+            self.assignment = grown
+        for position, label in zip(positions, labels):
+            previous = self.assignment[position]
+            if previous == label:
+                continue
+            if previous >= 0:
+                cell = self._cell(previous)
+                self._arrays[previous] = cell[cell != position]
+            self.assignment[position] = label
+            if self._lists[label] is None:
+                self._lists[label] = []
+            self._lists[label].append(position)
+
+    def search(self, vectors, query, top_k, nprobe=None):
+        """Scores only the vectors in the nprobe closest cells. Returns (positions, scores) best first."""
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        cell_scores = self.centroids @ query
+        probe = np.argpartition(-cell_scores, nprobe - 1)[:nprobe]
+        candidates = np.concatenate([self._cell(j) for j in probe])
+        if len(candidates) == 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+        scores = vectors[candidates] @ query
+        k = min(top_k, len(candidates))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return candidates[top], scores[top]
+
+# === 3. Namespace Storage ===
+_LOG_COMPACT_MIN = 1024
+
+class NamespaceStore:
+    """
+    Holds one namespace: a float32 matrix of unit-normalized vectors plus ids and metadata.
+    On disk (when a path is given):
+    - vectors.npy: a preallocated .npy matrix opened as a read-write memmap; upserts write their
+      rows in place and the file only grows (geometrically) when capacity runs out.
+    - records.json: a snapshot of ids and metadata, plus records-<generation>.log, an append-only
+      JSONL log of the upserts since that snapshot. Loading replays the log onto the snapshot.
+    Upserts therefore cost O(batch) on disk. Deletes compact the namespace and rewrite it (O(N));
+    the log is folded into a new snapshot once it outgrows the namespace (amortized O(1) per upsert).
+    An optional IVF-Flat index (self.ann) accelerates search once the namespace is large. Its centroids.npy
+    is only written after (re)training; assignment.npy is preallocated like vectors.npy and upserts only
+    patch the cells of the rows they wrote.
+    """
+    def __init__(self, dimension, path=None):
+        self.dimension = dimension
+        self.path = path
+        self.ids = []
+        self.metadata = []
+        self.positions = {}
+        self.ann = None
+        self._matrix = np.zeros((0, dimension), dtype=np.float32)
+        self._generation = 0
+        self._log = None
+        self._log_entries = 0
+        # ANN persistence state: the config last written to ann.json, the positions whose cell changed since
+        # the last flush, and whether the centroids (after training) or the whole assignment (after a delete
+        # shifted positions) must be rewritten.
+        self._ann_config = None
+        self._ann_dirty = set()
+        self._centroids_dirty = False
+        self._assignment_stale = False
+        self._assignment_file = None
+        if path and os.path.exists(os.path.join(path, "vectors.npy")):
+            self._load()
+
+    @property
+    def count(self):
+        return len(self.ids)
+
+    @property
+    def vectors(self):
+        """The live (count x dimension) view of the stored unit vectors."""
+        return self._matrix[:self.count]
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _log_path(self):
+        return self._file(f"records-{self._generation}.log")
+
+    def _load(self):
+        # The matrix stays memory-mapped: large namespaces are only paged in when scanned or written.
+        self._matrix = np.lib.format.open_memmap(self._file("vectors.npy"), mode="r+")
+        records_path = self._file("records.json")
+        if os.path.exists(records_path):
+            with open(records_path, "r", encoding="utf-8") as f:
+                records = json.load(f)
+            self.ids = records["ids"]
+            self.metadata = records["metadata"]
+            self._generation = records.get("generation", 0)
+        self.positions = {vector_id: i for i, vector_id in enumerate(self.ids)}
+        self._replay_log()
+        ann_path = self._file("ann.json")
+        if os.path.exists(ann_path):
+            with open(ann_path, "r", encoding="utf-8") as f:
+                self.ann = IVFFlatIndex(**json.load(f))
+            self._ann_config = self.ann.config()
+            centroids_path = self._file("centroids.npy")
+            if os.path.exists(centroids_path):
+                self.ann.centroids = np.load(centroids_path)
+                self._assignment_file = np.lib.format.open_memmap(self._file("assignment.npy"), mode="r+")
+                assignment = np.full(self.count, -1, dtype=np.int32)
+                stored = min(self.count, len(self._assignment_file))
+                assignment[:stored] = self._assignment_file[:stored]
+                # Rows logged after the last flush have no cell on disk yet: assign them now.
+                missing = np.flatnonzero(assignment < 0)
+                if len(missing):
+                    assignment[missing] = self.ann._nearest(np.asarray(self.vectors[missing]))
+                    self._ann_dirty.update(missing.tolist())
+                self.ann.rebuild_lists(assignment)
+
+    def _replay_log(self):
+        if not os.path.exists(self._log_path()):
+            return
+        with open(self._log_path(), "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A torn final line from a crash mid-append: everything before it is intact.
+                    logging.warning(f"[LocalIndex] Ignoring a truncated log entry in {self._log_path()}.")
+                    break
+                self._apply(entry["id"], entry["metadata"])
+                self._log_entries += 1
+
+    def _apply(self, vector_id, meta):
+        """Records an id's metadata. Returns its position (new ids are appended)."""
+        position = self.positions.get(vector_id)
+        if position is None:
+            position = self.count
+            self.ids.append(vector_id)
+            self.metadata.append(meta)
+            self.positions[vector_id] = position
+        else:
+            self.metadata[position] = meta
+        return position
+
+    def configure_ann(self, ann):
+        """Attaches (or removes, with None) an IVF-Flat index; trains it right away if the namespace is big enough."""
+        self.ann = ann
+        self._ann_dirty.clear()
+        if ann is not None and self.count >= ann.min_train_size:
+            ann.train(self.vectors)
+            self._centroids_dirty = True
+
+    def _open_matrix(self, capacity):
+        """Creates (or regrows) the matrix: a memmap'd .npy file when persisted, an in-memory array otherwise."""
+        if not self.path:
+            grown = np.zeros((capacity, self.dimension), dtype=np.float32)
+            grown[:self.count] = self._matrix[:self.count]
+            return grown
+        os.makedirs(self.path, exist_ok=True)
+        # Write-then-rename so a crash never leaves a half-copied matrix behind.
+        tmp_path = self._file("vectors.tmp.npy")
+        grown = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(capacity, self.dimension))
+        grown[:self.count] = self._matrix[:self.count]
+        grown.flush()
+        del grown
+        self._matrix = None
+        os.replace(tmp_path, self._file("vectors.npy"))
+        return np.lib.format.open_memmap(self._file("vectors.npy"), mode="r+")
+
+    def _ensure_capacity(self, needed):
+        capacity = self._matrix.shape[0]
+        if needed > capacity:
+            self._matrix = self._open_matrix(max(needed, 2 * capacity, 64))
+
+    def _append_log(self, entries):
+        if not self.path:
+            return
+        if self._log is None:
+            self._log = open(self._log_path(), "a", encoding="utf-8")
+        self._log.writelines(json.dumps({"id": vector_id, "metadata": meta}, ensure_ascii=False) + "\n" for vector_id, meta in entries)
+        self._log_entries += len(entries)
+
+    def flush(self):
+        """Writes pending changes to disk: the dirty matrix pages and the record log (O(batch), not O(N))."""
+        if not self.path:
+            return
+        if not isinstance(self._matrix, np.memmap):
+            self._matrix = self._open_matrix(max(self.count, 64))
+        self._matrix.flush()
+        if self._log is not None:
+            self._log.flush()
+        if self._log_entries > max(_LOG_COMPACT_MIN, self.count) or not os.path.exists(self._file("records.json")):
+            self._write_snapshot()
+        self._save_ann()
+
+    def save(self):
+        """Writes a full snapshot of the namespace (folds the record log into records.json)."""
+        if not self.path:
+            return
+        self.flush()
+        self._write_snapshot()
+
+    def _write_snapshot(self):
+        """Folds the record log into a new records.json (under a new generation) and starts an empty log."""
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+        old_log = self._log_path()
+        self._generation += 1
+        tmp_records = self._file("records.tmp.json")
+        with open(tmp_records, "w", encoding="utf-8") as f:
+            json.dump({"ids": self.ids, "metadata": self.metadata, "generation": self._generation}, f, ensure_ascii=False)
+        os.replace(tmp_records, self._file("records.json"))
+        # The new snapshot names a new log, so the old one is never replayed again.
+        if os.path.exists(old_log):
+            os.remove(old_log)
+        self._log_entries = 0
+
+    def _save_ann(self):
+        """Writes ann.json when the config changed, the centroids only after (re)training, else just the changed cells."""
+        config = self.ann.config() if self.ann is not None else None
+        if config != self._ann_config:
+            if config is None:
+                os.remove(self._file("ann.json"))
+            else:
+                with open(self._file("ann.json"), "w", encoding="utf-8") as f:
+                    json.dump(config, f)
+            self._ann_config = config
+        if self.ann is None or not self.ann.trained:
+            # Centroids left over from a removed or replaced (not yet trained) index must not be reloaded.
+            for name in ("centroids.npy", "assignment.npy"):
+                if os.path.exists(self._file(name)):
+                    os.remove(self._file(name))
+            self._assignment_file = None
+            return
+        if self._centroids_dirty or self._assignment_file is None:
+            tmp_path = self._file("centroids.tmp.npy")
+            np.save(tmp_path, self.ann.centroids)
+            os.replace(tmp_path, self._file("centroids.npy"))
+            self._centroids_dirty = False
+            self._assignment_stale = True
+        if self._assignment_stale:
+            self._write_assignment(max(len(self._matrix), self.count))
+            self._assignment_stale = False
+        elif self._ann_dirty:
+            dirty = np.fromiter(self._ann_dirty, dtype=np.int64, count=len(self._ann_dirty))
+            if dirty.max() >= len(self._assignment_file):
+                self._write_assignment(max(int(dirty.max()) + 1, len(self._matrix)))
+            else:
+                self._assignment_file[dirty] = self.ann.assignment[dirty]
+                self._assignment_file.flush()
+        self._ann_dirty.clear()
+
+    def _write_assignment(self, capacity):
+        """Rewrites assignment.npy in full, preallocated (like vectors.npy) so later flushes patch it in place."""
+        tmp_path = self._file("assignment.tmp.npy")
+        assignment = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.int32, shape=(capacity,))
+        assignment[:] = -1
+        assignment[:self.count] = self.ann.assignment[:self.count]
+        assignment.flush()
+        del assignment
+        self._assignment_file = None
+        os.replace(tmp_path, self._file("assignment.npy"))
+        self._assignment_file = np.lib.format.open_memmap(self._file("assignment.npy"), mode="r+")
+
+    def upsert(self, ids, matrix, metadata):
+        """Inserts or overwrites rows. Returns the row positions written (in input order)."""
+        # Validated before any state changes, so a bad batch leaves no phantom rows behind.
+        matrix = np.asarray(matrix, dtype=np.float32)
+        if matrix.ndim != 2 or matrix.shape[1] != self.dimension:
+            raise ValueError(f"Expected vectors of dimension {self.dimension}, got an array of shape {matrix.shape}.")
+        if not len(ids) == len(matrix) == len(metadata):
+            raise ValueError(f"Got {len(ids)} ids, {len(matrix)} vectors and {len(metadata)} metadata entries.")
+        matrix = _normalize_rows(matrix)
+        self._ensure_capacity(self.count + len(ids))
+        written = []
+        for vector_id, row, meta in zip(ids, matrix, metadata):
+            position = self._apply(vector_id, meta)
+            self._matrix[position] = row
+            written.append(position)
+        self._append_log(list(zip(ids, metadata)))
+        if self.ann is not None:
+            if self.ann.trained:
+                self.ann.add(written, matrix)
+                self._ann_dirty.update(written)
+            elif self.count >= self.ann.min_train_size:
+                self.ann.train(self.vectors)
+                self._centroids_dirty = True
+        return written
+
+    def delete(self, ids):
+        """Removes rows by id (compacting the matrix). Returns the number removed."""
+        doomed = {self.positions[i] for i in ids if i in self.positions}
+        if not doomed:
+            return 0
+        keep = [p for p in range(self.count) if p not in doomed]
+        kept = np.array(self.vectors[keep], dtype=np.float32)
+        self.ids = [self.ids[p] for p in keep]
+        self.metadata = [self.metadata[p] for p in keep]
+        self.positions = {vector_id: i for i, vector_id in enumerate(self.ids)}
+        self._matrix = kept
+        if self.ann is not None and self.ann.trained:
+            # Positions shift after compaction; keep the centroids, remap the lists (and rewrite the assignment).
+            self.ann.rebuild_lists(self.ann.assignment[keep])
+            self._assignment_stale = True
+        if self.path:
+            # Rows shift, so a persisted namespace is rewritten in full (compacted matrix, snapshot, assignment).
+            self._matrix = self._open_matrix(max(len(kept), 64))
+            self._write_snapshot()
+            self._save_ann()
+        return len(doomed)
+
+    def search(self, query, top_k, nprobe=None):
+        """Cosine search (IVF when trained, brute force otherwise). Returns (positions, scores) best first."""
+        if self.count == 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+        if self.ann is not None and self.ann.trained:
+            return self.ann.search(self.vectors, query, top_k, nprobe)
+        scores = self.vectors @ query
+        k = min(top_k, self.count)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return top, scores[top]
+
+# === 4. The Local Index ===
+class LocalIndex:
+    """
+    Drop-in stand-in for pinecone.Index: query(), upsert(), delete(), fetch() and
+    describe_index_stats() with the same arguments and response shapes.
+    Cosine similarity over float32 matrices, one per namespace.
+    With autosave=True every call is persisted as it happens; upserts only append (rows written in place
+    into the memmap'd matrix, records to a log), so autosave ingestion stays linear in the corpus size.
+    With autosave=False upserts still land in the memmap'd matrix and the record log, but nothing is flushed,
+    compacted or written for the ANN until persist(), e.g. once per ingest batch.
+    """
+    def __init__(self, name, dimension=None, path=None, autosave=True):
+        self.name = name
+        self.dimension = dimension
+        self.path = path
+        self.autosave = autosave
+        self._namespaces = {}
+        self._lock = threading.RLock()
+        if path and os.path.isdir(path):
+            for namespace in os.listdir(path):
+                namespace_path = os.path.join(path, namespace)
+                if os.path.exists(os.path.join(namespace_path, "vectors.npy")):
+                    store = NamespaceStore(self._dimension_on_disk(namespace_path), namespace_path)
+                    self._namespaces[self._decode_namespace(namespace)] = store
+                    self.dimension = self.dimension or store.dimension
+        logging.info(f"LocalIndex '{name}' ready ({len(self._namespaces)} namespaces, storage: {path or 'memory'}).")
+
+    @staticmethod
+    def _dimension_on_disk(namespace_path):
+        return np.load(os.path.join(namespace_path, "vectors.npy"), mmap_mode="r").shape[1]
+
+    # Namespaces become directory names, so "" (Pinecone's default namespace) needs a stand-in.
+    @staticmethod
+    def _encode_namespace(namespace):
+        return namespace or "__default__"
+
+    @staticmethod
+    def _decode_namespace(directory):
+        return "" if directory == "__default__" else directory
+
+    def _store(self, namespace, create=False):
+        store = self._namespaces.get(namespace)
+        if store is None and create:
+            namespace_path = os.path.join(self.path, self._encode_namespace(namespace)) if self.path else None
+            store = NamespaceStore(self.dimension, namespace_path)
+            self._namespaces[namespace] = store
+        return store
+
+    def upsert(self, vectors, namespace=""):
+        parsed = [_parse_vector(v) for v in vectors]
+        if not parsed:
+            return Record(upserted_count=0)
+        with self._lock:
+            if self.dimension is None:
+                self.dimension = len(parsed[0][1])
+            store = self._store(namespace, create=True)
+            store.upsert([p[0] for p in parsed], [p[1] for p in parsed], [p[2] for p in parsed])
+            if self.autosave:
+                store.flush()
+        return Record(upserted_count=len(parsed))
+
+    def configure_namespace(self, namespace, ann="ivf", nlist=256, nprobe=8, min_train_size=None):
+        """
+        Selects the search engine for one namespace: ann="ivf" (IVF-Flat) or ann=None (exact brute force).
+        Calling it again on an IVF namespace with a new nprobe only retunes recall/latency (no retraining).
+        """
+        with self._lock:
+            if self.dimension is None and ann is not None:
+                raise ValueError("Upsert vectors (or pass dimension) before configuring a namespace.")
+            store = self._store(namespace, create=True)
+            if ann is None:
+                store.configure_ann(None)
+            elif ann != "ivf":
+                raise ValueError(f"Unknown ann engine '{ann}'. Use 'ivf' or None.")
+            elif store.ann is not None and store.ann.nlist == nlist:
+                store.ann.nprobe = nprobe
+            else:
+                store.configure_ann(IVFFlatIndex(nlist=nlist, nprobe=nprobe, min_train_size=min_train_size))
+            if self.autosave:
+                store.flush()
+
+    def query(self, vector, namespace="", top_k=10, include_metadata=False, include_values=False, nprobe=None, **kwargs):
+        with self._lock:
+            store = self._store(namespace)
+            if store is None:
+                return Record(matches=[], namespace=namespace)
+            query = np.asarray(vector, dtype=np.float32)
+            query = query / (np.linalg.norm(query) or 1.0)
+            positions, scores = store.search(query, top_k, nprobe)
+            matches = []
+            for position, score in zip(positions, scores):
+                match = Record(id=store.ids[position], score=float(score))
+                if include_metadata:
+                    match["metadata"] = store.metadata[position]
+                if include_values:
+                    match["values"] = store.vectors[position].tolist()
+                matches.append(match)
+        return Record(matches=matches, namespace=namespace)
+
+    def fetch(self, ids, namespace=""):
+        with self._lock:
+            store = self._store(namespace)
+            vectors = {}
+            for vector_id in ids:
+                position = store.positions.get(vector_id) if store else None
+                if position is not None:
+                    vectors[vector_id] = Record(id=vector_id, values=store.vectors[position].tolist(), metadata=store.metadata[position])
+        return Record(vectors=vectors, namespace=namespace)
+
+    def delete(self, ids=None, delete_all=False, namespace="", **kwargs):
+        with self._lock:
+            store = self._store(namespace)
+            if store is None:
+                return Record()
+            if delete_all:
+                store.delete(list(store.ids))
+            elif ids:
+                store.delete(ids)
+            if self.autosave:
+                store.flush()
+        return Record()
+
+    def describe_index_stats(self, **kwargs):
+        with self._lock:
+            namespaces = {ns: Record(vector_count=store.count) for ns, store in self._namespaces.items()}
+        return Record(
+            dimension=self.dimension,
+            namespaces=namespaces,
+            total_vector_count=sum(ns.vector_count for ns in namespaces.values()),
+        )
+
+    def persist(self):
+        """Writes every namespace's pending changes to disk (only needed when autosave=False)."""
+        with self._lock:
+            for store in self._namespaces.values():
+                store.flush()
+
+# === 5. The Local Client (stands in for `pc`) ===
+class LocalVectorClient:
+    """
+    Stands in for a Pinecone client: context_engine(..., pc=LocalVectorClient(path), ...)
+    works unchanged because it only calls pc.Index(index_name).
+    """
+    def __init__(self, path=None, autosave=True):
+        self.path = path
+        self.autosave = autosave
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def _index_path(self, name):
+        return os.path.join(self.path, name) if self.path else None
+
+    def create_index(self, name, dimension, metric="cosine", spec=None, **kwargs):
+        if metric != "cosine":
+            raise ValueError("LocalVectorClient only supports the 'cosine' metric.")
+        with self._lock:
+            if name not in self._indexes:
+                self._indexes[name] = LocalIndex(name, dimension, self._index_path(name), self.autosave)
+            return self._indexes[name]
+
+    def Index(self, name):
+        with self._lock:
+            if name not in self._indexes:
+                self._indexes[name] = LocalIndex(name, path=self._index_path(name), autosave=self.autosave)
+            return self._indexes[name]
+
+    def list_indexes(self):
+        names = set(self._indexes)
+        if self.path and os.path.isdir(self.path):
+            names.update(d for d in os.listdir(self.path) if os.path.isdir(os.path.join(self.path, d)))
+        return _IndexList(sorted(names))
+
+    def describe_index(self, name):
+        return Record(name=name, status={"ready": True})
+
+    def delete_index(self, name):
+        with self._lock:
+            index = self._indexes.pop(name, None)
+        if index is not None:
+            index._namespaces.clear()
+        if self.path and os.path.isdir(self._index_path(name)):
+            shutil.rmtree(self._index_path(name))
+
+class _IndexList(list):
+    def names(self):
+        return list(self)
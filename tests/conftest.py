@@ -0,0 +1,56 @@
+# conftest.py
+# Shared fixtures: the engine's flat modules on sys.path, an offline tokenizer,
+# and the deterministic OpenAI/Pinecone stand-ins from benchmark.py.
+
+import os
+import sys
+import types
+
+import pytest
+
+ENGINE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "commons", "engine")
+sys.path.insert(0, ENGINE_DIR)
+
+import helpers  # noqa: E402
+import ingestion  # noqa: E402
+from benchmark import BENCHMARK_CONFIG, FakeOpenAI, FakePinecone, OfflineEncoding  # noqa: E402
+
+@pytest.fixture(autouse=True, scope="session")
+def offline_tokenizer():
+    """tiktoken downloads its encodings on first use; every test counts and chunks with OfflineEncoding."""
+    encoding = OfflineEncoding()
+    previous = helpers.set_token_encoding(encoding)
+    previous_tokenizer, ingestion._TOKENIZER = ingestion._TOKENIZER, encoding
+    yield encoding
+    helpers.set_token_encoding(previous)
+    ingestion._TOKENIZER = previous_tokenizer
+
+@pytest.fixture
+def client():
+    return FakeOpenAI(profile="zero")
+
+@pytest.fixture
+def pc():
+    return FakePinecone(profile="zero")
+
+@pytest.fixture
+def config():
+    return dict(BENCHMARK_CONFIG)
+
+class FakeAsyncOpenAI:
+    """AsyncOpenAI twin of FakeOpenAI: the same deterministic responses, awaited."""
+    def __init__(self, fake):
+        self.fake = fake
+
+        async def create_chat(**kwargs):
+            return fake._chat(**kwargs)
+
+        async def create_embedding(**kwargs):
+            return fake._embed(**kwargs)
+
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=create_chat))
+        self.embeddings = types.SimpleNamespace(create=create_embedding)
+
+@pytest.fixture
+def async_client(client):
+    return FakeAsyncOpenAI(client)
@@ -0,0 +1,47 @@
+import asyncio
+import inspect
+
+import pytest
+
+from engine import async_context_engine, context_engine
+from registry import AgentRegistry
+
+PLAN = [
+    {"step": 1, "agent": "Librarian", "input": {"intent_query": "precise legal answer"}},
+    {"step": 2, "agent": "Researcher", "input": {"topic_query": "NDA confidentiality"}},
+    {"step": 3, "agent": "Writer", "input": {"blueprint": "$$STEP_1_OUTPUT$$", "facts": "$$STEP_2_OUTPUT$$"}},
+]
+FAILING_PLAN = [
+    {"step": 1, "agent": "Librarian", "input": {"intent_query": "precise legal answer"}},
+    {"step": 2, "agent": "Bogus", "input": {"topic_query": "anything"}},
+    {"step": 3, "agent": "Researcher", "input": {"topic_query": "NDA confidentiality"}},
+    {"step": 4, "agent": "Writer", "input": {"blueprint": "$$STEP_1_OUTPUT$$", "facts": "$$STEP_3_OUTPUT$$"}},
+]
+
+def test_async_engine_is_sequential_unless_callers_opt_in():
+    assert inspect.signature(async_context_engine).parameters["max_concurrency"].default == 1
+
+def test_async_engine_matches_sync_engine(client, async_client, pc, config):
+    goal = "Explain the NDA"
+    client.plans[goal] = PLAN
+    sync_result, _ = context_engine(goal, client=client, pc=pc, **config)
+    async_result, trace = asyncio.run(async_context_engine(goal, client=async_client, pc=pc, max_concurrency=4, **config))
+    assert trace.status == "Success"
+    assert [step["step"] for step in trace.steps] == [1, 2, 3]
+    assert async_result == sync_result
+
+def test_async_engine_stops_after_a_failure(client, async_client, pc, config):
+    goal = "Explain the NDA"
+    client.plans[goal] = FAILING_PLAN
+    result, trace = asyncio.run(async_context_engine(goal, client=async_client, pc=pc, max_concurrency=4, **config))
+    assert result is None
+    assert trace.status == "Failed at Step 2"
+    assert [step["step"] for step in trace.steps] == [1]
+
+def test_registry_loads_agent_modules_without_async_twins(monkeypatch):
+    import agents_k15
+    monkeypatch.setattr("registry.agents", agents_k15)
+    registry = AgentRegistry()
+    assert registry.async_registry["Writer"] is None
+    with pytest.raises(ValueError):
+        registry.get_async_handler("Writer", None, None, "m", "e", "ctx", "kb")
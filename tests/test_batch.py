@@ -0,0 +1,19 @@
+from batch import SharedIndexProvider, percentile, run_goals
+
+def test_run_goals_runs_every_goal_and_summarizes(client, pc, config):
+    goals = [f"Explain clause {n}" for n in range(6)]
+    batch = run_goals(goals, config, client, pc, concurrency=3)
+    completed = list(batch)
+    assert sorted(goal for goal, _, _ in completed) == sorted(goals)
+    assert all(trace.status == "Success" for _, _, trace in completed)
+    assert batch.summary["goals"] == batch.summary["succeeded"] == 6
+    assert batch.summary["tokens_total"] == batch.summary["tokens_in"] + batch.summary["tokens_out"]
+
+def test_goals_share_one_index_handle(pc):
+    provider = SharedIndexProvider(pc)
+    assert provider.Index("idx") is provider.Index("idx")
+
+def test_percentile_uses_nearest_rank():
+    assert percentile([], 50) == 0.0
+    assert percentile([4, 1, 3, 2], 50) == 2
+    assert percentile([4, 1, 3, 2], 95) == 4
@@ -0,0 +1,53 @@
+import pytest
+
+import helpers
+from benchmark import SCENARIOS, FakeOpenAI, OfflineEncoding, run_benchmark
+from cache import ResponseCache
+from engine import context_engine, set_trace_sinks
+from helpers import set_response_cache
+from trace_sinks import RingBufferSink
+
+GOAL = "Explain the NDA"
+
+def test_benchmark_runs_offline():
+    report = run_benchmark(profile="zero", repeats=1, concurrency=2)
+    assert report["scenarios"]
+    for stats in report["scenarios"].values():
+        assert stats["succeeded"] == stats["goals"]
+
+def test_baseline_pass_does_not_warm_installed_caches():
+    cache = ResponseCache()
+    set_response_cache(cache)
+    try:
+        report = run_benchmark({"one": SCENARIOS["ch8_legal"]}, profile="zero", repeats=1, concurrency=1)
+    finally:
+        set_response_cache(None)
+    assert helpers._RESPONSE_CACHE is None
+    assert report["scenarios"]["one"]["api_calls_per_goal"]["chat"] > 0
+
+def test_fake_client_is_deterministic():
+    first, second = FakeOpenAI(profile="zero"), FakeOpenAI(profile="zero")
+    messages = [{"role": "user", "content": "hello"}]
+    assert first._chat(model="m", messages=messages).choices[0].message.content == \
+        second._chat(model="m", messages=messages).choices[0].message.content
+    assert first.embed_text("hello") == second.embed_text("hello")
+
+@pytest.mark.parametrize("text", ["", "plain words", "  indented\n\nlines  ", "numbers 12,345.67 and (a)—(b)"])
+def test_offline_encoding_round_trips(text):
+    encoding = OfflineEncoding()
+    assert encoding.decode(encoding.encode(text)) == text
+    assert encoding.decode_batch(encoding.encode_batch([text, text])) == [text, text]
+
+def test_planning_is_timed_as_its_own_span(client, pc, config):
+    ring = RingBufferSink()
+    set_trace_sinks([ring])
+    try:
+        _, trace = context_engine(GOAL, client=client, pc=pc, **config)
+    finally:
+        set_trace_sinks([])
+    plan_record = ring.snapshot(trace.trace_id)[0]
+    assert plan_record["spans"]["name"] == "planner"
+    assert plan_record["spans"] == trace.plan_spans
+    planner = trace.latency_breakdown()[0]
+    assert (planner["step"], planner["agent"]) == (None, "Planner")
+    assert planner["total_ms"] >= 0
@@ -0,0 +1,41 @@
+import utils
+from utils import ClientManager, get_client_manager, set_client_manager
+
+class RecordingPinecone:
+    """Accepts the pool arguments the real Pinecone client takes."""
+    def __init__(self):
+        self.opened = []
+
+    def Index(self, name, **pool_options):
+        self.opened.append((name, pool_options))
+        return object()
+
+def test_index_handles_are_created_once():
+    manager = ClientManager(max_connections=10)
+    manager._pinecone = RecordingPinecone()
+    first = manager.Index("idx")
+    assert manager.Index("idx") is first
+    stats = manager.pool_stats()["pinecone"]
+    assert (stats["index_handles_created"], stats["index_handle_reuses"]) == (1, 1)
+    manager.forget_index("idx")
+    assert manager.Index("idx") is not first
+    assert manager._pinecone.opened[0] == ("idx", {"pool_threads": 10, "connection_pool_maxsize": 10})
+
+def test_openai_clients_share_one_pool():
+    manager = ClientManager(openai_api_key="test-key")
+    try:
+        assert manager.openai is manager.openai
+        assert manager.pool_stats()["openai"]["max_connections"] == 100
+    finally:
+        manager.close()
+    assert manager._openai is None
+
+def test_the_process_wide_manager_is_created_once():
+    previous = utils._CLIENT_MANAGER
+    set_client_manager(None)
+    try:
+        manager = get_client_manager(max_connections=5)
+        assert get_client_manager(max_connections=50) is manager
+        assert manager.max_connections == 5
+    finally:
+        set_client_manager(previous)
@@ -0,0 +1,50 @@
+from agents_k15 import agent_researcher
+from helpers import count_tokens, create_mcp_message, pack_context
+
+def _match(source, text):
+    return {"id": source, "score": 0.9, "metadata": {"source": source, "text": text}}
+
+def _sentences(prefix, count):
+    return " ".join(f"{prefix} sentence number {n} states a distinct fact." for n in range(count))
+
+def test_everything_fits_within_a_large_budget():
+    matches = [_match("a", _sentences("alpha", 3)), _match("b", _sentences("beta", 3))]
+    packed, stats = pack_context(matches, token_budget=10_000)
+    assert packed.startswith("SOURCE: a\nCONTENT: alpha") and "SOURCE: b" in packed
+    assert stats["chunks_packed"] == 2 and stats["tokens_discarded"] == 0
+    assert 0 < stats["tokens_packed"] <= 10_000
+
+def test_near_duplicates_are_dropped():
+    text = _sentences("alpha", 5)
+    matches = [_match("a", text), _match("copy", text + " Extra."), _match("b", _sentences("beta", 5))]
+    packed, stats = pack_context(matches, token_budget=10_000)
+    assert "SOURCE: copy" not in packed
+    assert stats["chunks_duplicate"] == 1 and stats["chunks_packed"] == 2
+
+def test_the_chunk_that_overflows_is_cut_at_a_sentence_boundary():
+    matches = [_match("a", _sentences("alpha", 4)), _match("b", _sentences("beta", 20)), _match("c", _sentences("gamma", 4))]
+    budget = count_tokens(pack_context(matches[:1], 10_000)[0]) + 60
+    packed, stats = pack_context(matches, token_budget=budget)
+    assert stats["tokens_packed"] <= budget
+    assert stats["chunks_truncated"] == 1 and stats["chunks_dropped"] == 1
+    assert packed.endswith("fact.") and "gamma" not in packed
+
+def test_a_top_chunk_with_no_fitting_sentence_is_hard_truncated():
+    matches = [_match("a", "word " * 400), _match("b", _sentences("beta", 3))]
+    packed, stats = pack_context(matches, token_budget=40)
+    assert packed.startswith("SOURCE: a\nCONTENT: word")
+    assert 0 < stats["tokens_packed"] <= 40
+    assert stats["chunks_truncated"] == 1 and stats["chunks_dropped"] == 1
+
+class _StubIndex:
+    def __init__(self, matches):
+        self.matches = matches
+
+    def query(self, **kwargs):
+        return {"matches": self.matches}
+
+def test_researcher_context_is_not_empty_when_nothing_fits_whole(client):
+    index = _StubIndex([_match("a", "word " * 400)])
+    message = create_mcp_message("Planner", {"topic_query": "words", "token_budget": 40})
+    result = agent_researcher(message, client, index, "gpt-5.1", "text-embedding-3-small", "KnowledgeStore")
+    assert result["metadata"]["context_packing"]["tokens_packed"] > 0
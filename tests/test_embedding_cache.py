@@ -0,0 +1,32 @@
+import pytest
+
+from cache import EmbeddingCache
+from helpers import get_embedding
+
+def test_embedding_cache_normalizes_text_and_persists(tmp_path, client):
+    path = str(tmp_path / "embeddings")
+    cache = EmbeddingCache(disk_path=path)
+    vector = get_embedding("hello\nworld", client=client, embedding_model="e", cache=cache)
+    # Vectors are stored as float32.
+    assert get_embedding("hello world", client=client, embedding_model="e", cache=cache) == pytest.approx(vector, abs=1e-6)
+    assert client.latency.calls["embedding"] == 1
+    cache.close()
+    reopened = EmbeddingCache(disk_path=path)
+    assert reopened.get("hello world", "e") == pytest.approx(vector, abs=1e-6)
+    reopened.close()
+
+def test_embedding_cache_is_keyed_by_model(client):
+    cache = EmbeddingCache()
+    get_embedding("hello", client=client, embedding_model="e", cache=cache)
+    get_embedding("hello", client=client, embedding_model="other", cache=cache)
+    assert client.latency.calls["embedding"] == 2
+
+def test_embedding_cache_only_folds_what_the_api_request_folds(client):
+    cache = EmbeddingCache()
+    get_embedding("hello world", client=client, embedding_model="e", cache=cache)
+    get_embedding("hello\nworld", client=client, embedding_model="e", cache=cache)
+    assert client.latency.calls["embedding"] == 1
+    # The API would embed these differently, so they must not share an entry.
+    get_embedding("hello  world", client=client, embedding_model="e", cache=cache)
+    get_embedding(" hello world", client=client, embedding_model="e", cache=cache)
+    assert client.latency.calls["embedding"] == 3
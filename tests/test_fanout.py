@@ -0,0 +1,29 @@
+from engine import context_engine
+from helpers import prefetch_scope, query_namespaces, query_pinecone
+
+def test_fan_out_embeds_once_and_matches_single_queries(client, pc, config):
+    index = pc.Index(config["index_name"])
+    queries = {config["namespace_context"]: ("precise legal answer", 1), config["namespace_knowledge"]: "NDA confidentiality"}
+    results = query_namespaces(queries, index, client, config["embedding_model"], top_k=3)
+    assert client.latency.calls["embedding"] == 1
+    assert results[config["namespace_context"]] == query_pinecone(
+        "precise legal answer", config["namespace_context"], 1, index, client, config["embedding_model"])
+    assert results[config["namespace_knowledge"]] == query_pinecone(
+        "NDA confidentiality", config["namespace_knowledge"], 3, index, client, config["embedding_model"])
+
+def test_query_pinecone_serves_prefetched_matches(client, pc, config):
+    index = pc.Index(config["index_name"])
+    namespace = config["namespace_knowledge"]
+    matches = [{"id": "m1"}, {"id": "m2"}, {"id": "m3"}]
+    with prefetch_scope({(namespace, "NDA"): (3, matches)}):
+        assert query_pinecone("NDA", namespace, 2, index, client, config["embedding_model"]) == matches[:2]
+        # A larger top_k than was prefetched goes to the index.
+        assert len(query_pinecone("NDA", namespace, 5, index, client, config["embedding_model"])) == 5
+    assert client.latency.calls["embedding"] == 1
+
+def test_engine_serves_agent_retrieval_from_the_fan_out(client, pc, config):
+    goal = "Explain the NDA"
+    result, trace = context_engine(goal, client=client, pc=pc, **config)
+    assert trace.status == "Success"
+    assert trace.counters.get("retrieval_prefetch_hits", 0) >= 1
+    assert result
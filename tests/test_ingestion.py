@@ -0,0 +1,176 @@
+import io
+import json
+import random
+
+import pytest
+
+from ingestion import IngestionCheckpoint, IngestionPipeline, chunk_text, chunk_texts, ingest_documents, iter_chunks
+from vector_store import LocalIndex
+
+WORDS = ["confidential", "party", "agreement", "shall", "disclose", "term", "notice", "the", "of", "12.5%", "(a)", "—"]
+
+def _document(seed, words=1500):
+    rng = random.Random(seed)
+    text = []
+    for i in range(words):
+        text.append(rng.choice(WORDS))
+        if i % 37 == 36:
+            text.append("\n\n")
+    return " ".join(text)
+
+DOCUMENTS = [_document(seed) for seed in range(5)] + ["", "short text", "  leading and trailing  \n"]
+
+class FlakyIndex(LocalIndex):
+    """Fails its n-th upsert once, like a dropped connection."""
+    def __init__(self, fail_on):
+        super().__init__("idx")
+        self.fail_on = fail_on
+        self.upserts = 0
+
+    def upsert(self, vectors, namespace=""):
+        self.upserts += 1
+        if self.upserts == self.fail_on:
+            raise ConnectionError("connection reset")
+        return super().upsert(vectors, namespace=namespace)
+
+def test_pipeline_upserts_every_chunk(client):
+    index = LocalIndex("idx")
+    documents = {f"doc{n}": _document(n, words=400) for n in range(4)}
+    stats = ingest_documents(documents, index, client, "e", "kb", chunk_size=64, overlap=16, batch_size=8,
+                             embed_workers=3, upsert_workers=2)
+    expected = sum(len(chunk_text(text, 64, 16)) for text in documents.values())
+    assert stats["vectors_upserted"] == stats["chunks"] == expected
+    assert index.describe_index_stats().total_vector_count == expected
+    metadata = index.fetch(["doc2_chunk_1"], namespace="kb").vectors["doc2_chunk_1"].metadata
+    assert metadata == {"text": chunk_text(documents["doc2"], 64, 16)[1], "source": "doc2"}
+
+def test_a_failed_run_resumes_from_its_checkpoint(tmp_path, client):
+    documents = {f"doc{n}": _document(n, words=400) for n in range(4)}
+    checkpoint = str(tmp_path / "ingest.checkpoint.json")
+    index = FlakyIndex(fail_on=3)
+    options = dict(chunk_size=64, overlap=16, batch_size=8, upsert_workers=1, checkpoint_path=checkpoint)
+    with pytest.raises(ConnectionError):
+        IngestionPipeline(index, client, "e", "kb", **options).run(documents)
+    stats = IngestionPipeline(index, client, "e", "kb", **options).run(documents)
+    assert stats["skipped_batches"] >= 2
+    assert stats["vectors_upserted"] < stats["chunks"]
+    assert index.describe_index_stats().total_vector_count == stats["chunks"]
+
+def test_checkpoints_from_other_settings_are_ignored(tmp_path):
+    path = str(tmp_path / "ingest.checkpoint.json")
+    IngestionCheckpoint(path, "settings-a").mark_done("batch-1")
+    assert IngestionCheckpoint(path, "settings-a").is_done("batch-1")
+    assert not IngestionCheckpoint(path, "settings-b").is_done("batch-1")
+
+def _pipeline(index, client, tmp_path, prune_missing=False):
+    return IngestionPipeline(index, client, "e", "kb", chunk_size=64, overlap=16, batch_size=8,
+                             manifest_path=str(tmp_path / "manifest.json"), prune_missing=prune_missing)
+
+def test_rerun_with_a_manifest_only_embeds_what_changed(tmp_path, client):
+    index = LocalIndex("idx")
+    documents = {f"doc{n}": _document(n, words=400) for n in range(3)}
+    first = _pipeline(index, client, tmp_path).run(documents)
+    assert first["vectors_upserted"] == first["chunks"] > 0
+
+    again = _pipeline(index, client, tmp_path).run(documents)
+    assert again["unchanged_documents"] == 3
+    assert again["vectors_upserted"] == 0
+
+    # Appending to a document leaves its earlier chunks as they were.
+    documents["doc1"] += " appended clause"
+    edited = _pipeline(index, client, tmp_path).run(documents)
+    assert edited["unchanged_documents"] == 2
+    assert 0 < edited["vectors_upserted"] < len(chunk_text(documents["doc1"], 64, 16))
+    assert edited["unchanged_chunks"] + edited["vectors_upserted"] == edited["chunks"]
+
+    removed_chunks = len(chunk_text(documents.pop("doc2"), 64, 16))
+    pruned = _pipeline(index, client, tmp_path, prune_missing=True).run(documents)
+    assert pruned["deleted_vectors"] == removed_chunks
+    expected = sum(len(chunk_text(text, 64, 16)) for text in documents.values())
+    assert index.describe_index_stats().total_vector_count == expected
+    assert not index.fetch(["doc2_chunk_0"], namespace="kb").vectors
+
+def test_a_partial_run_keeps_the_other_documents(tmp_path, client):
+    index = LocalIndex("idx")
+    documents = {f"doc{n}": _document(n, words=400) for n in range(3)}
+    _pipeline(index, client, tmp_path).run(documents)
+    total = index.describe_index_stats().total_vector_count
+    # Re-ingesting one updated file must not delete the documents it was not given.
+    stats = _pipeline(index, client, tmp_path).run({"doc1": documents["doc1"] + " amended"})
+    assert stats["deleted_vectors"] == 0
+    assert index.describe_index_stats().total_vector_count >= total
+    assert index.fetch(["doc0_chunk_0", "doc2_chunk_0"], namespace="kb").vectors.keys() == {"doc0_chunk_0", "doc2_chunk_0"}
+
+def test_iter_chunks_matches_chunk_text_for_streams_and_files(tmp_path):
+    for n, text in enumerate(DOCUMENTS):
+        expected = chunk_text(text, 64, 16)
+        for read_size in (7, 100, 1 << 20):
+            assert list(iter_chunks(io.StringIO(text), 64, 16, read_size=read_size)) == expected
+        path = tmp_path / f"doc{n}.txt"
+        path.write_text(text, encoding="utf-8")
+        assert list(iter_chunks(path, 64, 16, read_size=50)) == expected
+
+def test_iter_chunks_accepts_an_iterable_of_strings():
+    text = DOCUMENTS[0]
+    pieces = [text[i:i + 333] for i in range(0, len(text), 333)]
+    assert list(iter_chunks(pieces, 64, 16, read_size=100)) == chunk_text(text, 64, 16)
+
+def test_chunk_texts_matches_chunk_text():
+    for chunk_size, overlap in ((400, 50), (64, 16)):
+        expected = [chunk_text(text, chunk_size, overlap) for text in DOCUMENTS]
+        assert chunk_texts(DOCUMENTS, chunk_size, overlap, num_threads=3) == expected
+
+def test_pipeline_chunks_text_documents_in_groups(client):
+    documents = {f"doc{n}": text for n, text in enumerate(DOCUMENTS)}
+    stats = ingest_documents(documents, LocalIndex("idx"), client, "e", "kb", chunk_size=64, overlap=16, chunk_group=3)
+    assert stats["chunks"] == sum(len(chunk_text(text, 64, 16)) for text in DOCUMENTS)
+
+def _counting_pieces(text, size, consumed):
+    for i in range(0, len(text), size):
+        consumed.append(i)
+        yield text[i:i + size]
+
+@pytest.mark.parametrize("text", ["数据" * 50_000, "QUJD" * 25_000, " ".join(str(n) for n in range(30_000))],
+                         ids=["cjk", "base64", "numbers"])
+def test_iter_chunks_stays_bounded_without_word_boundaries(text):
+    consumed = []
+    chunks = iter_chunks(_counting_pieces(text, 100, consumed), chunk_size=4, overlap=1, read_size=100)
+    assert next(chunks)
+    # The first chunk arrives after a few read pieces, not after the whole document was buffered.
+    assert len(consumed) < 20
+    assert "".join(chunk.replace(" ", "") for chunk in chunks)
+
+def test_forced_cuts_at_whitespace_keep_numeric_runs_identical():
+    text = " ".join(str(n) for n in range(5_000))
+    assert list(iter_chunks(io.StringIO(text), 64, 16, read_size=50)) == chunk_text(text, 64, 16)
+
+def test_checkpoint_appends_one_line_per_batch(tmp_path):
+    path = tmp_path / "ingest.checkpoint.jsonl"
+    checkpoint = IngestionCheckpoint(str(path), "settings")
+    for n in range(5):
+        checkpoint.mark_done(f"batch-{n}")
+    checkpoint.close()
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 5
+    assert IngestionCheckpoint(str(path), "settings").completed == {f"batch-{n}" for n in range(5)}
+
+def test_checkpoint_recovers_from_a_torn_line(tmp_path):
+    path = tmp_path / "ingest.checkpoint.jsonl"
+    checkpoint = IngestionCheckpoint(str(path), "settings")
+    checkpoint.mark_done("batch-1")
+    checkpoint.mark_done("batch-2")
+    checkpoint.close()
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('"batch-')
+    resumed = IngestionCheckpoint(str(path), "settings")
+    resumed.mark_done("batch-3")
+    resumed.close()
+    assert IngestionCheckpoint(str(path), "settings").completed == {"batch-1", "batch-2", "batch-3"}
+
+def test_checkpoint_reads_the_single_json_format(tmp_path):
+    path = tmp_path / "ingest.checkpoint.json"
+    path.write_text(json.dumps({"fingerprint": "settings", "completed": ["batch-1"]}), encoding="utf-8")
+    checkpoint = IngestionCheckpoint(str(path), "settings")
+    checkpoint.mark_done("batch-2")
+    checkpoint.close()
+    assert IngestionCheckpoint(str(path), "settings").completed == {"batch-1", "batch-2"}
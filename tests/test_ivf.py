@@ -0,0 +1,98 @@
+import os
+
+import numpy as np
+import pytest
+
+from vector_store import IVFFlatIndex, LocalIndex, LocalVectorClient
+
+DIM = 32
+
+def _clustered(count, seed, centers=40):
+    rng = np.random.default_rng(seed)
+    means = np.random.default_rng(1234).normal(size=(centers, DIM))
+    return (means[rng.integers(0, centers, count)] + 0.3 * rng.normal(size=(count, DIM))).astype(np.float32)
+
+def _vectors(prefix, matrix):
+    return [(f"{prefix}{i}", row.tolist(), {"n": i}) for i, row in enumerate(matrix)]
+
+def _recall(index, queries, top_k=10):
+    hits = 0
+    for query in queries:
+        approximate = {m.id for m in index.query(query.tolist(), top_k=top_k).matches}
+        exact = {m.id for m in index.query(query.tolist(), top_k=top_k, nprobe=10_000).matches}
+        hits += len(approximate & exact)
+    return hits / (top_k * len(queries))
+
+def test_ivf_recall_holds_for_vectors_added_after_training():
+    index = LocalIndex("idx")
+    index.upsert(_vectors("base", _clustered(4000, seed=0)))
+    index.configure_namespace("", nlist=32, nprobe=8)
+    assert index._store("").ann.trained
+    # Added incrementally: assigned to the existing centroids, no retraining.
+    for start in range(0, 2000, 100):
+        index.upsert(_vectors(f"new{start}_", _clustered(100, seed=start + 1)))
+    queries = _clustered(50, seed=99)
+    assert _recall(index, queries) >= 0.9
+
+def test_ivf_tracks_overwritten_and_deleted_rows():
+    index = LocalIndex("idx")
+    index.upsert(_vectors("v", _clustered(3000, seed=3)))
+    index.configure_namespace("", nlist=16, nprobe=16)
+    target = np.ones(DIM, dtype=np.float32)
+    index.upsert([("v0", target.tolist(), {})])
+    assert index.query(target.tolist(), top_k=1).matches[0].id == "v0"
+    index.delete(ids=["v0"])
+    assert index.query(target.tolist(), top_k=1).matches[0].id != "v0"
+    assert index.describe_index_stats().total_vector_count == 2999
+
+def test_ivf_train_assigns_every_vector():
+    vectors = _clustered(2000, seed=5)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    ivf = IVFFlatIndex(nlist=16)
+    ivf.train(vectors)
+    assert len(ivf.assignment) == 2000
+    assert sum(len(ivf._cell(j)) for j in range(16)) == 2000
+
+def test_persisted_ann_reloads_with_the_same_results(tmp_path):
+    index = LocalVectorClient(str(tmp_path)).Index("idx")
+    index.upsert(_vectors("v", _clustered(3000, seed=7)))
+    index.configure_namespace("", nlist=16, nprobe=4)
+    index.upsert(_vectors("late", _clustered(50, seed=8)))
+    index.delete(ids=["v1"])
+    query = _clustered(1, seed=9)[0].tolist()
+    before = [m.id for m in index.query(query, top_k=10).matches]
+
+    reloaded = LocalVectorClient(str(tmp_path)).Index("idx")
+    assert reloaded.describe_index_stats().total_vector_count == 3049
+    assert [m.id for m in reloaded.query(query, top_k=10).matches] == before
+    assert reloaded.fetch(["late3"]).vectors["late3"].metadata == {"n": 3}
+
+def test_upserts_do_not_rewrite_centroids_or_assignments(tmp_path):
+    index = LocalVectorClient(str(tmp_path)).Index("idx")
+    index.upsert(_vectors("v", _clustered(2000, seed=10)))
+    index.configure_namespace("", nlist=16, min_train_size=1000)
+    # Regrows the matrix (and assignment) to 4000 rows, leaving room for the single upserts below.
+    index.upsert(_vectors("grow", _clustered(1500, seed=11)))
+    namespace = tmp_path / "idx" / "__default__"
+    files = {name: os.stat(namespace / name) for name in ("vectors.npy", "records.json", "centroids.npy", "assignment.npy")}
+    for i in range(20):
+        index.upsert([(f"one{i}", _clustered(1, seed=20 + i)[0].tolist(), {})])
+    for name, before in files.items():
+        after = os.stat(namespace / name)
+        # Same inode: patched in place (or untouched), never rewritten and renamed over.
+        assert after.st_ino == before.st_ino, name
+    assert os.stat(namespace / "centroids.npy").st_mtime_ns == files["centroids.npy"].st_mtime_ns
+    assert os.stat(namespace / "records.json").st_mtime_ns == files["records.json"].st_mtime_ns
+
+def test_trained_ann_survives_manual_persistence(tmp_path):
+    index = LocalVectorClient(str(tmp_path), autosave=False).Index("idx")
+    index.upsert([("a", [1.0, 0.0], {})])
+    index.configure_namespace("", nlist=4, min_train_size=4)
+    index.upsert([(f"v{i}", [1.0, i / 10], {}) for i in range(10)])
+    index.persist()
+    assert LocalVectorClient(str(tmp_path)).Index("idx")._store("").ann.trained
+
+def test_configure_requires_a_known_engine():
+    index = LocalIndex("idx", dimension=2)
+    with pytest.raises(ValueError):
+        index.configure_namespace("", ann="hnsw")
@@ -0,0 +1,36 @@
+from cache import PlanCache
+
+def test_plan_cache_hits_normalized_goals_and_returns_copies():
+    cache = PlanCache()
+    plan = [{"step": 1, "agent": "Researcher", "input": {"topic_query": "NDA"}}]
+    cache.set("Summarize the NDA.", "caps", "m", plan)
+    hit, match = cache.lookup("  summarize the nda ", "caps", "m")
+    assert (hit, match) == (plan, "exact")
+    hit[0]["input"]["topic_query"] = "changed"
+    assert cache.lookup("Summarize the NDA", "caps", "m")[0] == plan
+    assert cache.lookup("Summarize the NDA", "other caps", "m") == (None, None)
+
+def test_plan_cache_reparameterizes_similar_goals():
+    cache = PlanCache(embed_fn=lambda goal: [1.0, 0.0], similarity_threshold=0.5)
+    cache.set("Retrieve the NDA then summarize it", "caps", "m",
+              [{"step": 1, "agent": "Researcher", "input": {"topic_query": "NDA"}}])
+    plan, match = cache.lookup("Retrieve the lease then summarize it", "caps", "m")
+    assert match == "semantic"
+    assert plan[0]["input"]["topic_query"] == "lease"
+
+def test_plan_cache_persists_to_disk(tmp_path):
+    path = str(tmp_path / "plans.json")
+    plan = [{"step": 1, "agent": "Researcher", "input": {"topic_query": "NDA"}}]
+    PlanCache(disk_path=path).set("Summarize the NDA", "caps", "m", plan)
+    assert PlanCache(disk_path=path).lookup("Summarize the NDA", "caps", "m") == (plan, "exact")
+
+def test_plan_cache_load_keeps_only_the_most_recent_max_entries(tmp_path):
+    path = str(tmp_path / "plans.json")
+    plan = [{"step": 1, "agent": "Researcher", "input": {"topic_query": "NDA"}}]
+    cache = PlanCache(disk_path=path)
+    for n in range(5):
+        cache.set(f"Summarize document {n}", "caps", "m", plan)
+    reloaded = PlanCache(max_entries=2, disk_path=path)
+    assert len(reloaded._entries) == 2
+    assert reloaded.lookup("Summarize document 4", "caps", "m")[1] == "exact"
+    assert reloaded.lookup("Summarize document 0", "caps", "m")[1] is None
@@ -0,0 +1,67 @@
+import asyncio
+import threading
+import time
+
+from rate_limiter import RateLimiter, TokenBucket
+
+def test_token_bucket_wait_time():
+    bucket = TokenBucket(per_minute=60)
+    now = bucket.updated_at
+    assert bucket.wait_time(10, now) == 0.0
+    bucket.take(60)
+    assert abs(bucket.wait_time(1, now) - 1.0) < 1e-6
+    # Oversized requests are admitted once the bucket is full, instead of never.
+    assert abs(bucket.wait_time(600, now) - 60.0) < 1e-6
+
+def test_unmetered_models_never_wait():
+    limiter = RateLimiter({"m": {"rpm": 1}})
+    assert limiter.acquire("other", tokens=10_000) == 0.0
+
+def test_requests_are_spaced_by_the_rpm_limit():
+    limiter = RateLimiter({"m": {"rpm": 600}}, poll_interval=0.01)
+    # The bucket starts full, so drain it before timing the refill.
+    for _ in range(600):
+        limiter.acquire("m")
+    start = time.monotonic()
+    limiter.acquire("m")
+    limiter.acquire("m")
+    assert time.monotonic() - start >= 0.15
+
+def test_settle_charges_actual_usage():
+    limiter = RateLimiter({"m": {"tpm": 1000}}, poll_interval=0.01)
+    limiter.acquire("m", tokens=100)
+    limiter.settle("m", 900)
+    start = time.monotonic()
+    limiter.acquire("m", tokens=10)
+    assert time.monotonic() - start >= 0.5
+
+def test_planner_lane_goes_ahead_of_bulk_work():
+    limiter = RateLimiter({"m": {"rpm": 1200}}, poll_interval=0.005)
+    for _ in range(1200):
+        limiter.acquire("m")
+    order = []
+
+    def call(lane):
+        limiter.acquire("m", lane=lane)
+        order.append(lane)
+
+    threads = [threading.Thread(target=call, args=("bulk",)) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.02)
+    planner = threading.Thread(target=call, args=("planner",))
+    planner.start()
+    for thread in threads + [planner]:
+        thread.join()
+    assert order.index("planner") <= 1
+
+def test_async_acquire_waits_on_the_event_loop():
+    limiter = RateLimiter({"m": {"rpm": 600}}, poll_interval=0.01)
+
+    async def run():
+        for _ in range(600):
+            await limiter.async_acquire("m")
+        return await limiter.async_acquire("m")
+
+    assert asyncio.run(run()) > 0.05
+    assert limiter.stats()["admitted"] == 601
@@ -0,0 +1,77 @@
+import copy
+import random
+import re
+
+from engine_k15 import compile_plan, resolve_dependencies
+
+def _reference_resolve(input_params, state):
+    """The regex resolver engine_k15 shipped before inputs were compiled, kept as the oracle."""
+    resolved_input = copy.deepcopy(input_params)
+    pattern = r"\$\$(STEP_\d+_OUTPUT)\$\$"
+
+    def resolve(value):
+        if isinstance(value, str):
+            matches = re.findall(pattern, value)
+            if not matches:
+                return value
+            if re.fullmatch(pattern, value.strip()):
+                return state.get(matches[0], value)
+            for ref_key in matches:
+                replacement = str(state.get(ref_key, f"$${ref_key}$$"))
+                value = value.replace(f"$${ref_key}$$", replacement)
+            return value
+        elif isinstance(value, dict):
+            return {k: resolve(v) for k, v in value.items()}
+        elif isinstance(value, list):
+            return [resolve(item) for item in value]
+        return value
+
+    return resolve(resolved_input)
+
+STATE = {
+    "STEP_1_OUTPUT": "plain text",
+    "STEP_2_OUTPUT": {"facts": ["a", "b"], "score": 0.5},
+    "STEP_3_OUTPUT": ["x", {"y": 1}],
+    "STEP_4_OUTPUT": 42,
+}
+STRINGS = [
+    "", "no placeholders", "$$STEP_1_OUTPUT$$", "  $$STEP_2_OUTPUT$$\n", "$$STEP_3_OUTPUT$$",
+    "$$STEP_9_OUTPUT$$", "Use $$STEP_1_OUTPUT$$ and $$STEP_2_OUTPUT$$.", "$$STEP_4_OUTPUT$$$$STEP_4_OUTPUT$$",
+    "twice: $$STEP_1_OUTPUT$$ / $$STEP_1_OUTPUT$$", "missing $$STEP_7_OUTPUT$$ here", "$$STEP_X_OUTPUT$$", "$$ STEP_1_OUTPUT $$",
+]
+
+def _random_input(rng, depth=0):
+    kind = rng.random()
+    if depth < 3 and kind < 0.25:
+        return {f"k{i}": _random_input(rng, depth + 1) for i in range(rng.randint(0, 4))}
+    if depth < 3 and kind < 0.45:
+        return [_random_input(rng, depth + 1) for _ in range(rng.randint(0, 4))]
+    if kind < 0.9:
+        return rng.choice(STRINGS)
+    return rng.choice([None, 3, 2.5, True])
+
+def test_compiled_resolver_matches_the_regex_resolver():
+    rng = random.Random(0)
+    for _ in range(500):
+        plan = [{"step": n + 1, "agent": "Writer", "input": _random_input(rng)} for n in range(3)]
+        compiled = compile_plan(plan)
+        for step, node in zip(plan, compiled):
+            expected = _reference_resolve(step["input"], STATE)
+            assert resolve_dependencies(node, STATE) == expected
+            assert resolve_dependencies(step["input"], STATE) == expected
+
+def test_resolved_literals_are_copies_of_the_plan():
+    plan = [{"step": 1, "agent": "Writer", "input": {"options": {"tone": "formal"}, "tags": ["a"], "facts": "$$STEP_1_OUTPUT$$"}}]
+    original = copy.deepcopy(plan)
+    node = compile_plan(plan)[0]
+    first = resolve_dependencies(node, STATE)
+    first["options"]["tone"] = "casual"
+    first["tags"].append("b")
+    assert plan == original
+    assert resolve_dependencies(node, STATE) == {"options": {"tone": "formal"}, "tags": ["a"], "facts": "plain text"}
+
+def test_fully_literal_inputs_are_copied_too():
+    planned = {"blueprint": {"sections": ["intro"]}}
+    resolved = resolve_dependencies(compile_plan([{"input": planned}])[0], {})
+    resolved["blueprint"]["sections"].append("outro")
+    assert planned == {"blueprint": {"sections": ["intro"]}}
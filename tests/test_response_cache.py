@@ -0,0 +1,66 @@
+import helpers
+from cache import DirectoryCacheStore, ResponseCache, make_cache_key
+from helpers import call_llm_robust
+
+def test_cache_keys_do_not_collide_across_part_boundaries():
+    assert make_cache_key("a", "bc") != make_cache_key("ab", "c")
+
+def test_response_cache_evicts_least_recently_used():
+    cache = ResponseCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+def test_response_cache_expires_entries():
+    cache = ResponseCache(ttl=-1)
+    cache.set("a", 1)
+    assert cache.get("a") is None
+
+def test_response_cache_disk_tier_survives_a_new_instance(tmp_path):
+    for backend in ("sqlite", "directory"):
+        path = str(tmp_path / backend)
+        ResponseCache(disk_path=path, disk_backend=backend).set("key", "value")
+        assert ResponseCache(disk_path=path, disk_backend=backend).get("key") == "value"
+
+def test_call_llm_robust_serves_repeats_from_the_cache(client):
+    cache = ResponseCache()
+    first = call_llm_robust("system", "user", client=client, generation_model="m", cache=cache)
+    second = call_llm_robust("system", "user", client=client, generation_model="m", cache=cache)
+    assert first == second
+    assert client.latency.calls["chat"] == 1
+    assert cache.stats()["hits"] == 1
+
+def test_response_cache_setter_is_used_by_default(client):
+    cache = ResponseCache()
+    helpers.set_response_cache(cache)
+    try:
+        call_llm_robust("system", "user", client=client, generation_model="m")
+        call_llm_robust("system", "user", client=client, generation_model="m")
+    finally:
+        helpers.set_response_cache(None)
+    assert client.latency.calls["chat"] == 1
+
+def test_a_full_disk_tier_is_evicted_in_batches(tmp_path, monkeypatch):
+    calls = {"evict": 0, "len": 0}
+    evict, length = DirectoryCacheStore.evict, DirectoryCacheStore.__len__
+
+    def counted_evict(self, *args, **kwargs):
+        calls["evict"] += 1
+        return evict(self, *args, **kwargs)
+
+    def counted_len(self):
+        calls["len"] += 1
+        return length(self)
+
+    monkeypatch.setattr(DirectoryCacheStore, "evict", counted_evict)
+    monkeypatch.setattr(DirectoryCacheStore, "__len__", counted_len)
+    cache = ResponseCache(max_entries=1, disk_path=str(tmp_path / "disk"), disk_backend="directory", max_disk_entries=100)
+    for n in range(300):
+        cache.set(f"key{n}", n)
+    # One pass per 10 writes past the cap (plus the one at startup), not one per write.
+    assert calls["evict"] <= 25 and calls["len"] <= 25
+    assert len(cache.disk) <= 100
+    assert cache.get("key299") == 299 and cache.get("key0") is None
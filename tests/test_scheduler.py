@@ -0,0 +1,99 @@
+import inspect
+
+from benchmark import FakeOpenAI
+from engine import StepScheduler, context_engine
+
+PLAN = [
+    {"step": 1, "agent": "Librarian", "input": {"intent_query": "precise legal answer"}},
+    {"step": 2, "agent": "Researcher", "input": {"topic_query": "NDA confidentiality"}},
+    {"step": 3, "agent": "Writer", "input": {"blueprint": "$$STEP_1_OUTPUT$$", "facts": "$$STEP_2_OUTPUT$$"}},
+]
+
+def _failing_plan(agent):
+    # Step 3 does not depend on step 2, so a parallel run could start it before step 2 fails.
+    return [
+        {"step": 1, "agent": "Librarian", "input": {"intent_query": "precise legal answer"}},
+        {"step": 2, "agent": agent, "input": {"topic_query": "anything"}},
+        {"step": 3, "agent": "Researcher", "input": {"topic_query": "NDA confidentiality"}},
+        {"step": 4, "agent": "Writer", "input": {"blueprint": "$$STEP_1_OUTPUT$$", "facts": "$$STEP_3_OUTPUT$$"}},
+    ]
+
+def _drain(scheduler):
+    return [position for position, _, _ in scheduler.next_ready()]
+
+def test_scheduler_starts_independent_steps_together_and_waits_for_dependencies():
+    scheduler = StepScheduler(PLAN, max_concurrency=4)
+    assert _drain(scheduler) == [0, 1]
+    scheduler.complete(1, ({"content": "facts"},))
+    assert _drain(scheduler) == []
+    scheduler.complete(0, ({"content": "blueprint"},))
+    started = list(scheduler.next_ready())
+    assert [position for position, _, _ in started] == [2]
+    assert started[0][2] == {"STEP_1_OUTPUT": "blueprint", "STEP_2_OUTPUT": "facts"}
+
+def test_scheduler_respects_max_concurrency():
+    scheduler = StepScheduler(PLAN, max_concurrency=1)
+    assert _drain(scheduler) == [0]
+    scheduler.complete(0, ({"content": "blueprint"},))
+    assert _drain(scheduler) == [1]
+
+def test_scheduler_does_not_resolve_references_to_later_steps():
+    # Step 3 names step 4's output, which a sequential run would not have yet.
+    plan = [
+        {"step": 1, "agent": "Librarian", "input": {"intent_query": "precise legal answer"}},
+        {"step": 2, "agent": "Researcher", "input": {"topic_query": "NDA confidentiality"}},
+        {"step": 3, "agent": "Writer", "input": {"blueprint": "$$STEP_1_OUTPUT$$", "facts": "$$STEP_4_OUTPUT$$"}},
+        {"step": 4, "agent": "Researcher", "input": {"topic_query": "NDA term"}},
+    ]
+    scheduler = StepScheduler(plan, max_concurrency=4)
+    assert _drain(scheduler) == [0, 1, 3]
+    scheduler.complete(3, ({"content": "later facts"},))
+    scheduler.complete(0, ({"content": "blueprint"},))
+    started = list(scheduler.next_ready())
+    assert [position for position, _, _ in started] == [2]
+    assert started[0][2] == {"STEP_1_OUTPUT": "blueprint"}
+
+def test_scheduler_logs_in_plan_order():
+    scheduler = StepScheduler(PLAN, max_concurrency=4)
+    _drain(scheduler)
+    scheduler.complete(1, ({"content": "facts"},))
+    assert list(scheduler.loggable()) == []
+    scheduler.complete(0, ({"content": "blueprint"},))
+    assert [step["step"] for step, _ in scheduler.loggable()] == [1, 2]
+
+def test_scheduler_starts_nothing_after_a_failure():
+    scheduler = StepScheduler(_failing_plan("Librarian"), max_concurrency=4)
+    assert _drain(scheduler) == [0, 1, 2]
+    scheduler.fail(1, ValueError("boom"))
+    scheduler.complete(0, ({"content": "blueprint"},))
+    scheduler.complete(2, ({"content": "facts"},))
+    assert _drain(scheduler) == []
+    assert not scheduler.has_work()
+    assert [step["step"] for step, _ in scheduler.loggable()] == [1]
+
+def test_context_engine_is_sequential_unless_callers_opt_in():
+    assert inspect.signature(context_engine).parameters["max_concurrency"].default == 1
+
+def test_parallel_run_matches_sequential_run(pc, config):
+    goal = "Explain the NDA"
+    outputs = []
+    for max_concurrency in (1, 4):
+        client = FakeOpenAI({goal: PLAN}, profile="zero")
+        result, trace = context_engine(goal, client=client, pc=pc, max_concurrency=max_concurrency, **config)
+        assert trace.status == "Success"
+        outputs.append((result, [step["step"] for step in trace.steps]))
+    assert outputs[0] == outputs[1]
+    assert outputs[0][1] == [1, 2, 3]
+
+def test_failure_stops_later_independent_steps(pc, config):
+    goal = "Explain the NDA"
+    chat_calls = {}
+    for max_concurrency in (1, 4):
+        client = FakeOpenAI({goal: _failing_plan("Bogus")}, profile="zero")
+        result, trace = context_engine(goal, client=client, pc=pc, max_concurrency=max_concurrency, **config)
+        assert result is None
+        assert trace.status == "Failed at Step 2"
+        assert [step["step"] for step in trace.steps] == [1]
+        chat_calls[max_concurrency] = client.latency.calls.get("chat", 0)
+    # The Researcher at step 3 never ran, so the parallel run spent no extra LLM calls.
+    assert chat_calls[4] == chat_calls[1]
@@ -0,0 +1,81 @@
+import threading
+import time
+import types
+
+from helpers import SingleFlight, _embedding_flight_key, _llm_flight_key, call_llm_robust, set_single_flight
+
+class ScriptedClient:
+    """Chat client that answers every request with 'text', streamed as the given deltas."""
+    def __init__(self, text, deltas, delay=0.0):
+        self.calls = 0
+        self._lock = threading.Lock()
+
+        def create(stream=False, **kwargs):
+            with self._lock:
+                self.calls += 1
+            time.sleep(delay)
+            if stream:
+                return iter([types.SimpleNamespace(choices=[types.SimpleNamespace(delta=types.SimpleNamespace(content=d))])
+                             for d in deltas])
+            return types.SimpleNamespace(usage=None, choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=text))])
+
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=create))
+
+def test_single_flight_runs_concurrent_calls_once():
+    flight = SingleFlight()
+    calls = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def work(value):
+        calls.append(value)
+        started.set()
+        release.wait()
+        return value * 2
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("k", work, 21)))
+    leader.start()
+    started.wait()
+    followers = [threading.Thread(target=lambda: results.append(flight.do("k", work, 21))) for _ in range(4)]
+    for thread in followers:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join()
+    assert calls == [21]
+    assert sorted(results) == [(42, False)] + [(42, True)] * 4
+    # The key is released once the call completes.
+    assert flight.do("k", lambda: "fresh") == ("fresh", False)
+
+def test_flight_keys_separate_clients():
+    first, second = object(), object()
+    assert _llm_flight_key("s", "u", first, "m", False) == _llm_flight_key("s", "u", first, "m", False)
+    assert _llm_flight_key("s", "u", first, "m", False) != _llm_flight_key("s", "u", second, "m", False)
+    assert _embedding_flight_key("a\nb", first, "e") == _embedding_flight_key("a b", first, "e")
+    assert _embedding_flight_key("a b", first, "e") != _embedding_flight_key("a b", second, "e")
+
+def test_concurrent_calls_coalesce_per_client():
+    shared = ScriptedClient("answer", [], delay=0.1)
+    other = ScriptedClient("answer", [], delay=0.1)
+    threads = [threading.Thread(target=call_llm_robust, args=("s", "u", client, "m"))
+               for client in (shared, shared, shared, other)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert (shared.calls, other.calls) == (1, 1)
+
+def test_coalescing_can_be_turned_off():
+    client = ScriptedClient("answer", [], delay=0.1)
+    set_single_flight(False)
+    try:
+        threads = [threading.Thread(target=call_llm_robust, args=("s", "u", client, "m")) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        set_single_flight(True)
+    assert client.calls == 3
@@ -0,0 +1,86 @@
+import threading
+import time
+import types
+
+from cache import ResponseCache
+from engine import context_engine
+from helpers import call_llm_robust, count_tokens, set_rate_limiter
+
+PLAN = [
+    {"step": 1, "agent": "Librarian", "input": {"intent_query": "precise legal answer"}},
+    {"step": 2, "agent": "Researcher", "input": {"topic_query": "NDA confidentiality"}},
+    {"step": 3, "agent": "Writer", "input": {"blueprint": "$$STEP_1_OUTPUT$$", "facts": "$$STEP_2_OUTPUT$$"}},
+]
+
+class ScriptedClient:
+    """Chat client that answers every request with 'text', streamed as the given deltas."""
+    def __init__(self, text, deltas, delay=0.0, usage=None):
+        self.calls = 0
+        self._lock = threading.Lock()
+
+        def create(stream=False, **kwargs):
+            with self._lock:
+                self.calls += 1
+            time.sleep(delay)
+            if stream:
+                chunks = [types.SimpleNamespace(choices=[types.SimpleNamespace(delta=types.SimpleNamespace(content=d))])
+                          for d in deltas]
+                if usage is not None:
+                    chunks.append(types.SimpleNamespace(choices=[], usage=types.SimpleNamespace(total_tokens=usage)))
+                return iter(chunks)
+            return types.SimpleNamespace(usage=None, choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=text))])
+
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=create))
+
+def test_stream_events_arrive_in_plan_order(client, pc, config):
+    client.plans["Explain the NDA"] = PLAN
+    events = list(context_engine("Explain the NDA", client=client, pc=pc, stream=True, **config))
+    kinds = [event["event"] for event in events]
+    assert kinds[0] == "plan" and kinds[-1] == "done"
+    assert [event["step"] for event in events if event["event"] == "step"] == [1, 2, 3]
+    final = events[-1]
+    assert final["status"] == "Success"
+    streamed = "".join(event["delta"] for event in events if event["event"] == "token")
+    assert streamed.strip() == final["output"]
+
+def test_streamed_and_cached_text_are_identical(client):
+    cache = ResponseCache()
+    streamed = "".join(call_llm_robust("system", "user", client=client, generation_model="m", cache=cache, stream=True))
+    cached = "".join(call_llm_robust("system", "user", client=client, generation_model="m", cache=cache, stream=True))
+    plain = call_llm_robust("system", "user", client=client, generation_model="m")
+    assert streamed == cached == plain
+
+def test_streamed_deltas_are_trimmed_like_the_cached_text():
+    client = ScriptedClient("  Hello world  \n", ["", "  ", " Hello", " ", "world", "  ", "\n"])
+    cache = ResponseCache()
+    deltas = list(call_llm_robust("s", "u", client, "m", cache=cache, stream=True))
+    assert "".join(deltas) == "Hello world"
+    assert deltas[0] == "Hello" and deltas[-1] == " world"
+    assert list(call_llm_robust("s", "u", client, "m", cache=cache, stream=True)) == ["Hello world"]
+    assert call_llm_robust("s", "u", client, "m") == "Hello world"
+
+class RecordingLimiter:
+    def __init__(self):
+        self.settled = []
+
+    def acquire(self, model, tokens, lane="default"):
+        return 0.0
+
+    def settle(self, model, delta):
+        self.settled.append(delta)
+
+def _settled_after_stream(client):
+    limiter = RecordingLimiter()
+    set_rate_limiter(limiter)
+    try:
+        list(call_llm_robust("system", "user", client=client, generation_model="m", stream=True))
+    finally:
+        set_rate_limiter(None)
+    return limiter.settled
+
+def test_stream_settles_the_usage_reported_on_its_last_chunk():
+    estimate = count_tokens("system", "m") + count_tokens("user", "m")
+    assert _settled_after_stream(ScriptedClient("", ["some", " text"], usage=100)) == [100 - estimate]
+
+def test_stream_without_reported_usage_settles_the_counted_completion():
+    assert _settled_after_stream(ScriptedClient("", ["some", " text"])) == [count_tokens("some text", "m")]
@@ -0,0 +1,30 @@
+from agents import agent_summarizer
+from benchmark import FakeOpenAI
+from helpers import create_mcp_message
+
+def _request(words, **limits):
+    text = " ".join(f"clause{n % 97} binds the parties." for n in range(words // 4))
+    return create_mcp_message("Engine", {"text_to_summarize": text, "summary_objective": "Key obligations", **limits})
+
+def test_small_inputs_are_summarized_in_one_call():
+    client = FakeOpenAI(profile="zero", completion_words=20)
+    result = agent_summarizer(_request(200), client, "m")
+    assert result["content"]["summary"]
+    assert result["metadata"] == {}
+    assert client.latency.calls["chat"] == 1
+
+def test_large_inputs_are_mapped_then_reduced():
+    client = FakeOpenAI(profile="zero", completion_words=20)
+    result = agent_summarizer(_request(3000, max_input_tokens=500, chunk_tokens=400), client, "m")
+    levels = result["metadata"]["summary_levels"]
+    assert [level["stage"] for level in levels] == ["map", "reduce"]
+    # The reduce level merges every partial summary in one call.
+    assert levels[0]["calls"] > 1 and levels[1]["calls"] == levels[0]["calls"]
+    assert levels[0]["tokens_saved"] > 0
+    assert client.latency.calls["chat"] == levels[0]["calls"] + 1
+
+def test_map_levels_repeat_until_the_partials_fit():
+    client = FakeOpenAI(profile="zero", completion_words=60)
+    result = agent_summarizer(_request(6000, max_input_tokens=300, chunk_tokens=200), client, "m")
+    stages = [level["stage"] for level in result["metadata"]["summary_levels"]]
+    assert stages.count("map") >= 2 and stages[-1] == "reduce"
@@ -0,0 +1,38 @@
+import helpers
+from helpers import count_tokens, get_encoding_for_model
+
+class CountingEncoding:
+    def encode(self, text):
+        return text.split()
+
+def test_encodings_are_resolved_once_per_model(monkeypatch):
+    lookups = []
+
+    def encoding_for_model(model):
+        lookups.append(model)
+        return CountingEncoding()
+
+    monkeypatch.setattr(helpers, "_ENCODINGS", {})
+    monkeypatch.setattr(helpers.tiktoken, "encoding_for_model", encoding_for_model)
+    previous = helpers.set_token_encoding(None)
+    try:
+        assert count_tokens("one two three", model="m") == 3
+        assert count_tokens("four five", model="m") == 2
+        assert get_encoding_for_model("m") is get_encoding_for_model("m")
+    finally:
+        helpers.set_token_encoding(previous)
+    assert lookups == ["m"]
+
+def test_unknown_models_fall_back_to_cl100k_base(monkeypatch):
+    fallback = CountingEncoding()
+
+    def encoding_for_model(model):
+        raise KeyError(model)
+
+    monkeypatch.setattr(helpers, "_ENCODINGS", {"cl100k_base": fallback})
+    monkeypatch.setattr(helpers.tiktoken, "encoding_for_model", encoding_for_model)
+    previous = helpers.set_token_encoding(None)
+    try:
+        assert get_encoding_for_model("custom-model") is fallback
+    finally:
+        helpers.set_token_encoding(previous)
@@ -0,0 +1,77 @@
+import json
+import sqlite3
+
+import pytest
+
+from engine import context_engine, set_trace_sinks
+from trace_sinks import JsonlSink, PayloadStore, RingBufferSink, SQLiteSink
+
+GOAL = "Explain the NDA"
+PLAN = [
+    {"step": 1, "agent": "Librarian", "input": {"intent_query": "precise legal answer"}},
+    {"step": 2, "agent": "Researcher", "input": {"topic_query": "NDA confidentiality"}},
+    {"step": 3, "agent": "Writer", "input": {"blueprint": "$$STEP_1_OUTPUT$$", "facts": "$$STEP_2_OUTPUT$$"}},
+]
+
+@pytest.fixture
+def sinks(tmp_path):
+    ring, jsonl, sqlite = RingBufferSink(), JsonlSink(str(tmp_path / "trace.jsonl")), SQLiteSink(str(tmp_path / "trace.db"))
+    store = PayloadStore(str(tmp_path / "payloads"))
+    set_trace_sinks([ring, jsonl, sqlite], payload_store=store)
+    yield ring, jsonl, sqlite, store
+    set_trace_sinks([])
+    jsonl.close()
+    sqlite.close()
+
+def test_every_sink_receives_the_same_records(sinks, tmp_path, client, pc, config):
+    ring, jsonl, sqlite, store = sinks
+    client.plans[GOAL] = PLAN
+    result, trace = context_engine(GOAL, client=client, pc=pc, **config)
+    assert trace.status == "Success"
+    records = ring.snapshot(trace.trace_id)
+    assert [r["event"] for r in records] == ["plan", "step", "step", "step", "finalize"]
+    assert sqlite.records(trace.trace_id) == json.loads(json.dumps(records))
+    jsonl.close()
+    with open(tmp_path / "trace.jsonl", encoding="utf-8") as f:
+        assert [json.loads(line) for line in f] == json.loads(json.dumps(records))
+    # Outputs too large to inline are recoverable from the payload store by reference.
+    assert store.get(records[-1]["output"]) == result
+
+def test_keep_payloads_false_keeps_only_compact_records(sinks, client, pc, config):
+    store = sinks[3]
+    set_trace_sinks(sinks[:3], payload_store=store, keep_payloads=False)
+    client.plans[GOAL] = PLAN
+    result, trace = context_engine(GOAL, client=client, pc=pc, **config)
+    assert [step["event"] for step in trace.steps] == ["step"] * 3
+    assert "resolved_context" not in trace.steps[0]
+    assert store.get(trace.steps[-1]["output"]) == result
+
+def test_latency_breakdown_attributes_each_step(client, pc, config):
+    client.plans[GOAL] = PLAN
+    _, trace = context_engine(GOAL, client=client, pc=pc, **config)
+    steps = [entry for entry in trace.latency_breakdown() if entry["step"] is not None]
+    assert [entry["agent"] for entry in steps] == ["Librarian", "Researcher", "Writer"]
+    writer = steps[-1]
+    assert "llm" in writer["by_span"]
+    # Self times add up to the step's total.
+    assert sum(writer["by_span"].values()) == pytest.approx(writer["total_ms"], abs=0.01)
+    assert writer["retries"] == 0 and writer["backoff_ms"] == 0.0
+    assert all(step["started"] <= step["finished"] for step in trace.steps)
+
+def test_sqlite_sink_commits_in_batches(tmp_path):
+    path = str(tmp_path / "trace.db")
+    sink = SQLiteSink(path, commit_every=3)
+    reader = sqlite3.connect(path)
+    committed = lambda: reader.execute("SELECT COUNT(*) FROM trace_events").fetchone()[0]
+    for seq in range(2):
+        sink.emit({"event": "step", "trace_id": "t", "seq": seq})
+    assert committed() == 0
+    sink.emit({"event": "step", "trace_id": "t", "seq": 2})
+    assert committed() == 3
+    sink.emit({"event": "finalize", "trace_id": "t", "seq": 3})
+    sink.flush()
+    assert committed() == 4
+    sink.emit({"event": "finalize", "trace_id": "t", "seq": 4})
+    sink.close()
+    assert committed() == 5
+    reader.close()
@@ -0,0 +1,100 @@
+import os
+
+import numpy as np
+import pytest
+
+from vector_store import LocalIndex, LocalVectorClient
+
+DIM = 32
+
+def _clustered(count, seed, centers=40):
+    rng = np.random.default_rng(seed)
+    means = np.random.default_rng(1234).normal(size=(centers, DIM))
+    return (means[rng.integers(0, centers, count)] + 0.3 * rng.normal(size=(count, DIM))).astype(np.float32)
+
+def _vectors(prefix, matrix):
+    return [(f"{prefix}{i}", row.tolist(), {"n": i}) for i, row in enumerate(matrix)]
+
+def test_brute_force_query_ranks_by_cosine():
+    index = LocalIndex("idx")
+    index.upsert([("x", [1.0, 0.0], {"a": 1}), ("y", [0.0, 1.0], {}), ("xy", [1.0, 1.0], {})])
+    response = index.query([1.0, 0.1], top_k=2, include_metadata=True)
+    assert [m.id for m in response.matches] == ["x", "xy"]
+    assert response.matches[0].metadata == {"a": 1}
+
+def test_upsert_overwrites_and_delete_compacts():
+    index = LocalIndex("idx")
+    index.upsert([("a", [1.0, 0.0], {}), ("b", [0.0, 1.0], {}), ("c", [1.0, 1.0], {})])
+    index.upsert([("a", [0.0, 1.0], {"v": 2})])
+    index.delete(ids=["b"])
+    assert index.describe_index_stats().total_vector_count == 2
+    assert index.fetch(["a"]).vectors["a"].metadata == {"v": 2}
+    assert index.query([0.0, 1.0], top_k=1).matches[0].id == "a"
+
+def test_namespaces_are_separate():
+    index = LocalIndex("idx")
+    index.upsert([("a", [1.0, 0.0], {})], namespace="one")
+    index.upsert([("b", [1.0, 0.0], {})], namespace="two")
+    assert [m.id for m in index.query([1.0, 0.0], top_k=5, namespace="two").matches] == ["b"]
+
+def test_persisted_index_reloads_with_the_same_results(tmp_path):
+    index = LocalVectorClient(str(tmp_path)).Index("idx")
+    index.upsert(_vectors("v", _clustered(500, seed=7)))
+    index.upsert(_vectors("late", _clustered(50, seed=8)))
+    index.delete(ids=["v1"])
+    query = _clustered(1, seed=9)[0].tolist()
+    before = [m.id for m in index.query(query, top_k=10).matches]
+
+    reloaded = LocalVectorClient(str(tmp_path)).Index("idx")
+    assert reloaded.describe_index_stats().total_vector_count == 549
+    assert [m.id for m in reloaded.query(query, top_k=10).matches] == before
+    assert reloaded.fetch(["late3"]).vectors["late3"].metadata == {"n": 3}
+
+def test_upserts_append_instead_of_rewriting(tmp_path):
+    index = LocalVectorClient(str(tmp_path)).Index("idx")
+    index.upsert(_vectors("v", _clustered(100, seed=10)))
+    # Grows the matrix to 200 rows, leaving room for the single upserts below.
+    index.upsert([("first", _clustered(1, seed=19)[0].tolist(), {})])
+    namespace = tmp_path / "idx" / "__default__"
+    files = {name: os.stat(namespace / name) for name in ("vectors.npy", "records.json")}
+    for i in range(20):
+        index.upsert([(f"one{i}", _clustered(1, seed=20 + i)[0].tolist(), {})])
+    for name, before in files.items():
+        # Same inode: patched in place (or untouched), never rewritten and renamed over.
+        assert os.stat(namespace / name).st_ino == before.st_ino, name
+    assert os.stat(namespace / "records.json").st_mtime_ns == files["records.json"].st_mtime_ns
+    assert LocalVectorClient(str(tmp_path)).Index("idx").describe_index_stats().total_vector_count == 121
+
+def test_a_torn_log_line_is_ignored(tmp_path):
+    index = LocalVectorClient(str(tmp_path)).Index("idx")
+    index.upsert([("a", [1.0, 0.0, 0.0], {}), ("b", [0.0, 1.0, 0.0], {})])
+    index.upsert([("c", [0.0, 0.0, 1.0], {})])
+    namespace = tmp_path / "idx" / "__default__"
+    log = next(name for name in os.listdir(namespace) if name.endswith(".log"))
+    with open(namespace / log, "a", encoding="utf-8") as f:
+        f.write('{"id": "tor')
+    reloaded = LocalVectorClient(str(tmp_path)).Index("idx")
+    assert reloaded.describe_index_stats().total_vector_count == 3
+    assert reloaded.query([0.0, 0.0, 1.0], top_k=1).matches[0].id == "c"
+
+def test_manual_persistence(tmp_path):
+    index = LocalVectorClient(str(tmp_path), autosave=False).Index("idx")
+    index.upsert([("a", [1.0, 0.0], {})])
+    index.upsert([(f"v{i}", [1.0, i / 10], {}) for i in range(10)])
+    index.persist()
+    reloaded = LocalVectorClient(str(tmp_path)).Index("idx")
+    assert reloaded.describe_index_stats().total_vector_count == 11
+
+def test_a_bad_batch_leaves_the_namespace_untouched(tmp_path):
+    index = LocalVectorClient(str(tmp_path)).Index("idx")
+    index.upsert([("a", [1.0, 0.0, 0.0], {})])
+    with pytest.raises(ValueError, match="dimension"):
+        index.upsert([("b", [1.0, 0.0, 0.0, 0.0], {})])
+    with pytest.raises(ValueError):
+        index.upsert([("c", [1.0, 0.0, 0.0], {}), ("d", [1.0, 0.0], {})])
+    store = index._store("")
+    with pytest.raises(ValueError, match="ids"):
+        store.upsert(["e", "f"], [[1.0, 0.0, 0.0]], [{}, {}])
+    assert (store.ids, store.count) == (["a"], 1)
+    reloaded = LocalVectorClient(str(tmp_path)).Index("idx")
+    assert reloaded.describe_index_stats().total_vector_count == 1